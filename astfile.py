@@ -0,0 +1,204 @@
+"""Compact binary form of the parse tree, so deployed programs can skip parsing.
+
+A file is MAGIC, the format and parser versions, a table of every string used in the tree,
+then the tree itself. Each value starts with a one byte tag; ints are zigzag varints, and
+strings, dict keys and unknown node types are varint indexes into the string table. The
+node types the parser produces get a tag of their own.
+"""
+
+import struct
+from parser import Parser
+
+EXTENSION = '.🔥🦬c'
+MAGIC = b'\xf0\x9f\x94\xa5AST'
+# Bump whenever NODE_TYPES changes, since that renumbers the tags
+FORMAT = 3
+
+FALSE = 0
+TRUE = 1
+INT = 2
+FLOAT = 3
+STRING = 4
+LIST = 5
+DICT = 6
+NODE = 7
+NODE_TYPES = [
+    'add', 'addset', 'and', 'append', 'bool', 'call', 'chan', 'close', 'contains', 'div', 'divset',
+    'equal', 'float', 'func', 'getvar', 'if', 'input', 'insert', 'int', 'join', 'len', 'list', 'loop',
+    'mod', 'modset', 'mul', 'mulset', 'not', 'notequal', 'now', 'or', 'pow', 'powset', 'print', 'range',
+    'receive', 'remove', 'return', 'reverse', 'send', 'setvar', 'sleep', 'spawn', 'string', 'sub',
+    'subscript', 'subset', 'switch', 'timer', 'typeof', 'xor',
+]
+# Known node types are tagged NODE_BASE + their index in NODE_TYPES
+NODE_BASE = 8
+NODE_TAGS = {name: NODE_BASE + i for i, name in enumerate(NODE_TYPES)}
+
+DOUBLE = struct.Struct('<d')
+
+
+class FormatError(Exception):
+    pass
+
+
+def write_varint(out, n):
+    while n > 0x7f:
+        out.append(0x80 | (n & 0x7f))
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def dumps(ast):
+    strings = {}
+    body = bytearray()
+
+    def intern(s):
+        if s not in strings:
+            strings[s] = len(strings)
+        write_varint(body, strings[s])
+
+    def write(value):
+        if value is True:
+            body.append(TRUE)
+        elif value is False:
+            body.append(FALSE)
+        elif type(value) is int:
+            body.append(INT)
+            write_varint(body, value << 1 if value >= 0 else (-value << 1) - 1)
+        elif type(value) is float:
+            body.append(FLOAT)
+            body.extend(DOUBLE.pack(value))
+        elif type(value) is str:
+            body.append(STRING)
+            intern(value)
+        elif type(value) is list:
+            body.append(LIST)
+            write_varint(body, len(value))
+            for item in value:
+                write(item)
+        elif type(value) is dict:
+            kind = value.get('type')
+            if type(kind) is not str:
+                kind = None
+                body.append(DICT)
+            elif kind in NODE_TAGS:
+                body.append(NODE_TAGS[kind])
+            else:
+                body.append(NODE)
+                intern(kind)
+            fields = [(k, v) for k, v in value.items() if k != 'type' or kind is None]
+            write_varint(body, len(fields))
+            for k, v in fields:
+                intern(k)
+                write(v)
+        else:
+            raise TypeError(f'cannot serialize {type(value).__name__}')
+
+    write(ast)
+
+    out = bytearray(MAGIC)
+    write_varint(out, FORMAT)
+    write_varint(out, Parser.version)
+    write_varint(out, len(strings))
+    for s in strings:
+        encoded = s.encode('utf-8')
+        write_varint(out, len(encoded))
+        out.extend(encoded)
+    out.extend(body)
+    return bytes(out)
+
+
+def loads(data):
+    if not data.startswith(MAGIC):
+        raise FormatError('not a compiled 🔥🦬 file')
+    pos = len(MAGIC)
+
+    fmt, pos = read_varint(data, pos)
+    if fmt != FORMAT:
+        raise FormatError(f'unsupported format {fmt}')
+    found, pos = read_varint(data, pos)
+    if found != Parser.version:
+        raise FormatError(f'compiled by parser version {found}, this is version {Parser.version}; recompile it')
+
+    count, pos = read_varint(data, pos)
+    strings = []
+    for _ in range(count):
+        length, pos = read_varint(data, pos)
+        strings.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+
+    def read(pos):
+        tag = data[pos]
+        pos += 1
+
+        if NODE_BASE <= tag < NODE_BASE + len(NODE_TYPES):
+            node = {'type': NODE_TYPES[tag - NODE_BASE]}
+        elif tag == STRING:
+            n, pos = read_varint(data, pos)
+            return strings[n], pos
+        elif tag == INT:
+            n, pos = read_varint(data, pos)
+            return (n >> 1) ^ -(n & 1), pos
+        elif tag == LIST:
+            count, pos = read_varint(data, pos)
+            items = []
+            for _ in range(count):
+                item, pos = read(pos)
+                items.append(item)
+            return items, pos
+        elif tag == TRUE:
+            return True, pos
+        elif tag == FALSE:
+            return False, pos
+        elif tag == FLOAT:
+            return DOUBLE.unpack_from(data, pos)[0], pos + DOUBLE.size
+        elif tag == NODE:
+            n, pos = read_varint(data, pos)
+            node = {'type': strings[n]}
+        elif tag == DICT:
+            node = {}
+        else:
+            raise FormatError(f'bad tag {tag} at {pos - 1}')
+
+        count, pos = read_varint(data, pos)
+        for _ in range(count):
+            n, pos = read_varint(data, pos)
+            node[strings[n]], pos = read(pos)
+        return node, pos
+
+    try:
+        ast, pos = read(pos)
+    except IndexError:
+        raise FormatError('truncated file') from None
+    if pos != len(data):
+        raise FormatError('trailing data')
+    return ast
+
+
+def is_compiled(filename):
+    return filename.endswith(EXTENSION)
+
+
+def compiled_path(filename):
+    return filename + 'c'
+
+
+def dump(ast, filename):
+    with open(filename, 'wb') as fh:
+        fh.write(dumps(ast))
+
+
+def load(filename):
+    with open(filename, 'rb') as fh:
+        return loads(fh.read())
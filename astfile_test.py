@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+
+import astfile
+import glob
+import unittest
+from parser import Parser
+from unittest import mock
+
+class TestAstFile(unittest.TestCase):
+    def test_roundtrip_corpus(self):
+        for filename in glob.glob('tests/*.🔥🦬'):
+            ast = Parser(filename).parse()
+            self.assertEqual(ast, astfile.loads(astfile.dumps(ast)), filename)
+
+    def test_roundtrip_values(self):
+        ast = [
+            {'type': 'print', 'value': -1},
+            {'type': 'print', 'value': 2 ** 100},
+            {'type': 'print', 'value': -0.5},
+            {'type': 'print', 'value': '🔥🦬'},
+            {'type': 'unknown', 'value': [True, False]},
+            {'type': 'call', 'target': {'type': 'getvar', 'name': 'f'}, 'kwargs': {'type': {'type': 'int', 'value': 1}}},
+        ]
+
+        self.assertEqual(ast, astfile.loads(astfile.dumps(ast)))
+
+    def test_strings_are_interned(self):
+        name = 'a_rather_long_variable_name'
+        ast = [{'type': 'getvar', 'name': name}] * 10
+
+        self.assertEqual(1, astfile.dumps(ast).count(name.encode()))
+
+    def test_not_compiled(self):
+        with self.assertRaises(astfile.FormatError):
+            astfile.loads(b'print(1)\n')
+
+    def test_truncated(self):
+        data = astfile.dumps([{'type': 'print', 'value': 1}])
+
+        with self.assertRaises(astfile.FormatError):
+            astfile.loads(data[:-1])
+
+    def test_version_change(self):
+        data = astfile.dumps([])
+
+        with mock.patch('astfile.Parser.version', Parser.version + 1):
+            with self.assertRaises(astfile.FormatError):
+                astfile.loads(data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+
+import argparse
+import io
+import os
+import sys
+import time
+import vectorize
+from interpreter import Interpreter, VirtualClock
+from parser import Parser
+from python_transpiler import PythonTranspiler
+
+BACKENDS = [f'interpreter:{engine}' for engine in Interpreter.engines] + ['python']
+
+
+def parse(source):
+    return Parser.from_string(source).parse()
+
+
+def execute(backend, ast, **options):
+    if backend == 'python':
+        PythonTranspiler().run(ast)
+    else:
+        Interpreter(ast, engine=backend.split(':')[1], **options).run()
+
+
+def measure(backend, ast, repeat, **options):
+    best = None
+    realstdout = sys.stdout
+    try:
+        for _ in range(repeat):
+            sys.stdout = io.StringIO()
+            start = time.perf_counter()
+            execute(backend, ast, **options)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        sys.stdout = realstdout
+    return best
+
+
+def output(backend, ast, **options):
+    realstdout = sys.stdout
+    try:
+        sys.stdout = io.StringIO()
+        execute(backend, ast, **options)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = realstdout
+
+
+def calls(args):
+    # fib(n) makes 2 * fib(n + 1) - 1 calls, and nearly every one of them returns early
+    n = args.n or 20
+    count = 2 * fib(n + 1) - 1
+    ast = parse(f'''fun fib(n)
+    if n == 0 or n == 1
+        return n
+    a = fib(n - 1)
+    b = fib(n - 2)
+    return a + b
+print(fib({n}))
+''')
+
+    for backend in args.backend:
+        elapsed = measure(backend, ast, args.repeat)
+        print(f'calls {backend:20} fib({n}) {elapsed:8.4f}s {elapsed / count * 1e6:8.3f}us/call')
+
+
+def switch(args):
+    # A state machine that steps through all 200 states, dispatched through a switch with one arm per state
+    n = args.n or 20000
+    states = 200
+    arms = ''.join(f'''
+        case state == {i}
+            state = {(i + 37) % states}''' for i in range(states))
+    ast = parse(f'''state = 0
+for i of [0...{n}]
+    switch{arms}
+print(state)
+''')
+
+    for backend in args.backend:
+        elapsed = measure(backend, ast, args.repeat)
+        print(f'switch {backend:20} {n} steps {elapsed:8.4f}s {elapsed / n * 1e6:8.3f}us/step')
+
+
+def vector(args):
+    # Sums that outgrow int64 partway through, so the exact result has to survive the reduction
+    n = args.n or 1000000
+    ast = parse(f'''total = 0
+squares = 0
+for i of [1...{n + 1}]
+    total += i * i % 7 - 3
+    squares += i * i * i
+print(total)
+print(squares)
+''')
+
+    if not vectorize.available():
+        print('vector: numpy is not installed')
+        return
+
+    for backend in args.backend:
+        if backend == 'python':
+            continue
+        if output(backend, ast) != output(backend, ast, vectorize=True):
+            raise AssertionError(f'vectorized {backend} printed something else')
+        plain = measure(backend, ast, args.repeat)
+        vectorized = measure(backend, ast, args.repeat, vectorize=True)
+        print(f'vector {backend:20} {n} iterations {plain:8.4f}s, vectorized {vectorized:8.4f}s {plain / vectorized:8.1f}x')
+
+
+def parallel(args):
+    # fizzbuzz, whose iterations only print, spread over a worker per CPU
+    n = args.n or 200000
+    workers = args.workers or os.cpu_count()
+    ast = parse(f'''for i of [1...{n + 1}]
+    if i % 15 == 0
+        print(-15)
+    elif i % 3 == 0
+        print(-3)
+    elif i % 5 == 0
+        print(-5)
+    else
+        print(i)
+''')
+
+    for backend in args.backend:
+        if backend == 'python':
+            continue
+        if output(backend, ast) != output(backend, ast, workers=workers):
+            raise AssertionError(f'{backend} on {workers} workers printed something else')
+        serial = measure(backend, ast, args.repeat)
+        spread = measure(backend, ast, args.repeat, workers=workers)
+        print(f'parallel {backend:20} {n} iterations {serial:8.4f}s, {workers} workers {spread:8.4f}s {serial / spread:8.2f}x')
+
+
+def pipeline(args):
+    # Values pass from a producer through a stage to the consumer, over channels of each kind
+    n = args.n or 100000
+    backend = 'interpreter:bytecode'
+
+    for label, size in [('unbuffered', 0), ('buffered', 64), ('unbounded', -1)]:
+        ast = parse(f'''fun produce(out)
+    for i of [0...{n}]
+        out.send(i)
+    out.close()
+fun double(src, out)
+    for x of src
+        out.send(x * 2)
+    out.close()
+numbers = chan({size})
+doubled = chan({size})
+spawn produce(numbers)
+spawn double(numbers, doubled)
+total = 0
+for x of doubled
+    total += x
+print(total)
+''')
+
+        if output(backend, ast) != f'{n * (n - 1)}\n':
+            raise AssertionError(f'{label} pipeline printed something else')
+        elapsed = measure(backend, ast, args.repeat)
+        print(f'pipeline {label:20} {n} messages {elapsed:8.4f}s {elapsed / n * 1e6:8.3f}us/message')
+
+
+def timers(args):
+    # A task per timer, all pending at once and due in scrambled order, on a clock that never waits
+    n = args.n or 100000
+    backend = 'interpreter:bytecode'
+    ast = parse(f'''fun wait(ms)
+    sleep(ms)
+    print(now())
+for i of [0...{n}]
+    spawn wait(i * 7919 % {n})
+''')
+
+    if output(backend, ast, clock=VirtualClock()) != ''.join(f'{ms}\n' for ms in range(n)):
+        raise AssertionError('timers fired out of order')
+    # Each run needs a clock of its own, starting at 0
+    best = min(measure(backend, ast, 1, clock=VirtualClock()) for _ in range(args.repeat))
+    print(f'timers {backend:20} {n} timers {best:8.4f}s {best / n * 1e6:8.3f}us/timer')
+
+
+def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+BENCHMARKS = {
+    'calls': calls,
+    'parallel': parallel,
+    'pipeline': pipeline,
+    'switch': switch,
+    'timers': timers,
+    'vector': vector,
+}
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--backend', action='append', choices=BACKENDS, help='Backends to compare (default: all)')
+    ap.add_argument('--repeat', type=int, default=3, help='Report the best of this many runs')
+    ap.add_argument('-n', type=int, help='Problem size (each benchmark has its own default)')
+    ap.add_argument('--workers', type=int, help='Worker processes for the parallel benchmark (default: one per CPU)')
+    ap.add_argument('benchmark', nargs='*', help=f'Benchmarks to run: {", ".join(BENCHMARKS)} (default: all)')
+    args = ap.parse_args()
+    args.backend = args.backend or BACKENDS
+
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            ap.error(f'unknown benchmark {name}')
+
+    for name in args.benchmark or BENCHMARKS:
+        BENCHMARKS[name](args)
@@ -0,0 +1,1132 @@
+"""Compiles the parse tree to bytecode and runs it on a stack machine.
+
+A Code object holds a flat list of instructions, each an opcode followed by one int
+argument, plus the constant pool those arguments index into. Variables live in frame slots
+resolved at compile time, the same way as in the closure engine, and calls between
+compiled funcs push a call frame instead of recursing in Python.
+
+Because a running func is nothing but those registers, a task that has to wait on a channel
+can set them aside in its Task and let another run. Programs that spawn or make channels
+run their tasks cooperatively on an asyncio event loop; all others never start one. A
+task that sleeps waits on a timer channel, and the timers share one event loop callback,
+set for whichever is due first.
+"""
+
+import asyncio
+import bisect
+import sys
+from interpreter import (
+    Bool, Channel, ChannelIterator, Clock, CompiledFunc, Deadlock, Float, Int, InvalidTarget, List, Output,
+    Range, Scope, String, SwitchTable, Timers, UnknownExpressionType, UnknownInstructionType, Variable, FALSE,
+    TRUE, VOID, assigned, plan_loop,
+)
+
+LOAD_CONST = 0
+LOAD_LOCAL = 1
+LOAD_OUTER = 2
+STORE_LOCAL = 3
+POP = 4
+BINARY = 5
+UNARY = 6
+CONVERT = 7
+JUMP = 8
+POP_JUMP_IF_FALSE = 9
+AND_JUMP = 10
+OR_JUMP = 11
+GET_ITER = 12
+FOR_ITER = 13
+CALL = 14
+CALL_KW = 15
+MAKE_FUNC = 16
+RETURN = 17
+RETURN_NONE = 18
+BUILD_LIST = 19
+BUILD_RANGE = 20
+APPEND = 21
+INSERT = 22
+REMOVE = 23
+JOIN = 24
+PRINT = 25
+INPUT = 26
+RAISE = 27
+SWITCH = 28
+RUN_PLAN = 29
+MAKE_CHAN = 30
+SEND = 31
+RECEIVE = 32
+CLOSE = 33
+SPAWN = 34
+SPAWN_KW = 35
+SLEEP = 36
+TIMER = 37
+NOW = 38
+
+OPNAMES = [
+    'LOAD_CONST', 'LOAD_LOCAL', 'LOAD_OUTER', 'STORE_LOCAL', 'POP', 'BINARY', 'UNARY', 'CONVERT',
+    'JUMP', 'POP_JUMP_IF_FALSE', 'AND_JUMP', 'OR_JUMP', 'GET_ITER', 'FOR_ITER', 'CALL', 'CALL_KW',
+    'MAKE_FUNC', 'RETURN', 'RETURN_NONE', 'BUILD_LIST', 'BUILD_RANGE', 'APPEND', 'INSERT', 'REMOVE',
+    'JOIN', 'PRINT', 'INPUT', 'RAISE', 'SWITCH', 'RUN_PLAN', 'MAKE_CHAN', 'SEND', 'RECEIVE', 'CLOSE',
+    'SPAWN', 'SPAWN_KW', 'SLEEP', 'TIMER', 'NOW',
+]
+
+# Opcodes whose argument is a jump target, an index into the constant pool, or an index into one of the tables below
+JUMPS = {JUMP, POP_JUMP_IF_FALSE, AND_JUMP, OR_JUMP, FOR_ITER}
+CONSTS = {LOAD_CONST, LOAD_OUTER, CALL_KW, MAKE_FUNC, RAISE, SWITCH, RUN_PLAN, SPAWN_KW}
+
+BINARY_METHODS = ['add', 'sub', 'mul', 'div', 'mod', 'pow', 'equal', 'xor', 'and_', 'or_', 'subscript', 'contains']
+UNARY_METHODS = ['not_', 'typeof', 'len', 'reverse']
+CONVERSIONS = ['bool', 'int', 'float', 'string']
+
+
+class Code:
+    __slots__ = ('name', 'ops', 'consts', 'names', 'lines')
+
+    def __init__(self, name):
+        self.name = name
+        self.ops = []
+        self.consts = []
+        # Variable name of each local slot, for error messages
+        self.names = []
+        # (pc, line, column) wherever the source location changes, in pc order
+        self.lines = []
+
+    def where(self, pc):
+        """The (line, column) of the instruction at pc, either of which may be None."""
+        i = bisect.bisect_right(self.lines, pc, key=lambda entry: entry[0])
+        if i == 0:
+            return None, None
+        return self.lines[i - 1][1:]
+
+
+class FuncSpec:
+    """Everything MAKE_FUNC needs to create a CompiledFunc except the enclosing frame."""
+    __slots__ = ('code', 'args', 'slots', 'size', 'copies')
+
+    def __init__(self, code, args, slots, size, copies):
+        self.code = code
+        self.args = args
+        self.slots = slots
+        self.size = size
+        self.copies = copies
+
+
+class JumpTable:
+    """Operand of SWITCH: where each case of a SwitchTable starts, and where to go when none match."""
+    __slots__ = ('table', 'targets', 'default')
+
+    def __init__(self, table):
+        self.table = table
+        self.targets = []
+        self.default = 0
+
+
+class PlannedLoop:
+    """Operand of RUN_PLAN: a LoopPlan for the loop that follows, and where that loop ends."""
+    __slots__ = ('plan', 'reads', 'writes', 'end')
+
+    def __init__(self, plan, reads, writes):
+        self.plan = plan
+        self.reads = reads
+        self.writes = writes
+        self.end = 0
+
+
+class Task:
+    """The registers of one running task, kept here while it waits or has not started."""
+    __slots__ = ('code', 'pc', 'stack', 'frame', 'calls', 'result', 'wake')
+
+    def __init__(self, code, frame):
+        self.code = code
+        self.pc = 0
+        self.stack = []
+        self.frame = frame
+        # Saved (code, pc, stack, frame) of each caller whose callee is running
+        self.calls = []
+        self.result = None
+        # (opcode, argument) of the instruction the task is waiting in
+        self.wake = None
+
+
+class Waiter(asyncio.Future):
+    """The future a task waits on, which counts itself out of the VM's blocked tasks as soon as it settles.
+
+    Its callbacks only run later, after whatever the event loop has queued already, so a
+    deadlock check that ran in between would otherwise take a task that can go on for one
+    still waiting, or have to look at every waiter to tell.
+    """
+
+    def __init__(self, vm):
+        super().__init__(loop=vm._loop)
+        self._vm = vm
+
+    def set_result(self, result):
+        super().set_result(result)
+        self._vm._blocked -= 1
+
+    def set_exception(self, exception):
+        super().set_exception(exception)
+        self._vm._blocked -= 1
+
+
+class Compiler:
+    def __init__(self, vectorize=False, pool=None):
+        self._vectorize = vectorize
+        self._pool = pool
+        # Set once anything is compiled that needs the event loop
+        self.tasks = False
+        self._exprTypes = {
+            'add': self._add,
+            'and': self._and,
+            'bool': self._bool,
+            'call': self._call,
+            'chan': self._chan,
+            'contains': self._contains,
+            'div': self._div,
+            'equal': self._equal,
+            'float': self._float,
+            'func': self._func,
+            'getvar': self._getvar,
+            'int': self._int,
+            'input': self._input,
+            'join': self._join,
+            'len': self._len,
+            'list': self._list,
+            'mod': self._mod,
+            'mul': self._mul,
+            'not': self._not,
+            'notequal': self._notequal,
+            'now': self._now,
+            'or': self._or,
+            'pow': self._pow,
+            'range': self._range,
+            'receive': self._receive,
+            'reverse': self._reverse,
+            'sleep': self._sleep,
+            'string': self._string,
+            'sub': self._sub,
+            'subscript': self._subscript,
+            'timer': self._timer,
+            'typeof': self._typeof,
+            'xor': self._xor,
+        }
+
+        self._instrTypes = {
+            'addset': self._addset,
+            'append': self._append,
+            'close': self._close,
+            'divset': self._divset,
+            'if': self._if,
+            'insert': self._insert,
+            'loop': self._loop,
+            'modset': self._modset,
+            'mulset': self._mulset,
+            'powset': self._powset,
+            'print': self._print,
+            'remove': self._remove,
+            'return': self._return,
+            'send': self._send,
+            'setvar': self._setvar,
+            'spawn': self._spawn,
+            'subset': self._subset,
+            'switch': self._switch,
+        }
+
+        self._scope = None
+        self._code = None
+        self._keys = None
+        # Source location of the node being compiled, recorded in Code.lines as it is emitted
+        self._where = (None, None)
+
+    def compile(self, instrs, names=()):
+        scope = Scope()
+        for name in names:
+            scope.declare(name)
+        for name in assigned(instrs):
+            scope.declare(name)
+
+        code = self._unit('<module>', scope, lambda: self.compile_block(instrs))
+        return code, scope
+
+    def compile_expr_code(self, expr, names=()):
+        scope = Scope()
+        for name in names:
+            scope.declare(name)
+
+        def body():
+            self.compile_expr(expr)
+            self.emit(RETURN)
+
+        return self._unit('<expr>', scope, body), scope
+
+    def _unit(self, name, scope, body):
+        # Compiles body into a fresh Code object for scope and returns it
+        saved = self._scope, self._code, self._keys
+        self._scope = scope
+        self._code = Code(name)
+        self._keys = {}
+
+        body()
+        self.emit(RETURN_NONE)
+
+        code = self._code
+        code.names = [None] * (len(scope.slots) + 1)
+        for var, index in scope.slots.items():
+            code.names[index] = var
+
+        self._scope, self._code, self._keys = saved
+        return code
+
+    def emit(self, op, arg=0):
+        lines = self._code.lines
+        if (not lines or lines[-1][1:] != self._where) and self._where != (None, None):
+            lines.append((len(self._code.ops), *self._where))
+        self._code.ops.append(op)
+        self._code.ops.append(arg)
+        return len(self._code.ops) - 2
+
+    def _locate(self, node):
+        # Makes node the source of what is emitted next, and returns the location to restore after it
+        where = self._where
+        if 'line' in node:
+            self._where = (node['line'], node.get('column'))
+        elif 'column' in node:
+            self._where = (where[0], node['column'])
+        return where
+
+    def here(self):
+        return len(self._code.ops)
+
+    def patch(self, at, target=None):
+        self._code.ops[at + 1] = self.here() if target is None else target
+
+    def const(self, value):
+        # Values are immutable, so equal constants can share a single pool entry
+        if isinstance(value, Variable) and hasattr(value, 'val'):
+            key = (type(value), repr(value.val))
+        else:
+            key = id(value)
+        if key not in self._keys:
+            self._keys[key] = len(self._code.consts)
+            self._code.consts.append(value)
+        return self._keys[key]
+
+    def compile_block(self, instrs):
+        for instr in instrs:
+            self.compile_instr(instr)
+
+    def compile_instr(self, instr):
+        where = self._locate(instr)
+        if instr['type'] in self._instrTypes:
+            self._instrTypes[instr['type']](instr)
+        elif instr['type'] in self._exprTypes:
+            self._exprTypes[instr['type']](instr)
+            self.emit(POP)
+        else:
+            self.emit(RAISE, self.const((UnknownInstructionType, instr['type'])))
+        self._where = where
+
+    def compile_expr(self, expr):
+        if type(expr) is int:
+            self.emit(LOAD_CONST, self.const(Int(expr)))
+        elif type(expr) is float:
+            self.emit(LOAD_CONST, self.const(Float(expr)))
+        elif type(expr) is bool:
+            self.emit(LOAD_CONST, self.const(Bool(expr)))
+        elif type(expr) is str:
+            self.emit(LOAD_CONST, self.const(String(expr)))
+        elif expr['type'] not in self._exprTypes:
+            self.emit(RAISE, self.const((UnknownExpressionType, expr['type'])))
+        else:
+            where = self._locate(expr)
+            self._exprTypes[expr['type']](expr)
+            self._where = where
+
+    def _binary(self, expr, method):
+        self.compile_expr(expr['value1'])
+        self.compile_expr(expr['value2'])
+        self.emit(BINARY, BINARY_METHODS.index(method))
+
+    def _unary(self, value, method):
+        self.compile_expr(value)
+        self.emit(UNARY, UNARY_METHODS.index(method))
+
+    def _convert(self, expr, kind, conversion):
+        # Parser literals carry a plain Python value that can go straight into the constant pool
+        self.compile_expr(expr['value'])
+        if type(expr['value']) is not kind:
+            self.emit(CONVERT, CONVERSIONS.index(conversion))
+
+    def _opset(self, instr, method):
+        if instr['target']['type'] != 'getvar':
+            self.emit(RAISE, self.const((InvalidTarget, instr['target']['type'])))
+            return
+
+        self.compile_expr(instr['target'])
+        slot = self._scope.declare(instr['target']['name'])
+        self.compile_expr(instr['value'])
+        self.emit(BINARY, BINARY_METHODS.index(method))
+        self.emit(STORE_LOCAL, slot)
+
+    def _addset(self, instr):
+        self._opset(instr, 'add')
+
+    def _append(self, instr):
+        self.compile_expr(instr['target'])
+        self.compile_expr(instr['value'])
+        self.emit(APPEND)
+
+    def _close(self, instr):
+        self.compile_expr(instr['target'])
+        self.emit(CLOSE)
+
+    def _divset(self, instr):
+        self._opset(instr, 'div')
+
+    def _if(self, instr):
+        self.compile_expr(instr['cond'])
+        skip = self.emit(POP_JUMP_IF_FALSE)
+        self.compile_block(instr['code'])
+
+        if 'else' in instr:
+            end = self.emit(JUMP)
+            self.patch(skip)
+            self.compile_block(instr['else'])
+            self.patch(end)
+        else:
+            self.patch(skip)
+
+    def _insert(self, instr):
+        self.compile_expr(instr['target'])
+        self.compile_expr(instr['index'])
+        self.compile_expr(instr['value'])
+        self.emit(INSERT)
+
+    def _loop(self, instr):
+        # RUN_PLAN skips the loop when its plan ran it, and falls into it otherwise
+        planned = None
+        if self._vectorize or self._pool is not None:
+            plan = plan_loop(instr, self._vectorize, self._pool)
+            if plan is not None:
+                planned = PlannedLoop(plan, *plan.slots(self._scope))
+                self.emit(RUN_PLAN, self.const(planned))
+
+        self.compile_expr(instr['list'])
+        slot = self._scope.declare(instr['var'])
+        self.emit(GET_ITER)
+        top = self.emit(FOR_ITER)
+        self.emit(STORE_LOCAL, slot)
+        self.compile_block(instr['code'])
+        self.emit(JUMP, top)
+        self.patch(top)
+
+        if planned is not None:
+            planned.end = self.here()
+
+    def _modset(self, instr):
+        self._opset(instr, 'mod')
+
+    def _mulset(self, instr):
+        self._opset(instr, 'mul')
+
+    def _powset(self, instr):
+        self._opset(instr, 'pow')
+
+    def _print(self, instr):
+        self.compile_expr(instr['value'])
+        self.emit(PRINT)
+
+    def _remove(self, instr):
+        self.compile_expr(instr['target'])
+        self.compile_expr(instr['index'])
+        self.emit(REMOVE)
+
+    def _return(self, instr):
+        if 'value' in instr:
+            self.compile_expr(instr['value'])
+        else:
+            self.emit(LOAD_CONST, self.const(VOID))
+        self.emit(RETURN)
+
+    def _send(self, instr):
+        self.compile_expr(instr['target'])
+        self.compile_expr(instr['value'])
+        self.emit(SEND)
+
+    def _setvar(self, instr):
+        slot = self._scope.declare(instr['name'])
+        self.compile_expr(instr['value'])
+        self.emit(STORE_LOCAL, slot)
+
+    def _spawn(self, instr):
+        self.tasks = True
+        self._call(instr['call'], SPAWN, SPAWN_KW)
+
+    def _subset(self, instr):
+        self._opset(instr, 'sub')
+
+    def _switch(self, instr):
+        table = SwitchTable.build(instr)
+        if table is not None:
+            self._switch_table(instr, table)
+            return
+
+        # Cases are tested in order and the first true one runs, so each failed test jumps to the next
+        ends = []
+
+        for i, case in enumerate(instr['cases']):
+            self.compile_expr(case['cond'])
+            skip = self.emit(POP_JUMP_IF_FALSE)
+            self.compile_block(case['code'])
+            if i < len(instr['cases']) - 1 or 'default' in instr:
+                ends.append(self.emit(JUMP))
+            self.patch(skip)
+
+        if 'default' in instr:
+            self.compile_block(instr['default'])
+
+        for end in ends:
+            self.patch(end)
+
+    def _switch_table(self, instr, table):
+        jumps = JumpTable(table)
+        ends = []
+
+        self.compile_expr(table.subject)
+        self.emit(SWITCH, self.const(jumps))
+
+        for case in instr['cases']:
+            jumps.targets.append(self.here())
+            self.compile_block(case['code'])
+            ends.append(self.emit(JUMP))
+
+        jumps.default = self.here()
+        if 'default' in instr:
+            self.compile_block(instr['default'])
+
+        for end in ends:
+            self.patch(end)
+
+    def _add(self, expr):
+        self._binary(expr, 'add')
+
+    def _and(self, expr):
+        self.compile_expr(expr['value1'])
+        skip = self.emit(AND_JUMP)
+        self.compile_expr(expr['value2'])
+        self.emit(BINARY, BINARY_METHODS.index('and_'))
+        self.patch(skip)
+
+    def _bool(self, expr):
+        self._convert(expr, bool, 'bool')
+
+    def _call(self, expr, op=CALL, op_kw=CALL_KW):
+        self.compile_expr(expr['target'])
+        args = expr.get('args', [])
+        kwargs = expr.get('kwargs', {})
+
+        for arg in args:
+            self.compile_expr(arg)
+        for value in kwargs.values():
+            self.compile_expr(value)
+
+        if kwargs:
+            self.emit(op_kw, self.const((len(args), tuple(kwargs))))
+        else:
+            self.emit(op, len(args))
+
+    def _chan(self, expr):
+        self.tasks = True
+        if 'size' in expr:
+            self.compile_expr(expr['size'])
+            self.emit(MAKE_CHAN, 1)
+        else:
+            self.emit(MAKE_CHAN, 0)
+
+    def _contains(self, expr):
+        self.compile_expr(expr['target'])
+        self.compile_expr(expr['value'])
+        self.emit(BINARY, BINARY_METHODS.index('contains'))
+
+    def _div(self, expr):
+        self._binary(expr, 'div')
+
+    def _equal(self, expr):
+        self._binary(expr, 'equal')
+
+    def _float(self, expr):
+        if type(expr['value']) is int:
+            self.emit(LOAD_CONST, self.const(Float(float(expr['value']))))
+        else:
+            self._convert(expr, float, 'float')
+
+    def _func(self, expr):
+        parent = self._scope
+        scope = Scope(parent)
+        args = expr['args']
+
+        for arg in args:
+            scope.declare(arg)
+        for name in assigned(expr['code']):
+            scope.declare(name)
+
+        # Same as the closure engine: locals that shadow an outer variable start out with its value
+        copies = []
+        for name, index in scope.slots.items():
+            found = parent.lookup(name)
+            if name not in args and found is not None:
+                copies.append((index, found[0], found[1]))
+
+        code = self._unit('<func>', scope, lambda: self.compile_block(expr['code']))
+        slots = {arg: scope.slots[arg] for arg in args}
+        spec = FuncSpec(code, args, slots, len(scope.slots) + 1, copies)
+        self.emit(MAKE_FUNC, self.const(spec))
+
+    def _getvar(self, expr):
+        name = expr['name']
+        depth, index = self._scope.resolve(name)
+
+        if depth == 0:
+            self.emit(LOAD_LOCAL, index)
+        else:
+            self.emit(LOAD_OUTER, self.const((depth, index, name)))
+
+    def _int(self, expr):
+        self._convert(expr, int, 'int')
+
+    def _input(self, expr):
+        if 'prompt' in expr:
+            self.compile_expr(expr['prompt'])
+            self.emit(INPUT, 1)
+        else:
+            self.emit(INPUT, 0)
+
+    def _join(self, expr):
+        self.compile_expr(expr['target'])
+        self.compile_expr(expr['value'])
+        self.emit(JOIN)
+
+    def _len(self, expr):
+        self._unary(expr['target'], 'len')
+
+    def _list(self, expr):
+        values = expr.get('values', [])
+        for value in values:
+            self.compile_expr(value)
+        self.emit(BUILD_LIST, len(values))
+
+    def _mod(self, expr):
+        self._binary(expr, 'mod')
+
+    def _mul(self, expr):
+        self._binary(expr, 'mul')
+
+    def _not(self, expr):
+        self._unary(expr['value'], 'not_')
+
+    def _notequal(self, expr):
+        self._binary(expr, 'equal')
+        self.emit(UNARY, UNARY_METHODS.index('not_'))
+
+    def _now(self, expr):
+        self.emit(NOW)
+
+    def _or(self, expr):
+        self.compile_expr(expr['value1'])
+        skip = self.emit(OR_JUMP)
+        self.compile_expr(expr['value2'])
+        self.emit(BINARY, BINARY_METHODS.index('or_'))
+        self.patch(skip)
+
+    def _pow(self, expr):
+        self._binary(expr, 'pow')
+
+    def _receive(self, expr):
+        self.compile_expr(expr['target'])
+        self.emit(RECEIVE)
+
+    def _range(self, expr):
+        self.compile_expr(expr['start'])
+        self.compile_expr(expr['end'])
+        if 'step' in expr:
+            self.compile_expr(expr['step'])
+            self.emit(BUILD_RANGE, 3)
+        else:
+            self.emit(BUILD_RANGE, 2)
+
+    def _reverse(self, expr):
+        self._unary(expr['target'], 'reverse')
+
+    def _sleep(self, expr):
+        # Outside tasks there is nothing to hand over to, so this alone does not need the event loop
+        self.compile_expr(expr.get('ms', 0))
+        self.emit(SLEEP)
+
+    def _string(self, expr):
+        self._convert(expr, str, 'string')
+
+    def _sub(self, expr):
+        self._binary(expr, 'sub')
+
+    def _subscript(self, expr):
+        self.compile_expr(expr['target'])
+        self.compile_expr(expr['index'])
+        self.emit(BINARY, BINARY_METHODS.index('subscript'))
+
+    def _timer(self, expr):
+        self.tasks = True
+        self.compile_expr(expr.get('ms', 0))
+        self.emit(TIMER)
+
+    def _typeof(self, expr):
+        self._unary(expr['value'], 'typeof')
+
+    def _xor(self, expr):
+        self._binary(expr, 'xor')
+
+
+CONVERTERS = [
+    lambda v: Bool(bool(v.val)),
+    lambda v: Int(int(v.val)),
+    lambda v: Float(float(v.val)),
+    lambda v: String(str(v.val)),
+]
+
+
+class VM:
+    def __init__(self, output=None, vectorize=False, pool=None, clock=None):
+        self._output = Output() if output is None else output
+        self._vectorize = vectorize
+        self._pool = pool
+        self._clock = Clock() if clock is None else clock
+        self._tasks = False
+        # While tasks run: the event loop, a future that settles when they are all done,
+        # how many have not finished, and how many of those wait on a future not yet settled
+        self._loop = None
+        self._done = None
+        self._main = None
+        self._alive = 0
+        self._blocked = 0
+        self._running = set()
+        # Pending timers, and the event loop callback set for the first of them and when it is due
+        self._timers = None
+        self._alarm = None
+        self._alarm_at = None
+
+    def run(self, instrs, vars):
+        compiler = Compiler(self._vectorize, self._pool)
+        code, scope = compiler.compile(instrs, vars)
+        self._tasks = compiler.tasks
+        return self._with_vars(code, scope, vars)
+
+    def evaluate(self, expr, vars):
+        compiler = Compiler(self._vectorize, self._pool)
+        code, scope = compiler.compile_expr_code(expr, vars)
+        self._tasks = compiler.tasks
+        return self._with_vars(code, scope, vars)
+
+    def _with_vars(self, code, scope, vars):
+        # Bridges a name -> value dict, as used by the tree engine, to and from the top-level frame
+        frame = scope.frame()
+
+        for name, value in vars.items():
+            frame[scope.slots[name]] = value
+
+        ret = self.execute(code, frame)
+
+        for name, index in scope.slots.items():
+            if frame[index] is not None:
+                vars[name] = frame[index]
+
+        return ret
+
+    def spans(self, tb):
+        # Each _step frame's code and pc say where it was; pc is already past the instruction that failed
+        while tb is not None:
+            frame = tb.tb_frame
+            if frame.f_code is VM._step.__code__:
+                yield frame.f_locals['code'].where(frame.f_locals['pc'] - 2)
+            tb = tb.tb_next
+
+    def _instrs(self, code, frame):
+        # Func.call hands its code back to whichever engine created it
+        return self.execute(code, frame)
+
+    def execute(self, code, frame):
+        task = Task(code, frame)
+        if self._tasks and self._loop is None:
+            return asyncio.run(self._schedule(task))
+
+        if self._step(task) is not None:
+            raise Deadlock('cannot wait on a channel outside a task')
+        return task.result
+
+    async def _schedule(self, main):
+        self._loop = asyncio.get_running_loop()
+        self._done = self._loop.create_future()
+        self._main = main
+        self._alive = 0
+        self._blocked = 0
+        self._timers = Timers(self._clock)
+        try:
+            self._start(main)
+            await self._done
+            return main.result
+        finally:
+            # Timers nobody waits on any more are dropped along with the tasks left behind
+            if self._alarm is not None:
+                self._alarm.cancel()
+                self._alarm = None
+            self._loop = None
+
+    def _start(self, task):
+        self._alive += 1
+        running = self._loop.create_task(self._run(task))
+        # The loop only keeps weak references to its tasks
+        self._running.add(running)
+        running.add_done_callback(self._running.discard)
+
+    async def _run(self, task):
+        try:
+            while True:
+                waiter = self._step(task)
+                if waiter is None:
+                    break
+
+                self._blocked += 1
+                if self._blocked == self._alive:
+                    self._loop.call_soon(self._check_deadlock)
+                result = await waiter
+                self._wake(task, result)
+        except Exception as e:
+            # An error in any task ends the program, as it would without tasks
+            if not self._done.done():
+                self._done.set_exception(e)
+            return
+
+        self._alive -= 1
+        if self._alive == 0:
+            if not self._done.done():
+                self._done.set_result(None)
+        elif self._blocked == self._alive:
+            # The tasks left are all waiting, and this one finishing may have been their last hope
+            self._loop.call_soon(self._check_deadlock)
+
+    def _check_deadlock(self):
+        if self._done.done() or self._blocked != self._alive:
+            return
+        if self._timers:
+            # Only a timer can wake anything now. A real one will ring by itself, a virtual
+            # clock has no reason to wait for it
+            if self._clock.virtual:
+                self._clock.advance(self._timers.next())
+                self._ring()
+            return
+        # Nothing can run again. Tasks still waiting once the program itself is done are
+        # left behind, but if it is waiting too it can never finish
+        if self._main.wake is not None:
+            self._done.set_exception(Deadlock('every task is waiting on a channel'))
+        else:
+            self._done.set_result(None)
+
+    def _arm(self):
+        # Sets the event loop callback for the first timer due, unless one is set for it already
+        when = self._timers.next()
+        if when is None or self._clock.virtual:
+            return
+        if self._alarm is not None:
+            if self._alarm_at <= when:
+                return
+            self._alarm.cancel()
+
+        self._alarm = self._loop.call_later(max(when - self._clock.now(), 0) / 1000, self._ring)
+        self._alarm_at = when
+
+    def _ring(self):
+        if self._alarm is not None:
+            self._alarm.cancel()
+            self._alarm = None
+        self._timers.fire()
+        self._arm()
+        # If the timers that fired had no one waiting on them, every task may still be waiting
+        if self._blocked == self._alive:
+            self._loop.call_soon(self._check_deadlock)
+
+    def _wake(self, task, result):
+        op, arg = task.wake
+        task.wake = None
+
+        if op == RECEIVE:
+            task.stack.append(result[0])
+        elif op == SLEEP:
+            task.stack.append(VOID)
+        elif op == FOR_ITER:
+            value, ok = result
+            if ok:
+                task.stack.append(value)
+            else:
+                task.stack.pop()
+                task.pc = arg
+
+    def _step(self, task):
+        # Runs task until it finishes, and returns None, or has to wait, and returns the future to wait on
+        code = task.code
+        ops = code.ops
+        consts = code.consts
+        stack = task.stack
+        push = stack.append
+        pop = stack.pop
+        pc = task.pc
+        frame = task.frame
+        calls = task.calls
+        write = self._output.write
+
+        while True:
+            op = ops[pc]
+            arg = ops[pc + 1]
+            pc += 2
+
+            if op == LOAD_LOCAL:
+                value = frame[arg]
+                if value is None:
+                    raise KeyError(code.names[arg])
+                push(value)
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == STORE_LOCAL:
+                frame[arg] = pop()
+            elif op == BINARY:
+                b = pop()
+                stack[-1] = getattr(stack[-1], BINARY_METHODS[arg])(b)
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop().val:
+                    pc = arg
+            elif op == FOR_ITER:
+                value = next(stack[-1], None)
+                if value is None:
+                    iterator = stack[-1]
+                    if type(iterator) is ChannelIterator and not iterator.done:
+                        task.code, task.pc, task.frame, task.calls = code, pc, frame, calls
+                        task.stack = stack
+                        task.wake = (FOR_ITER, arg)
+                        return iterator.channel.wait_receive(Waiter(self))
+                    pop()
+                    pc = arg
+                else:
+                    push(value)
+            elif op == JUMP:
+                pc = arg
+            elif op == LOAD_OUTER:
+                depth, index, name = consts[arg]
+                scope = frame
+                for _ in range(depth):
+                    scope = scope[0]
+                value = scope[index]
+                if value is None:
+                    raise KeyError(name)
+                push(value)
+            elif op == CALL or op == CALL_KW:
+                if op == CALL:
+                    argc = arg
+                    kwargs = {}
+                else:
+                    argc, names = consts[arg]
+                    kwargs = dict(zip(names, stack[len(stack) - len(names):]))
+                    del stack[len(stack) - len(names):]
+
+                args = stack[len(stack) - argc:]
+                del stack[len(stack) - argc:]
+                func = pop()
+
+                if type(func) is CompiledFunc and type(func.code) is Code:
+                    calls.append((code, pc, stack, frame))
+                    frame = func.bind(args, kwargs)
+                    code = func.code
+                    ops = code.ops
+                    consts = code.consts
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                else:
+                    ret = func.call(args, kwargs, self, frame)
+                    push(VOID if ret is None else ret)
+            elif op == RETURN or op == RETURN_NONE:
+                ret = pop() if op == RETURN else None
+                if not calls:
+                    task.result = ret
+                    return None
+                code, pc, stack, frame = calls.pop()
+                ops = code.ops
+                consts = code.consts
+                push = stack.append
+                pop = stack.pop
+                push(VOID if ret is None else ret)
+            elif op == GET_ITER:
+                stack[-1] = iter(stack[-1].iterate())
+            elif op == POP:
+                pop()
+            elif op == UNARY:
+                stack[-1] = getattr(stack[-1], UNARY_METHODS[arg])()
+            elif op == AND_JUMP:
+                if not stack[-1].val:
+                    stack[-1] = FALSE
+                    pc = arg
+            elif op == OR_JUMP:
+                if stack[-1].val:
+                    stack[-1] = TRUE
+                    pc = arg
+            elif op == PRINT:
+                write(pop().string())
+            elif op == CONVERT:
+                stack[-1] = CONVERTERS[arg](stack[-1])
+            elif op == MAKE_FUNC:
+                spec = consts[arg]
+                push(CompiledFunc(spec.code, spec.args, spec.slots, spec.size, spec.copies, frame))
+            elif op == BUILD_LIST:
+                if arg:
+                    l = List.of(stack[len(stack) - arg:])
+                    del stack[len(stack) - arg:]
+                else:
+                    l = List()
+                push(l)
+            elif op == BUILD_RANGE:
+                if arg == 3:
+                    step = pop()
+                    end = pop()
+                    stack[-1] = Range(stack[-1], end, step)
+                else:
+                    end = pop()
+                    stack[-1] = Range(stack[-1], end)
+            elif op == APPEND:
+                value = pop()
+                pop().append(value)
+            elif op == INSERT:
+                value = pop()
+                index = pop()
+                pop().insert(index, value)
+            elif op == REMOVE:
+                index = pop()
+                pop().remove(index.val)
+            elif op == JOIN:
+                value = pop()
+                stack[-1] = String(value.val.join(x.val for x in stack[-1].iterate()))
+            elif op == INPUT:
+                prompt = pop().val if arg else ''
+                self._output.flush()
+                push(String(input(prompt)))
+            elif op == SWITCH:
+                jumps = consts[arg]
+                index = jumps.table.lookup(pop())
+                pc = jumps.default if index is None else jumps.targets[index]
+            elif op == RUN_PLAN:
+                planned = consts[arg]
+                if planned.plan.run_frame(frame, planned.reads, planned.writes):
+                    pc = planned.end
+            elif op == SEND:
+                value = pop()
+                channel = pop()
+                if not channel.try_send(value):
+                    task.code, task.pc, task.frame, task.calls = code, pc, frame, calls
+                    task.stack = stack
+                    task.wake = (SEND, arg)
+                    return channel.wait_send(value, Waiter(self))
+            elif op == RECEIVE:
+                received = stack[-1].try_receive()
+                if received is None:
+                    channel = pop()
+                    task.code, task.pc, task.frame, task.calls = code, pc, frame, calls
+                    task.stack = stack
+                    task.wake = (RECEIVE, arg)
+                    return channel.wait_receive(Waiter(self))
+                stack[-1] = received[0]
+            elif op == MAKE_CHAN:
+                push(Channel(pop().val if arg else 0))
+            elif op == CLOSE:
+                pop().close()
+            elif op == SPAWN or op == SPAWN_KW:
+                if op == SPAWN:
+                    argc = arg
+                    kwargs = {}
+                else:
+                    argc, names = consts[arg]
+                    kwargs = dict(zip(names, stack[len(stack) - len(names):]))
+                    del stack[len(stack) - len(names):]
+
+                args = stack[len(stack) - argc:]
+                del stack[len(stack) - argc:]
+                func = pop()
+                if type(func) is not CompiledFunc or type(func.code) is not Code:
+                    raise InvalidTarget(f'cannot spawn {func.typeof().val}')
+                self._start(Task(func.code, func.bind(args, kwargs)))
+            elif op == SLEEP:
+                ms = pop().val
+                if self._loop is None:
+                    self._clock.sleep(ms)
+                    push(VOID)
+                else:
+                    channel = self._timers.add(ms)
+                    self._arm()
+                    task.code, task.pc, task.frame, task.calls = code, pc, frame, calls
+                    task.stack = stack
+                    task.wake = (SLEEP, arg)
+                    return channel.wait_receive(Waiter(self))
+            elif op == TIMER:
+                push(self._timers.add(pop().val))
+                self._arm()
+            elif op == NOW:
+                push(Int(int(self._clock.now())))
+            elif op == RAISE:
+                error, value = consts[arg]
+                raise error(value)
+            else:
+                raise ValueError(f'bad opcode {op}')
+
+
+def _const_repr(value):
+    if isinstance(value, Variable) and hasattr(value, 'val'):
+        return f'{value.typeof().val} {value.string()}'
+    if isinstance(value, FuncSpec):
+        return f'func({", ".join(value.args)})'
+    if isinstance(value, PlannedLoop):
+        return f'{type(value.plan).__module__}, to {value.end} if it ran'
+    if isinstance(value, JumpTable):
+        cases = ', '.join(f'{k!r}: {value.targets[i]}' for k, i in value.table.cases.items())
+        return f'{{{cases}}} else {value.default}'
+    if isinstance(value, tuple) and isinstance(value[0], type):
+        return f'{value[0].__name__}({value[1]!r})'
+    return repr(value)
+
+
+def disassemble(code, file=None):
+    """Prints code and every func defined in it, one instruction per line."""
+    if file is None:
+        file = sys.stdout
+
+    print(f'{code.name}:', file=file)
+    funcs = []
+
+    for pc in range(0, len(code.ops), 2):
+        op = code.ops[pc]
+        arg = code.ops[pc + 1]
+        line = f'{pc:6} {OPNAMES[op]:18} {arg}'
+
+        if op in JUMPS:
+            line += f' (to {arg})'
+        elif op in CONSTS:
+            line += f' ({_const_repr(code.consts[arg])})'
+            if op == MAKE_FUNC:
+                funcs.append(code.consts[arg].code)
+        elif op in (LOAD_LOCAL, STORE_LOCAL):
+            line += f' ({code.names[arg]})'
+        elif op == BINARY:
+            line += f' ({BINARY_METHODS[arg]})'
+        elif op == UNARY:
+            line += f' ({UNARY_METHODS[arg]})'
+        elif op == CONVERT:
+            line += f' ({CONVERSIONS[arg]})'
+
+        print(line, file=file)
+
+    for func in funcs:
+        print(file=file)
+        disassemble(func, file)
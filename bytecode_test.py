@@ -0,0 +1,353 @@
+#!/usr/bin/python3
+
+import bytecode
+import interpreter
+import interpreter_test
+import io
+import unittest
+from testnodes import chan, close, func, getvar, loop, prints, receive, send, span, spawn
+
+class BytecodeShim:
+    def __init__(self):
+        self._vm = bytecode.VM()
+        self._output = self._vm._output
+
+    def _expr(self, expr, vars):
+        return self._vm.evaluate(expr, vars)
+
+    def _instr(self, instr, vars):
+        self._vm.run([instr], vars)
+
+    def _instrs(self, instrs, vars):
+        self._vm.run(instrs, vars)
+
+class TestBytecode(interpreter_test.TestInterpreter):
+    def setUp(self):
+        super().setUp()
+        self._interp = BytecodeShim()
+
+    def test_constant_pool_is_shared(self):
+        # print(7)
+        # print(7)
+
+        code, scope = bytecode.Compiler().compile([
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'int',
+                    'value': 7,
+                },
+            },
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'int',
+                    'value': 7,
+                },
+            },
+        ])
+
+        self.assertEqual(1, len(code.consts))
+
+    def test_deep_recursion(self):
+        # fun count(n)
+        #     if n == 0
+        #         return 0
+        #     return count(n - 1) + 1
+        # print(count(5000))
+
+        count = {
+            'type': 'call',
+            'target': {
+                'type': 'getvar',
+                'name': 'count',
+            },
+            'args': [
+                {
+                    'type': 'sub',
+                    'value1': {
+                        'type': 'getvar',
+                        'name': 'n',
+                    },
+                    'value2': 1,
+                },
+            ],
+        }
+
+        self._interp._instrs([
+            {
+                'type': 'setvar',
+                'name': 'count',
+                'value': {
+                    'type': 'func',
+                    'args': ['n'],
+                    'code': [
+                        {
+                            'type': 'if',
+                            'cond': {
+                                'type': 'equal',
+                                'value1': {
+                                    'type': 'getvar',
+                                    'name': 'n',
+                                },
+                                'value2': 0,
+                            },
+                            'code': [
+                                {
+                                    'type': 'return',
+                                    'value': 0,
+                                },
+                            ],
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'add',
+                                'value1': count,
+                                'value2': 1,
+                            },
+                        },
+                    ],
+                },
+            },
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'call',
+                    'target': {
+                        'type': 'getvar',
+                        'name': 'count',
+                    },
+                    'args': [5000],
+                },
+            },
+        ], {})
+
+        self.assertEqual('5000\n', self.stdout())
+
+class TestTasks(unittest.TestCase):
+    def run_vm(self, ast):
+        stream = io.StringIO()
+        output = interpreter.Output(stream)
+        interpreter.Interpreter(ast, engine='bytecode', output=output).run()
+        return stream.getvalue()
+
+    def test_unbuffered(self):
+        # fun produce(c)
+        #     for i of [0...5]
+        #         c.send(i * i)
+        #     c.close()
+        # c = chan()
+        # spawn produce(c)
+        # for x of c
+        #     print(x)
+
+        ast = [
+            func('produce', ['c'], [
+                loop('i', span(0, 5), [send('c', {'type': 'mul', 'value1': getvar('i'), 'value2': getvar('i')})]),
+                close('c'),
+            ]),
+            chan('c'),
+            spawn('produce', getvar('c')),
+            loop('x', getvar('c'), [prints(getvar('x'))]),
+        ]
+
+        self.assertEqual('0\n1\n4\n9\n16\n', self.run_vm(ast))
+
+    def test_buffered(self):
+        # c = chan(2)
+        # c.send(1)
+        # c.send(2)
+        # print(c.receive() * 10 + c.receive())
+
+        ast = [
+            chan('c', 2),
+            send('c', 1),
+            send('c', 2),
+            prints({
+                'type': 'add',
+                'value1': {'type': 'mul', 'value1': receive('c'), 'value2': 10},
+                'value2': receive('c'),
+            }),
+        ]
+
+        self.assertEqual('12\n', self.run_vm(ast))
+
+    def test_unbounded(self):
+        # c = chan(-1)
+        # for i of [0...1000]
+        #     c.send(i)
+        # c.close()
+        # total = 0
+        # for x of c
+        #     total += x
+        # print(total, c.receive(), typeof(c))
+
+        ast = [
+            chan('c', -1),
+            loop('i', span(0, 1000), [send('c', getvar('i'))]),
+            close('c'),
+            {'type': 'setvar', 'name': 'total', 'value': 0},
+            loop('x', getvar('c'), [{'type': 'addset', 'target': getvar('total'), 'value': getvar('x')}]),
+            prints(getvar('total')),
+            prints({'type': 'typeof', 'value': receive('c')}),
+            prints({'type': 'typeof', 'value': getvar('c')}),
+        ]
+
+        self.assertEqual('499500\nvoid\nchan\n', self.run_vm(ast))
+
+    def test_many_tasks(self):
+        # fun square(c, i)
+        #     c.send(i * i)
+        # c = chan()
+        # for i of [0...10000]
+        #     spawn square(c, i)
+        # total = 0
+        # for i of [0...10000]
+        #     total += c.receive()
+        # print(total)
+
+        n = 10000
+        ast = [
+            func('square', ['c', 'i'], [send('c', {'type': 'mul', 'value1': getvar('i'), 'value2': getvar('i')})]),
+            chan('c'),
+            loop('i', span(0, n), [spawn('square', getvar('c'), getvar('i'))]),
+            {'type': 'setvar', 'name': 'total', 'value': 0},
+            loop('i', span(0, n), [{'type': 'addset', 'target': getvar('total'), 'value': receive('c')}]),
+            prints(getvar('total')),
+        ]
+
+        self.assertEqual(f'{sum(i * i for i in range(n))}\n', self.run_vm(ast))
+
+    def test_waiting_tasks_are_left_behind(self):
+        # fun wait(c)
+        #     c.receive()
+        # spawn wait(chan())
+        # print(1)
+
+        ast = [
+            func('wait', ['c'], [receive('c')]),
+            spawn('wait', {'type': 'chan', 'size': 0}),
+            prints(1),
+        ]
+
+        self.assertEqual('1\n', self.run_vm(ast))
+
+    def test_deadlock(self):
+        # c = chan()
+        # c.receive()
+
+        with self.assertRaises(interpreter.Deadlock):
+            self.run_vm([chan('c'), receive('c')])
+
+    def test_send_on_closed(self):
+        # c = chan(-1)
+        # c.close()
+        # c.send(1)
+
+        with self.assertRaises(interpreter.ClosedChannel):
+            self.run_vm([chan('c', -1), close('c'), send('c', 1)])
+
+    def test_error_in_task(self):
+        # fun fail(c)
+        #     c.send(1 / 0)
+        # c = chan()
+        # spawn fail(c)
+        # c.receive()
+
+        ast = [
+            func('fail', ['c'], [send('c', {'type': 'div', 'value1': 1, 'value2': 0})]),
+            chan('c'),
+            spawn('fail', getvar('c')),
+            receive('c'),
+        ]
+
+        with self.assertRaises(ZeroDivisionError):
+            self.run_vm(ast)
+
+    def test_other_engines(self):
+        for engine in ('tree', 'closure'):
+            with self.assertRaises(interpreter.TasksUnsupported):
+                interpreter.Interpreter([chan('c')], engine=engine, output=interpreter.Output(io.StringIO())).run()
+
+class TestDisassemble(unittest.TestCase):
+    def test_disassemble(self):
+        # for i of [0...3]
+        #     print(i)
+
+        code, scope = bytecode.Compiler().compile([
+            {
+                'type': 'loop',
+                'var': 'i',
+                'list': {
+                    'type': 'range',
+                    'start': 0,
+                    'end': 3,
+                },
+                'code': [
+                    {
+                        'type': 'print',
+                        'value': {
+                            'type': 'getvar',
+                            'name': 'i',
+                        },
+                    },
+                ],
+            },
+        ])
+
+        out = io.StringIO()
+        bytecode.disassemble(code, out)
+
+        self.assertEqual('''<module>:
+     0 LOAD_CONST         0 (int 0)
+     2 LOAD_CONST         1 (int 3)
+     4 BUILD_RANGE        2
+     6 GET_ITER           0
+     8 FOR_ITER           18 (to 18)
+    10 STORE_LOCAL        1 (i)
+    12 LOAD_LOCAL         1 (i)
+    14 PRINT              0
+    16 JUMP               8 (to 8)
+    18 RETURN_NONE        0
+''', out.getvalue())
+
+    def test_disassemble_func(self):
+        # f = func(a) { return a }
+
+        code, scope = bytecode.Compiler().compile([
+            {
+                'type': 'setvar',
+                'name': 'f',
+                'value': {
+                    'type': 'func',
+                    'args': ['a'],
+                    'code': [
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'getvar',
+                                'name': 'a',
+                            },
+                        },
+                    ],
+                },
+            },
+        ])
+
+        out = io.StringIO()
+        bytecode.disassemble(code, out)
+
+        self.assertEqual('''<module>:
+     0 MAKE_FUNC          0 (func(a))
+     2 STORE_LOCAL        1 (f)
+     4 RETURN_NONE        0
+
+<func>:
+     0 LOAD_LOCAL         1 (a)
+     2 RETURN             0
+     4 RETURN_NONE        0
+''', out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+import shutil
+from parser import Parser
+
+CACHE_DIR = '__cache__'
+
+
+def cache_dir(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+
+
+def cache_path(filename):
+    return os.path.join(cache_dir(filename), f'{os.path.basename(filename)}.json')
+
+
+def source_hash(source):
+    return hashlib.sha256(source).hexdigest()
+
+
+def load(filename):
+    with open(filename, 'rb') as fh:
+        digest = source_hash(fh.read())
+
+    try:
+        with open(cache_path(filename)) as fh:
+            cached = json.load(fh)
+    except (OSError, ValueError):
+        return None, digest
+
+    if cached.get('version') != Parser.version or cached.get('hash') != digest:
+        return None, digest
+
+    return cached['ast'], digest
+
+
+def store(filename, digest, ast):
+    path = cache_path(filename)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'w') as fh:
+            json.dump({'version': Parser.version, 'hash': digest, 'ast': ast}, fh, separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is only an optimization; read-only trees just reparse every time
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def parse(filename):
+    ast, digest = load(filename)
+    if ast is None:
+        ast = Parser(filename).parse()
+        store(filename, digest, ast)
+    return ast
+
+
+def clear(filename):
+    shutil.rmtree(cache_dir(filename), ignore_errors=True)
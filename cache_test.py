@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+import cache
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._dir.name, 'test.🔥🦬')
+        self.write('print(1)\n')
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write(self, text):
+        with open(self._filename, 'w') as fh:
+            fh.write(text)
+
+    def test_miss_then_hit(self):
+        ast = cache.parse(self._filename)
+        self.assertTrue(os.path.exists(cache.cache_path(self._filename)))
+
+        with mock.patch('cache.Parser.parse') as parse:
+            self.assertEqual(ast, cache.parse(self._filename))
+            parse.assert_not_called()
+
+    def test_source_change(self):
+        cache.parse(self._filename)
+        self.write('print(2)\n')
+
+        ast = cache.parse(self._filename)
+
+        self.assertEqual(2, ast[0]['value']['value'])
+
+    def test_version_change(self):
+        cache.parse(self._filename)
+
+        with mock.patch('cache.Parser.version', -1):
+            ast, _ = cache.load(self._filename)
+
+        self.assertIsNone(ast)
+
+    def test_clear(self):
+        cache.parse(self._filename)
+        cache.clear(self._filename)
+
+        self.assertFalse(os.path.exists(cache.cache_dir(self._filename)))
+
+
+if __name__ == '__main__':
+    unittest.main()
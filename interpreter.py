@@ -1,3 +1,11 @@
+import array
+import collections
+import heapq
+import itertools
+import sys
+import time
+import types
+
 class InvalidArgs(Exception):
     pass
 
@@ -7,11 +15,48 @@ class UnknownExpressionType(Exception):
 class UnknownInstructionType(Exception):
     pass
 
-class FunctionReturn(Exception):
-    def __init__(self, val):
-        self.val = val
+class InvalidTarget(Exception):
+    pass
+
+class ClosedChannel(Exception):
+    pass
+
+class Deadlock(Exception):
+    pass
+
+class TasksUnsupported(Exception):
+    pass
+
+def locate(error, spans, filename=None):
+    """Records on error where in the source it was raised, as error.location and a note.
+
+    spans gives the (line, column) of each node that was being run, outermost first, with
+    None for whatever a hand-built tree leaves out. The line is the innermost statement's,
+    the column that of the innermost expression inside it.
+    """
+    if hasattr(error, 'location'):
+        return
+    line = column = None
+    for span_line, span_column in spans:
+        if span_line is not None:
+            line, column = span_line, span_column
+        elif span_column is not None:
+            column = span_column
+    if line is None:
+        return
+
+    error.location = (filename, line, column)
+    where = f'line {line}' if filename is None else f'{filename}:{line}'
+    if column is not None:
+        where += f':{column}' if filename is not None else f', column {column}'
+    error.add_note(f'at {where}')
+
+# Values are never modified after they are created, which is what makes it safe to
+# share the bool and void singletons, small ints and typeof() strings below
 
 class Variable:
+    __slots__ = ()
+
     def equal(self, other):
         return Bool(self.val == other.val)
 
@@ -19,11 +64,17 @@ class Variable:
         return f'{self.val}'
 
 class Bool(Variable):
-    def __init__(self, val):
-        self.val = bool(val)
+    __slots__ = ('val',)
+
+    def __new__(cls, val):
+        return TRUE if val else FALSE
+
+    def __reduce__(self):
+        # Pickle through __new__, so unpickling finds TRUE and FALSE again
+        return Bool, (self.val,)
 
     def typeof(self):
-        return String('bool')
+        return TYPEOF['bool']
 
     def and_(self, other):
         return Bool(self.val and other.val)
@@ -38,24 +89,65 @@ class Bool(Variable):
         return Bool(self.val != other.val)
 
 class Iterable(Variable):
+    __slots__ = ()
+
     def string(self):
         joined = ','.join(x.string() for x in self.iterate())
         return f'[{joined}]'
 
 class List(Iterable):
+    # val is a Python list of values, or, while every element is an Int or every element is
+    # a Float, an array.array of the raw numbers that are only boxed when they are read
+    __slots__ = ('val',)
+
     def __init__(self):
         self.val = []
 
+    @staticmethod
+    def of(values):
+        l = List()
+        kind = type(values[0]) if values else None
+
+        if kind in TYPECODES and all(type(value) is kind for value in values):
+            try:
+                l.val = array.array(TYPECODES[kind], [value.val for value in values])
+                return l
+            except OverflowError:
+                pass
+
+        l.val = list(values)
+        return l
+
     def typeof(self):
-        return String('list')
+        return TYPEOF['list']
 
     def iterate(self):
-        return self.val
+        if type(self.val) is list:
+            return self.val
+        return map(BOXES[self.val.typecode], self.val)
+
+    def _store(self, value):
+        # Makes val able to hold value and returns the form value is stored in
+        val = self.val
+
+        if type(val) is list:
+            if val or type(value) not in TYPECODES or not packable(TYPECODES[type(value)], value):
+                return value
+            self.val = array.array(TYPECODES[type(value)])
+            return value.val
+
+        if type(value) is BOXES[val.typecode] and packable(val.typecode, value):
+            return value.val
+
+        self.val = list(self.iterate())
+        return value
 
     def append(self, value):
+        value = self._store(value)
         self.val.append(value)
 
     def insert(self, index, value):
+        value = self._store(value)
         self.val.insert(index.val, value)
 
     def len(self):
@@ -65,32 +157,94 @@ class List(Iterable):
         self.val.pop(index)
 
     def subscript(self, index):
-        return self.val[index.val]
+        if isinstance(index, Range):
+            l = List()
+            l.val = self.val[index.slice()]
+            return l
+        if type(self.val) is list:
+            return self.val[index.val]
+        return BOXES[self.val.typecode](self.val[index.val])
+
+    def equal(self, other):
+        if not isinstance(other, List):
+            return FALSE
+        if len(self.val) != len(other.val):
+            return FALSE
+        return Bool(all(x.equal(y).val for x, y in zip(self.iterate(), other.iterate())))
+
+    def contains(self, value):
+        if type(self.val) is not list:
+            # array compares its numbers with ==, just like Variable.equal
+            return Bool(isinstance(value, (Number, Bool)) and value.val in self.val)
+        return Bool(any(x.equal(value).val for x in self.val))
+
+    def reverse(self):
+        l = List()
+        l.val = self.val[::-1]
+        return l
 
 class Range(Iterable):
-    def __init__(self, start, end):
-        self._start = start
-        self._end = end
+    # Backed by a Python range, so len, subscript, contains, slicing and reverse are
+    # all O(1) and the elements are only boxed into Ints as they are visited
+    __slots__ = ('_range',)
+
+    def __init__(self, start, end, step=None):
+        if step is None:
+            self._range = range(start.val, end.val)
+        else:
+            self._range = range(start.val, end.val, step.val)
+
+    @staticmethod
+    def wrap(r):
+        self = object.__new__(Range)
+        self._range = r
+        return self
 
     def typeof(self):
-        return String('range')
+        return TYPEOF['range']
 
     def iterate(self):
-        for i in range(self._start.val, self._end.val):
-            yield Int(i)
+        return map(Int, self._range)
+
+    def len(self):
+        return Int(len(self._range))
+
+    def slice(self):
+        return slice(self._range.start, self._range.stop, self._range.step)
 
     def subscript(self, index):
-        return self._start.add(index)
+        if isinstance(index, Range):
+            return Range.wrap(self._range[index.slice()])
+        return Int(self._range[index.val])
+
+    def contains(self, value):
+        if isinstance(value, Float) and value.val.is_integer():
+            return Bool(int(value.val) in self._range)
+        return Bool(isinstance(value, Int) and value.val in self._range)
+
+    def reverse(self):
+        return Range.wrap(self._range[::-1])
 
 class Number(Variable):
-    pass
+    __slots__ = ()
 
 class Int(Number):
-    def __init__(self, val):
-        self.val = int(val)
+    __slots__ = ('val',)
+
+    def __new__(cls, val):
+        val = int(val)
+        if SMALL_INT_MIN <= val <= SMALL_INT_MAX:
+            return SMALL_INTS[val - SMALL_INT_MIN]
+
+        self = object.__new__(cls)
+        self.val = val
+        return self
+
+    def __reduce__(self):
+        return Int, (self.val,)
 
     def typeof(self):
-        return String('int')
+        return TYPEOF['int']
 
     def add(self, other):
         if isinstance(other, Float):
@@ -135,11 +289,13 @@ class Int(Number):
             return type(self)(self.val - other.val)
 
 class Float(Number):
+    __slots__ = ('val',)
+
     def __init__(self, val):
         self.val = float(val)
 
     def typeof(self):
-        return String('float')
+        return TYPEOF['float']
 
     def add(self, other):
         return type(self)(self.val + float(other.val))
@@ -160,32 +316,47 @@ class Float(Number):
         return type(self)(self.val - float(other.val))
 
 class String(Variable):
+    __slots__ = ('val',)
+
     def __init__(self, val):
         self.val = str(val)
 
     def typeof(self):
-        return String('string')
+        return TYPEOF['string']
 
     def add(self, val):
         return String(self.val + str(val.val))
 
     def subscript(self, index):
+        if isinstance(index, Range):
+            return String(self.val[index.slice()])
         return String(self.val[index.val])
 
+    def contains(self, value):
+        return Bool(isinstance(value, String) and value.val in self.val)
+
+    def reverse(self):
+        return String(self.val[::-1])
+
     def len(self):
         return Int(len(self.val))
 
 class Func(Variable):
-    def __init__(self, code, args):
+    __slots__ = ('code', 'args', 'scope')
+
+    def __init__(self, code, args, scope=None):
         self.code = code
         self.args = args
+        # The variables of the block the func was made in; calls start from a copy of them
+        self.scope = scope
 
     def typeof(self):
-        return String('func')
+        return TYPEOF['func']
 
     def call(self, args, kwargs, ast, vars):
         funcargs = list(self.args)
-        vars = dict(vars)
+        # Variables resolve where the func was defined, not where it is called, as in every engine
+        vars = dict(vars if self.scope is None else self.scope)
 
         for k, v in kwargs.items():
             funcargs.remove(k)
@@ -199,19 +370,431 @@ class Func(Variable):
 
         return ast._instrs(self.code, vars)
 
+class CompiledFunc(Func):
+    __slots__ = ('slots', 'size', 'copies', 'parent')
+
+    def __init__(self, code, args, slots, size, copies, parent):
+        super().__init__(code, args)
+        self.slots = slots
+        self.size = size
+        self.copies = copies
+        self.parent = parent
+
+    def call(self, args, kwargs, ast, vars):
+        return ast._instrs(self.code, self.bind(args, kwargs))
+
+    def bind(self, args, kwargs):
+        frame = [None] * self.size
+        frame[0] = self.parent
+
+        for index, depth, outer in self.copies:
+            scope = self.parent
+            for _ in range(depth):
+                scope = scope[0]
+            frame[index] = scope[outer]
+
+        if kwargs:
+            funcargs = list(self.args)
+
+            for k, v in kwargs.items():
+                funcargs.remove(k)
+                frame[self.slots[k]] = v
+        else:
+            funcargs = self.args
+
+        if len(args) != len(funcargs):
+            raise InvalidArgs(args)
+
+        for i, arg in enumerate(funcargs):
+            frame[self.slots[arg]] = args[i]
+
+        return frame
+
 class Void(Variable):
+    __slots__ = ()
+
+    def __new__(cls):
+        return VOID
+
+    def __reduce__(self):
+        return Void, ()
+
     def typeof(self):
-        return String('void')
+        return TYPEOF['void']
+
+# Storage of List elements that are all Int, or all Float
+TYPECODES = {
+    Int: 'q',
+    Float: 'd',
+}
+BOXES = {typecode: kind for kind, typecode in TYPECODES.items()}
+ARRAY_INT_MIN = -2 ** 63
+ARRAY_INT_MAX = 2 ** 63 - 1
+
+def packable(typecode, value):
+    # Whether the raw number of value fits in an array.array of typecode
+    return typecode == 'd' or ARRAY_INT_MIN <= value.val <= ARRAY_INT_MAX
+
+TRUE = object.__new__(Bool)
+TRUE.val = True
+FALSE = object.__new__(Bool)
+FALSE.val = False
+
+VOID = object.__new__(Void)
+
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 256
+SMALL_INTS = []
+for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1):
+    SMALL_INTS.append(object.__new__(Int))
+    SMALL_INTS[-1].val = i
+
+class Channel(Variable):
+    """Passes values between tasks, in the order they were sent.
+
+    With size 0 a send waits for a receiver to take the value, with a positive size up to
+    that many values wait in the channel, and a negative size never makes a send wait.
+    try_send and try_receive do whatever can be done right away; when they cannot, the
+    task hands a future to wait_send or wait_receive and waits on it, and another task's send,
+    receive or close resolves. Receiving from a closed channel that is empty gives
+    (VOID, False).
+    """
+    __slots__ = ('size', 'closed', '_buffer', '_receivers', '_senders')
+
+    def __init__(self, size=0):
+        self.size = size
+        self.closed = False
+        self._buffer = collections.deque()
+        # Futures of tasks waiting to receive, and (future, value) of tasks waiting to send
+        self._receivers = collections.deque()
+        self._senders = collections.deque()
+
+    def typeof(self):
+        return TYPEOF['chan']
+
+    def equal(self, other):
+        return Bool(self is other)
+
+    def string(self):
+        return f'chan({self.size})'
+
+    def iterate(self):
+        return ChannelIterator(self)
+
+    def try_send(self, value):
+        if self.closed:
+            raise ClosedChannel('send on closed channel')
+
+        while self._receivers:
+            waiter = self._receivers.popleft()
+            if not waiter.done():
+                waiter.set_result((value, True))
+                return True
+
+        if self.size < 0 or len(self._buffer) < self.size:
+            self._buffer.append(value)
+            return True
+        return False
+
+    def try_receive(self):
+        if self._buffer:
+            value = self._buffer.popleft()
+            # That made room for the value of a waiting sender
+            while self._senders:
+                waiter, sent = self._senders.popleft()
+                if not waiter.done():
+                    self._buffer.append(sent)
+                    waiter.set_result(None)
+                    break
+            return value, True
+
+        while self._senders:
+            waiter, sent = self._senders.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return sent, True
+
+        if self.closed:
+            return VOID, False
+        return None
+
+    def wait_send(self, value, waiter):
+        self._senders.append((waiter, value))
+        return waiter
+
+    def wait_receive(self, waiter):
+        self._receivers.append(waiter)
+        return waiter
+
+    def close(self):
+        if self.closed:
+            raise ClosedChannel('close of closed channel')
+        self.closed = True
+
+        for waiter in self._receivers:
+            if not waiter.done():
+                waiter.set_result((VOID, False))
+        for waiter, sent in self._senders:
+            if not waiter.done():
+                waiter.set_exception(ClosedChannel('send on closed channel'))
+        self._receivers.clear()
+        self._senders.clear()
+
+class ChannelIterator:
+    """Iterates over a channel until it is closed; stops early, with done unset, when it would have to wait."""
+    __slots__ = ('channel', 'done')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        received = self.channel.try_receive()
+        if received is None:
+            raise StopIteration
+        value, ok = received
+        if not ok:
+            self.done = True
+            raise StopIteration
+        return value
+
+class Clock:
+    """Milliseconds since the clock was made, and a sleep that waits them out."""
+    virtual = False
+
+    def __init__(self):
+        self._start = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self._start) * 1000
+
+    def sleep(self, ms):
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+class VirtualClock:
+    """A clock for tests, which only moves when the program sleeps and then jumps ahead at once.
+
+    When every task is waiting on a timer, the scheduler moves it straight to the first one
+    due instead of waiting, so timers still fire in order but nothing ever waits for real.
+    """
+    virtual = True
+
+    def __init__(self, start=0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def sleep(self, ms):
+        if ms > 0:
+            self.time += ms
+
+    def advance(self, when):
+        self.time = max(self.time, when)
+
+class Timers:
+    """Channels waiting for a time on a clock, in a min-heap by when they are due.
+
+    Setting a timer and finding the next one due cost O(log n) and O(1) however many are
+    pending. Each timer is a channel with room for one value, which gets the time when the
+    timer fires, so a task waits on it like on any other channel.
+    """
+    __slots__ = ('clock', '_heap', '_order')
+
+    def __init__(self, clock):
+        self.clock = clock
+        # (when, order, channel); order keeps timers due at the same time in the order they were set
+        self._heap = []
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, ms):
+        channel = Channel(1)
+        heapq.heappush(self._heap, (self.clock.now() + max(ms, 0), next(self._order), channel))
+        return channel
+
+    def next(self):
+        # When the first timer is due, or None if there are none
+        return self._heap[0][0] if self._heap else None
+
+    def fire(self):
+        heap = self._heap
+        now = self.clock.now()
+        while heap and heap[0][0] <= now:
+            channel = heapq.heappop(heap)[2]
+            if not channel.closed:
+                channel.try_send(Int(int(now)))
+
+TYPEOF = {name: String(name) for name in ['bool', 'chan', 'float', 'func', 'int', 'list', 'range', 'string', 'void']}
+
+class Output:
+    """Collects printed lines and writes them to the stream in bulk.
+
+    Lines are held until about size characters are pending, then encoded and written to the
+    stream's binary buffer in one call. When the stream is a TTY and tty_line_buffering is
+    set, every line is written right away instead. stream defaults to whatever sys.stdout is
+    at the time of each write, so redirecting sys.stdout still captures the output.
+    """
+
+    DEFAULT_SIZE = 64 * 1024
+
+    def __init__(self, stream=None, size=DEFAULT_SIZE, tty_line_buffering=True):
+        self._stream = stream
+        self._size = size
+        self._tty_line_buffering = tty_line_buffering
+        self._lines = []
+        self._pending = 0
+        self._checked = None
+        self._line_buffered = False
+
+    def stream(self):
+        if self._stream is None:
+            return sys.stdout
+        return self._stream
+
+    def write(self, line):
+        self._lines.append(line)
+        self._pending += len(line) + 1
+
+        if self._pending >= self._size or self._is_line_buffered():
+            self.flush()
+
+    def flush(self):
+        if not self._lines:
+            return
+
+        data = '\n'.join(self._lines) + '\n'
+        self._lines = []
+        self._pending = 0
+
+        stream = self.stream()
+        buffer = getattr(stream, 'buffer', None)
+        if buffer is None:
+            stream.write(data)
+            stream.flush()
+        else:
+            # Anything already written through the text layer has to come out first
+            stream.flush()
+            buffer.write(data.encode(stream.encoding, stream.errors or 'strict'))
+            buffer.flush()
+
+    def _is_line_buffered(self):
+        stream = self.stream()
+        if stream is not self._checked:
+            self._checked = stream
+            self._line_buffered = self._tty_line_buffering and stream.isatty()
+        return self._line_buffered
+
+LITERAL_TYPES = {
+    'bool': bool,
+    'float': float,
+    'int': int,
+    'string': str,
+}
+
+def literal(expr):
+    """The Python value a constant expression evaluates to, or None if expr is not a constant."""
+    if type(expr) in (int, float, bool, str):
+        return expr
+    if type(expr) is dict and expr['type'] in LITERAL_TYPES and type(expr['value']) in (int, float, bool, str):
+        try:
+            return LITERAL_TYPES[expr['type']](expr['value'])
+        except ValueError:
+            return None
+    return None
+
+class SwitchTable:
+    """Finds the case of a switch by hashing, when every case is `subject == constant`.
+
+    Variable.equal compares .val with ==, and a dict lookup on .val matches exactly the same
+    constants, so the first case that would have matched is found without trying the others.
+    """
+
+    MIN_CASES = 3
+
+    def __init__(self, subject, cases):
+        self.subject = subject
+        self.cases = cases
+
+    @staticmethod
+    def build(instr):
+        # Returns None unless every case compares the same variable to a constant
+        if len(instr['cases']) < SwitchTable.MIN_CASES:
+            return None
+
+        subject = None
+        cases = {}
+
+        for i, case in enumerate(instr['cases']):
+            cond = case['cond']
+            if type(cond) is not dict or cond['type'] != 'equal':
+                return None
+
+            var, value = cond['value1'], literal(cond['value2'])
+            if value is None:
+                var, value = cond['value2'], literal(cond['value1'])
+            if value is None or type(var) is not dict or var['type'] != 'getvar':
+                return None
+            if subject is None:
+                subject = var['name']
+            elif var['name'] != subject:
+                return None
+
+            # Like evaluating the cases in order, the first of several equal constants wins
+            cases.setdefault(value, i)
+
+        return SwitchTable({'type': 'getvar', 'name': subject}, cases)
+
+    def lookup(self, value):
+        try:
+            return self.cases.get(value.val)
+        except TypeError:
+            # A list's value is unhashable, and never equal to a constant anyway
+            return None
+
+# Only the bytecode engine keeps the state of a running func where it can set it aside, so
+# it is the one engine that can suspend a task that waits on a channel and run another
+TASKS_ENGINE = 'spawn, chan and timer need the bytecode engine (--engine bytecode)'
 
 class Interpreter:
-    def __init__(self, ast):
+    engines = ['tree', 'closure', 'bytecode']
+
+    def __init__(self, ast, engine='tree', output=None, vectorize=False, workers=1, clock=None, profile=None, filename=None):
+        if engine not in Interpreter.engines:
+            raise ValueError(f'unknown engine {engine}')
+        if profile is not None and engine != 'tree':
+            raise ValueError('profiling runs on the tree engine')
+
         self._ast = ast
+        self._engine = engine
+        # Only used to say where errors happened
+        self._filename = filename
+        self._output = Output() if output is None else output
+        self._clock = Clock() if clock is None else clock
+        # id(switch instruction) -> (instruction, SwitchTable or None); the instruction keeps the id in use
+        self._tables = {}
+        # Likewise id(loop instruction) -> (instruction, LoopPlan or None), when vectorizing or parallelizing
+        self._vectorize = vectorize
+        self._pool = None
+        self._plans = {}
+        if workers > 1:
+            # parallel builds on this module too
+            import parallel
+            self._pool = parallel.Pool(workers, engine, self._output, filename=filename)
 
         self._exprTypes = {
             'add': self._add,
             'and': self._and,
             'bool': self._bool,
             'call': self._call,
+            'chan': self._tasks,
+            'contains': self._contains,
             'div': self._div,
             'equal': self._equal,
             'float': self._float,
@@ -226,12 +809,16 @@ class Interpreter:
             'mul': self._mul,
             'not': self._not,
             'notequal': self._notequal,
+            'now': self._now,
             'or': self._or,
             'pow': self._pow,
             'range': self._range,
+            'reverse': self._reverse,
+            'sleep': self._sleep,
             'string': self._string,
             'sub': self._sub,
             'subscript': self._subscript,
+            'timer': self._tasks,
             'typeof': self._typeof,
             'xor': self._xor,
         }
@@ -250,21 +837,62 @@ class Interpreter:
             'remove': self._remove,
             'return': self._return,
             'setvar': self._setvar,
+            'spawn': self._tasks,
             'subset': self._subset,
             'switch': self._switch,
         }
 
-    def run(self):
-        self._instrs(self._ast, {})
+        if profile is not None:
+            profile.instrument(self)
+
+    def run(self, vars=None):
+        if vars is None:
+            vars = {}
+
+        engine = self
+        try:
+            if self._engine == 'closure':
+                engine = ClosureCompiler(self._output, self._vectorize, self._pool, self._clock)
+                engine.run(self._ast, vars)
+            elif self._engine == 'bytecode':
+                # bytecode builds on the values defined here, so it can only be imported once this module is
+                import bytecode
+                engine = bytecode.VM(self._output, self._vectorize, self._pool, self._clock)
+                engine.run(self._ast, vars)
+            else:
+                self._instrs(self._ast, vars)
+        except Exception as e:
+            # Worked out from the traceback, so running costs nothing extra until something fails
+            locate(e, engine.spans(e.__traceback__), self._filename)
+            raise
+        finally:
+            self._output.flush()
+            if self._pool is not None:
+                self._pool.close()
+
+    def spans(self, tb):
+        # The nodes being run are the instr and expr arguments of this interpreter's frames
+        while tb is not None:
+            local = tb.tb_frame.f_locals
+            if local.get('self') is self:
+                for name in ('instr', 'expr'):
+                    node = local.get(name)
+                    if type(node) is dict:
+                        yield node.get('line'), node.get('column')
+            tb = tb.tb_next
+
+    # Instructions return None, or the value of a return statement so that every
+    # enclosing block stops and hands it up to the call
 
     def _instrs(self, instrs, vars):
         for instr in instrs:
-            self._instr(instr, vars)
+            ret = self._instr(instr, vars)
+            if ret is not None:
+                return ret
 
     def _instr(self, instr, vars):
         if instr['type'] in self._instrTypes:
-            self._instrTypes[instr['type']](instr, vars)
-            return
+            return self._instrTypes[instr['type']](instr, vars)
 
         if instr['type'] in self._exprTypes:
             self._exprTypes[instr['type']](instr, vars)
@@ -275,8 +903,13 @@ class Interpreter:
     def _addset(self, expr, vars):
         target = self._expr(expr['target'], vars)
         value = self._expr(expr['value'], vars)
-        tmp = target.add(value)
-        target.val = tmp.val
+        self._assign(expr['target'], target.add(value), vars)
+
+    def _assign(self, target, value, vars):
+        # Values are immutable, so x += 1 rebinds x rather than changing the number it holds
+        if target['type'] != 'getvar':
+            raise InvalidTarget(target['type'])
+        vars[target['name']] = value
 
     def _append(self, instr, vars):
         target = self._expr(instr['target'], vars)
@@ -286,16 +919,15 @@ class Interpreter:
     def _divset(self, expr, vars):
         target = self._expr(expr['target'], vars)
         value = self._expr(expr['value'], vars)
-        tmp = target.div(value)
-        target.val = tmp.val
+        self._assign(expr['target'], target.div(value), vars)
 
     def _if(self, instr, vars):
         expr = self._expr(instr['cond'], vars)
 
         if expr.val:
-            self._instrs(instr['code'], vars)
+            return self._instrs(instr['code'], vars)
         elif 'else' in instr:
-            self._instrs(instr['else'], vars)
+            return self._instrs(instr['else'], vars)
 
     def _insert(self, instr, vars):
         target = self._expr(instr['target'], vars)
@@ -304,30 +936,40 @@ class Interpreter:
         target.insert(index, value)
 
     def _loop(self, instr, vars):
+        if self._vectorize or self._pool is not None:
+            plan = self._loop_plan(instr)
+            if plan is not None and plan.run(vars):
+                return None
+
         for iter in self._expr(instr['list'], vars).iterate():
             vars[instr['var']] = iter
-            self._instrs(instr['code'], vars)
+            ret = self._instrs(instr['code'], vars)
+            if ret is not None:
+                return ret
+
+    def _loop_plan(self, instr):
+        key = id(instr)
+        if key not in self._plans:
+            self._plans[key] = (instr, plan_loop(instr, self._vectorize, self._pool))
+        return self._plans[key][1]
 
     def _modset(self, expr, vars):
         target = self._expr(expr['target'], vars)
         value = self._expr(expr['value'], vars)
-        tmp = target.mod(value)
-        target.val = tmp.val
+        self._assign(expr['target'], target.mod(value), vars)
 
     def _mulset(self, expr, vars):
         target = self._expr(expr['target'], vars)
         value = self._expr(expr['value'], vars)
-        tmp = target.mul(value)
-        target.val = tmp.val
+        self._assign(expr['target'], target.mul(value), vars)
 
     def _powset(self, expr, vars):
         target = self._expr(expr['target'], vars)
         value = self._expr(expr['value'], vars)
-        tmp = target.pow(value)
-        target.val = tmp.val
+        self._assign(expr['target'], target.pow(value), vars)
 
     def _print(self, instr, vars):
-        print(self._expr(instr['value'], vars).string())
+        self._output.write(self._expr(instr['value'], vars).string())
 
     def _remove(self, instr, vars):
         target = self._expr(instr['target'], vars)
@@ -336,9 +978,9 @@ class Interpreter:
 
     def _return(self, instr, vars):
         if 'value' in instr:
-            raise FunctionReturn(self._expr(instr['value'], vars))
+            return self._expr(instr['value'], vars)
         else:
-            raise FunctionReturn(Void())
+            return Void()
 
     def _setvar(self, instr, vars):
         vars[instr['name']] = self._expr(instr['value'], vars)
@@ -346,19 +988,30 @@ class Interpreter:
     def _subset(self, expr, vars):
         target = self._expr(expr['target'], vars)
         value = self._expr(expr['value'], vars)
-        tmp = target.sub(value)
-        target.val = tmp.val
+        self._assign(expr['target'], target.sub(value), vars)
 
     def _switch(self, instr, vars):
-        for case in instr['cases']:
-            expr = self._expr(case['cond'], vars)
+        table = self._switch_table(instr)
+
+        if table is not None:
+            index = table.lookup(self._expr(table.subject, vars))
+            if index is not None:
+                return self._instrs(instr['cases'][index]['code'], vars)
+        else:
+            for case in instr['cases']:
+                expr = self._expr(case['cond'], vars)
 
-            if expr.val:
-                self._instrs(case['code'], vars)
-                return
+                if expr.val:
+                    return self._instrs(case['code'], vars)
 
         if 'default' in instr:
-            self._instrs(instr['default'], vars)
+            return self._instrs(instr['default'], vars)
+
+    def _switch_table(self, instr):
+        key = id(instr)
+        if key not in self._tables:
+            self._tables[key] = (instr, SwitchTable.build(instr))
+        return self._tables[key][1]
 
     def _expr(self, expr, vars):
         if type(expr) is int:
@@ -382,24 +1035,34 @@ class Interpreter:
 
     def _and(self, expr, vars):
         v1 = self._expr(expr['value1'], vars)
+        if not v1.val:
+            return FALSE
         v2 = self._expr(expr['value2'], vars)
         return v1.and_(v2)
 
     def _bool(self, expr, vars):
         return Bool(bool(self._expr(expr['value'], vars).val))
 
+    def _tasks(self, expr, vars):
+        raise TasksUnsupported(TASKS_ENGINE)
+
     def _call(self, expr, vars):
         target = self._expr(expr['target'], vars)
-        try:
-            target.call(
-                [self._expr(arg, vars) for arg in expr.get('args', [])],
-                {k: self._expr(v, vars) for k, v in expr.get('kwargs', {}).items()},
-                self,
-                vars,
-            )
+        ret = target.call(
+            [self._expr(arg, vars) for arg in expr.get('args', [])],
+            {k: self._expr(v, vars) for k, v in expr.get('kwargs', {}).items()},
+            self,
+            vars,
+        )
+
+        if ret is None:
             return Void()
-        except FunctionReturn as ret:
-            return ret.val
+        return ret
+
+    def _contains(self, expr, vars):
+        target = self._expr(expr['target'], vars)
+        value = self._expr(expr['value'], vars)
+        return target.contains(value)
 
     def _div(self, expr, vars):
         v1 = self._expr(expr['value1'], vars)
@@ -415,7 +1078,7 @@ class Interpreter:
         return Float(float(self._expr(expr['value'], vars).val))
 
     def _func(self, expr, vars):
-        return Func(expr['code'], expr['args'])
+        return Func(expr['code'], expr['args'], vars)
 
     def _getvar(self, expr, vars):
         return vars[expr['name']]
@@ -428,6 +1091,7 @@ class Interpreter:
         if 'prompt' in expr:
             prompt = self._expr(expr['prompt'], vars).val
 
+        self._output.flush()
         return String(input(prompt))
 
     def _join(self, expr, vars):
@@ -467,8 +1131,13 @@ class Interpreter:
         v2 = self._expr(expr['value2'], vars)
         return v1.equal(v2).not_()
 
+    def _now(self, expr, vars):
+        return Int(int(self._clock.now()))
+
     def _or(self, expr, vars):
         v1 = self._expr(expr['value1'], vars)
+        if v1.val:
+            return TRUE
         v2 = self._expr(expr['value2'], vars)
         return v1.or_(v2)
 
@@ -480,8 +1149,19 @@ class Interpreter:
     def _range(self, expr, vars):
         start = self._expr(expr['start'], vars)
         end = self._expr(expr['end'], vars)
+        if 'step' in expr:
+            return Range(start, end, self._expr(expr['step'], vars))
         return Range(start, end)
 
+    def _reverse(self, expr, vars):
+        target = self._expr(expr['target'], vars)
+        return target.reverse()
+
+    def _sleep(self, expr, vars):
+        # With no other task to hand over to, sleeping just waits
+        self._clock.sleep(self._expr(expr.get('ms', 0), vars).val)
+        return VOID
+
     def _string(self, expr, vars):
         return String(str(self._expr(expr['value'], vars).val))
 
@@ -503,3 +1183,776 @@ class Interpreter:
         v1 = self._expr(expr['value1'], vars)
         v2 = self._expr(expr['value2'], vars)
         return v1.xor(v2)
+
+
+def assigned(instrs, names=None):
+    """Names a block binds, not counting the bodies of funcs defined inside it."""
+    if names is None:
+        names = {}
+
+    for instr in instrs:
+        if instr['type'] == 'setvar':
+            names[instr['name']] = True
+        elif instr['type'] in ['addset', 'divset', 'modset', 'mulset', 'powset', 'subset']:
+            if instr['target']['type'] == 'getvar':
+                names[instr['target']['name']] = True
+        elif instr['type'] == 'loop':
+            names[instr['var']] = True
+            assigned(instr['code'], names)
+        elif instr['type'] == 'if':
+            assigned(instr['code'], names)
+            assigned(instr.get('else', []), names)
+        elif instr['type'] == 'switch':
+            for case in instr['cases']:
+                assigned(case['code'], names)
+            assigned(instr.get('default', []), names)
+
+    return list(names)
+
+class Scope:
+    """Maps the variables of one frame to slots; slot 0 of a frame holds the enclosing frame."""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.slots = {}
+
+    def declare(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.slots) + 1
+        return self.slots[name]
+
+    def lookup(self, name):
+        scope = self
+        depth = 0
+        while scope is not None:
+            if name in scope.slots:
+                return depth, scope.slots[name]
+            scope = scope.parent
+            depth += 1
+        return None
+
+    def resolve(self, name):
+        found = self.lookup(name)
+        if found is not None:
+            return found
+
+        # Names nobody binds live in the top-level frame, where the tree engine would look them up too
+        scope = self
+        depth = 0
+        while scope.parent is not None:
+            scope = scope.parent
+            depth += 1
+        return depth, scope.declare(name)
+
+    def frame(self, parent=None):
+        frame = [None] * (len(self.slots) + 1)
+        frame[0] = parent
+        return frame
+
+class LoopPlan:
+    """A faster way to run one loop instruction than visiting its body for every element.
+
+    run(vars) takes a name -> value dict like the tree engine's and returns False, before
+    changing anything, when the loop has to be run the ordinary way after all. names lists
+    every variable run may look up and writes every one it may assign, so that the engines
+    that keep variables in frames can hand them over with slots() and run_frame().
+    """
+
+    names = ()
+    writes = ()
+
+    def run(self, vars):
+        raise NotImplementedError
+
+    def slots(self, scope):
+        reads = [(name,) + scope.resolve(name) for name in self.names]
+        writes = [(name, scope.declare(name)) for name in self.writes]
+        return reads, writes
+
+    def run_frame(self, frame, reads, writes):
+        vars = {}
+        for name, depth, index in reads:
+            f = frame
+            for _ in range(depth):
+                f = f[0]
+            if f[index] is not None:
+                vars[name] = f[index]
+
+        if not self.run(vars):
+            return False
+
+        for name, index in writes:
+            if name in vars:
+                frame[index] = vars[name]
+        return True
+
+def plan_loop(instr, vectorize=False, pool=None):
+    """A LoopPlan for instr from the first of the enabled planners that takes it, or None."""
+    # Both planners build on this module, so they are only imported once it is loaded
+    if vectorize:
+        from vectorize import plan
+        found = plan(instr)
+        if found is not None:
+            return found
+
+    if pool is not None:
+        from parallel import plan
+        return plan(instr, pool)
+
+    return None
+
+def _runs(closure, seen):
+    # Whether a frame whose variables are seen can be running closure: every free variable
+    # of the frame is the object in the matching cell of the closure
+    for name, cell in zip(closure.__code__.co_freevars, closure.__closure__ or ()):
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            contents = seen
+        if seen.get(name, seen) is not contents:
+            return False
+    return True
+
+class ClosureCompiler:
+    """Turns each AST node into a Python closure once, so running it needs no dict dispatch.
+
+    Variables are resolved to frame slots while compiling, so closures index lists instead of
+    hashing names and function calls only set up their own args and locals.
+    """
+
+    def __init__(self, output=None, vectorize=False, pool=None, clock=None):
+        self._output = Output() if output is None else output
+        self._vectorize = vectorize
+        self._pool = pool
+        self._clock = Clock() if clock is None else clock
+        # Compiled closure -> (line, column) of the node it was compiled from
+        self._spans = {}
+        self._exprTypes = {
+            'add': self._add,
+            'and': self._and,
+            'bool': self._bool,
+            'call': self._call,
+            'chan': self._tasks,
+            'contains': self._contains,
+            'div': self._div,
+            'equal': self._equal,
+            'float': self._float,
+            'func': self._func,
+            'getvar': self._getvar,
+            'int': self._int,
+            'input': self._input,
+            'join': self._join,
+            'len': self._len,
+            'list': self._list,
+            'mod': self._mod,
+            'mul': self._mul,
+            'not': self._not,
+            'notequal': self._notequal,
+            'now': self._now,
+            'or': self._or,
+            'pow': self._pow,
+            'range': self._range,
+            'reverse': self._reverse,
+            'sleep': self._sleep,
+            'string': self._string,
+            'sub': self._sub,
+            'subscript': self._subscript,
+            'timer': self._tasks,
+            'typeof': self._typeof,
+            'xor': self._xor,
+        }
+
+        self._instrTypes = {
+            'addset': self._addset,
+            'append': self._append,
+            'divset': self._divset,
+            'if': self._if,
+            'insert': self._insert,
+            'loop': self._loop,
+            'modset': self._modset,
+            'mulset': self._mulset,
+            'powset': self._powset,
+            'print': self._print,
+            'remove': self._remove,
+            'return': self._return,
+            'setvar': self._setvar,
+            'spawn': self._tasks,
+            'subset': self._subset,
+            'switch': self._switch,
+        }
+
+        self._scope = None
+
+    def compile(self, instrs, names=()):
+        self._scope = Scope()
+        for name in names:
+            self._scope.declare(name)
+        for name in assigned(instrs):
+            self._scope.declare(name)
+
+        return self.compile_block(instrs), self._scope
+
+    def run(self, instrs, vars):
+        code, scope = self.compile(instrs, vars)
+        self._with_vars(code, scope, vars)
+
+    def evaluate(self, expr, vars):
+        self._scope = Scope()
+        for name in vars:
+            self._scope.declare(name)
+
+        return self._with_vars(self.compile_expr(expr), self._scope, vars)
+
+    def _with_vars(self, code, scope, vars):
+        # Bridges a name -> value dict, as used by the tree engine, to and from a top-level frame
+        frame = scope.frame()
+
+        for name, value in vars.items():
+            frame[scope.slots[name]] = value
+
+        ret = code(frame)
+
+        for name, index in scope.slots.items():
+            if frame[index] is not None:
+                vars[name] = frame[index]
+
+        return ret
+
+    def compile_block(self, instrs):
+        compiled = [self.compile_instr(instr) for instr in instrs]
+
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def block(frame):
+            for instr in compiled:
+                ret = instr(frame)
+                if ret is not None:
+                    return ret
+
+        return block
+
+    def compile_instr(self, instr):
+        # Like Interpreter._instr, compiled instructions return a value only for return
+        if instr['type'] in self._instrTypes:
+            return self._located(instr, self._instrTypes[instr['type']](instr))
+
+        if instr['type'] in self._exprTypes:
+            expr = self._exprTypes[instr['type']](instr)
+
+            def discard(frame):
+                expr(frame)
+
+            return self._located(instr, discard)
+
+        def unknown(frame):
+            raise UnknownInstructionType(instr['type'])
+
+        return unknown
+
+    def compile_expr(self, expr):
+        if type(expr) is int:
+            return lambda frame: Int(expr)
+        elif type(expr) is float:
+            return lambda frame: Float(expr)
+        elif type(expr) is bool:
+            return lambda frame: Bool(expr)
+        elif type(expr) is str:
+            return lambda frame: String(expr)
+
+        if expr['type'] not in self._exprTypes:
+            def unknown(frame):
+                raise UnknownExpressionType(expr['type'])
+
+            return unknown
+
+        return self._located(expr, self._exprTypes[expr['type']](expr))
+
+    def _located(self, node, compiled):
+        if 'line' in node or 'column' in node:
+            # A return compiles to the closure of its value, which keeps its own column
+            inner = self._spans.get(compiled, (None, None))
+            self._spans[compiled] = (node.get('line'), node.get('column') if inner[1] is None else inner[1])
+        return compiled
+
+    def spans(self, tb):
+        # A closure has no node to look at, but the frame that called it holds it in a
+        # variable. Closures compiled from the same node type share their code, so the one
+        # the next frame runs is the one whose cells hold what that frame sees
+        frames = []
+        while tb is not None:
+            frames.append(tb.tb_frame)
+            tb = tb.tb_next
+
+        for frame, callee in zip(frames, frames[1:]):
+            seen = callee.f_locals
+            for value in frame.f_locals.values():
+                if type(value) is types.FunctionType and value.__code__ is callee.f_code and value in self._spans and _runs(value, seen):
+                    yield self._spans[value]
+                    break
+
+    def _instrs(self, code, frame):
+        # Func.call hands its code back to whichever engine created it
+        return code(frame)
+
+    def _literal(self, expr, kind):
+        # Parser literals carry a plain Python value that needs no conversion at run time
+        if type(expr) is kind:
+            return expr
+        return None
+
+    def _binary(self, expr, method):
+        v1 = self.compile_expr(expr['value1'])
+        v2 = self.compile_expr(expr['value2'])
+
+        def binary(frame):
+            return getattr(v1(frame), method)(v2(frame))
+
+        return binary
+
+    def _opset(self, instr, method):
+        if instr['target']['type'] != 'getvar':
+            def invalid(frame):
+                raise InvalidTarget(instr['target']['type'])
+
+            return invalid
+
+        target = self.compile_expr(instr['target'])
+        slot = self._scope.declare(instr['target']['name'])
+        value = self.compile_expr(instr['value'])
+
+        def opset(frame):
+            t = target(frame)
+            frame[slot] = getattr(t, method)(value(frame))
+
+        return opset
+
+    def _addset(self, instr):
+        return self._opset(instr, 'add')
+
+    def _append(self, instr):
+        target = self.compile_expr(instr['target'])
+        value = self.compile_expr(instr['value'])
+
+        def append(frame):
+            target(frame).append(value(frame))
+
+        return append
+
+    def _divset(self, instr):
+        return self._opset(instr, 'div')
+
+    def _if(self, instr):
+        cond = self.compile_expr(instr['cond'])
+        code = self.compile_block(instr['code'])
+
+        if 'else' not in instr:
+            def if_(frame):
+                if cond(frame).val:
+                    return code(frame)
+
+            return if_
+
+        else_ = self.compile_block(instr['else'])
+
+        def if_else(frame):
+            if cond(frame).val:
+                return code(frame)
+            else:
+                return else_(frame)
+
+        return if_else
+
+    def _insert(self, instr):
+        target = self.compile_expr(instr['target'])
+        index = self.compile_expr(instr['index'])
+        value = self.compile_expr(instr['value'])
+
+        def insert(frame):
+            t = target(frame)
+            i = index(frame)
+            t.insert(i, value(frame))
+
+        return insert
+
+    def _loop(self, instr):
+        iterable = self.compile_expr(instr['list'])
+        slot = self._scope.declare(instr['var'])
+        code = self.compile_block(instr['code'])
+
+        def loop(frame):
+            for iter in iterable(frame).iterate():
+                frame[slot] = iter
+                ret = code(frame)
+                if ret is not None:
+                    return ret
+
+        if self._vectorize or self._pool is not None:
+            plan = plan_loop(instr, self._vectorize, self._pool)
+            if plan is not None:
+                reads, writes = plan.slots(self._scope)
+
+                def vector_loop(frame):
+                    if not plan.run_frame(frame, reads, writes):
+                        return loop(frame)
+
+                return vector_loop
+
+        return loop
+
+    def _modset(self, instr):
+        return self._opset(instr, 'mod')
+
+    def _mulset(self, instr):
+        return self._opset(instr, 'mul')
+
+    def _powset(self, instr):
+        return self._opset(instr, 'pow')
+
+    def _print(self, instr):
+        value = self.compile_expr(instr['value'])
+
+        write = self._output.write
+
+        def print_(frame):
+            write(value(frame).string())
+
+        return print_
+
+    def _remove(self, instr):
+        target = self.compile_expr(instr['target'])
+        index = self.compile_expr(instr['index'])
+
+        def remove(frame):
+            t = target(frame)
+            t.remove(index(frame).val)
+
+        return remove
+
+    def _return(self, instr):
+        if 'value' not in instr:
+            return lambda frame: Void()
+
+        return self.compile_expr(instr['value'])
+
+    def _setvar(self, instr):
+        slot = self._scope.declare(instr['name'])
+        value = self.compile_expr(instr['value'])
+
+        def setvar(frame):
+            frame[slot] = value(frame)
+
+        return setvar
+
+    def _subset(self, instr):
+        return self._opset(instr, 'sub')
+
+    def _switch(self, instr):
+        default = self.compile_block(instr['default']) if 'default' in instr else None
+        table = SwitchTable.build(instr)
+
+        if table is not None:
+            subject = self.compile_expr(table.subject)
+            lookup = table.lookup
+            codes = [self.compile_block(case['code']) for case in instr['cases']]
+
+            def switch_table(frame):
+                index = lookup(subject(frame))
+                if index is not None:
+                    return codes[index](frame)
+
+                if default is not None:
+                    return default(frame)
+
+            return switch_table
+
+        cases = [(self.compile_expr(case['cond']), self.compile_block(case['code'])) for case in instr['cases']]
+
+        def switch(frame):
+            for cond, code in cases:
+                if cond(frame).val:
+                    return code(frame)
+
+            if default is not None:
+                return default(frame)
+
+        return switch
+
+    def _add(self, expr):
+        return self._binary(expr, 'add')
+
+    def _and(self, expr):
+        value1 = self.compile_expr(expr['value1'])
+        value2 = self.compile_expr(expr['value2'])
+
+        def and_(frame):
+            v1 = value1(frame)
+            if not v1.val:
+                return FALSE
+            return v1.and_(value2(frame))
+
+        return and_
+
+    def _bool(self, expr):
+        literal = self._literal(expr['value'], bool)
+        if literal is not None:
+            return lambda frame: Bool(literal)
+
+        value = self.compile_expr(expr['value'])
+        return lambda frame: Bool(bool(value(frame).val))
+
+    def _tasks(self, expr):
+        def tasks(frame):
+            raise TasksUnsupported(TASKS_ENGINE)
+
+        return tasks
+
+    def _call(self, expr):
+        target = self.compile_expr(expr['target'])
+        args = [self.compile_expr(arg) for arg in expr.get('args', [])]
+        kwargs = [(k, self.compile_expr(v)) for k, v in expr.get('kwargs', {}).items()]
+
+        def call(frame):
+            func = target(frame)
+            ret = func.call(
+                [arg(frame) for arg in args],
+                {k: v(frame) for k, v in kwargs},
+                self,
+                frame,
+            )
+
+            if ret is None:
+                return Void()
+            return ret
+
+        return call
+
+    def _contains(self, expr):
+        target = self.compile_expr(expr['target'])
+        value = self.compile_expr(expr['value'])
+
+        def contains(frame):
+            t = target(frame)
+            return t.contains(value(frame))
+
+        return contains
+
+    def _div(self, expr):
+        return self._binary(expr, 'div')
+
+    def _equal(self, expr):
+        return self._binary(expr, 'equal')
+
+    def _float(self, expr):
+        literal = self._literal(expr['value'], float)
+        if literal is not None:
+            return lambda frame: Float(literal)
+
+        value = self.compile_expr(expr['value'])
+        return lambda frame: Float(float(value(frame).val))
+
+    def _func(self, expr):
+        parent = self._scope
+        scope = Scope(parent)
+        args = expr['args']
+
+        for arg in args:
+            scope.declare(arg)
+        for name in assigned(expr['code']):
+            scope.declare(name)
+
+        # Like a tree engine call, which starts from a copy of the variables where the func was
+        # made, locals that shadow an outer variable start out with its value
+        copies = []
+        for name, index in scope.slots.items():
+            found = parent.lookup(name)
+            if name not in args and found is not None:
+                copies.append((index, found[0], found[1]))
+
+        self._scope = scope
+        code = self.compile_block(expr['code'])
+        self._scope = parent
+
+        slots = {arg: scope.slots[arg] for arg in args}
+        size = len(scope.slots) + 1
+        return lambda frame: CompiledFunc(code, args, slots, size, copies, frame)
+
+    def _getvar(self, expr):
+        name = expr['name']
+        depth, index = self._scope.resolve(name)
+
+        if depth == 0:
+            def getvar(frame):
+                value = frame[index]
+                if value is None:
+                    raise KeyError(name)
+                return value
+        elif depth == 1:
+            def getvar(frame):
+                value = frame[0][index]
+                if value is None:
+                    raise KeyError(name)
+                return value
+        else:
+            def getvar(frame):
+                for _ in range(depth):
+                    frame = frame[0]
+                value = frame[index]
+                if value is None:
+                    raise KeyError(name)
+                return value
+
+        return getvar
+
+    def _int(self, expr):
+        literal = self._literal(expr['value'], int)
+        if literal is not None:
+            return lambda frame: Int(literal)
+
+        value = self.compile_expr(expr['value'])
+        return lambda frame: Int(int(value(frame).val))
+
+    def _input(self, expr):
+        flush = self._output.flush
+
+        if 'prompt' not in expr:
+            def input_(frame):
+                flush()
+                return String(input(''))
+
+            return input_
+
+        prompt = self.compile_expr(expr['prompt'])
+
+        def input_prompt(frame):
+            p = prompt(frame).val
+            flush()
+            return String(input(p))
+
+        return input_prompt
+
+    def _join(self, expr):
+        target = self.compile_expr(expr['target'])
+        value = self.compile_expr(expr['value'])
+
+        def join(frame):
+            t = target(frame)
+            v = value(frame)
+            return String(v.val.join(x.val for x in t.iterate()))
+
+        return join
+
+    def _len(self, expr):
+        target = self.compile_expr(expr['target'])
+        return lambda frame: target(frame).len()
+
+    def _list(self, expr):
+        values = [self.compile_expr(value) for value in expr.get('values', [])]
+
+        def list_(frame):
+            l = List()
+            for value in values:
+                l.append(value(frame))
+            return l
+
+        return list_
+
+    def _mod(self, expr):
+        return self._binary(expr, 'mod')
+
+    def _mul(self, expr):
+        return self._binary(expr, 'mul')
+
+    def _not(self, expr):
+        value = self.compile_expr(expr['value'])
+        return lambda frame: value(frame).not_()
+
+    def _notequal(self, expr):
+        v1 = self.compile_expr(expr['value1'])
+        v2 = self.compile_expr(expr['value2'])
+
+        def notequal(frame):
+            return v1(frame).equal(v2(frame)).not_()
+
+        return notequal
+
+    def _now(self, expr):
+        now = self._clock.now
+        return lambda frame: Int(int(now()))
+
+    def _or(self, expr):
+        value1 = self.compile_expr(expr['value1'])
+        value2 = self.compile_expr(expr['value2'])
+
+        def or_(frame):
+            v1 = value1(frame)
+            if v1.val:
+                return TRUE
+            return v1.or_(value2(frame))
+
+        return or_
+
+    def _pow(self, expr):
+        return self._binary(expr, 'pow')
+
+    def _range(self, expr):
+        start = self.compile_expr(expr['start'])
+        end = self.compile_expr(expr['end'])
+
+        if 'step' in expr:
+            step = self.compile_expr(expr['step'])
+
+            def range_step(frame):
+                s = start(frame)
+                e = end(frame)
+                return Range(s, e, step(frame))
+
+            return range_step
+
+        def range_(frame):
+            s = start(frame)
+            return Range(s, end(frame))
+
+        return range_
+
+    def _reverse(self, expr):
+        target = self.compile_expr(expr['target'])
+        return lambda frame: target(frame).reverse()
+
+    def _sleep(self, expr):
+        ms = self.compile_expr(expr.get('ms', 0))
+        sleep = self._clock.sleep
+
+        def sleep_(frame):
+            sleep(ms(frame).val)
+            return VOID
+
+        return sleep_
+
+    def _string(self, expr):
+        literal = self._literal(expr['value'], str)
+        if literal is not None:
+            return lambda frame: String(literal)
+
+        value = self.compile_expr(expr['value'])
+        return lambda frame: String(str(value(frame).val))
+
+    def _sub(self, expr):
+        return self._binary(expr, 'sub')
+
+    def _subscript(self, expr):
+        target = self.compile_expr(expr['target'])
+        index = self.compile_expr(expr['index'])
+
+        def subscript(frame):
+            t = target(frame)
+            return t.subscript(index(frame))
+
+        return subscript
+
+    def _typeof(self, expr):
+        value = self.compile_expr(expr['value'])
+        return lambda frame: value(frame).typeof()
+
+    def _xor(self, expr):
+        return self._binary(expr, 'xor')
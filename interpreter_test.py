@@ -4,6 +4,8 @@ import interpreter
 import io
 import sys
 import unittest
+from parser import Parser
+from testnodes import call, sleep, spawn
 
 class TestInterpreter(unittest.TestCase):
     def setUp(self):
@@ -20,6 +22,7 @@ class TestInterpreter(unittest.TestCase):
         sys.stdin = self._realstdin
 
     def stdout(self):
+        self._interp._output.flush()
         val = self._stdoutbuf.getvalue()
         self._stdoutbuf.truncate()
         self._stdoutbuf.seek(0)
@@ -132,6 +135,118 @@ class TestInterpreter(unittest.TestCase):
 
         self.assertEqual(True, res.val)
 
+    def test_expr_and_short_circuit(self):
+        # func() { print("left") return false }() and func() { print("right") return true }()
+
+        res = self._interp._expr({
+            'type': 'and',
+            'value1': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'left',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': False,
+                            },
+                        },
+                    ],
+                },
+            },
+            'value2': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'right',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': True,
+                            },
+                        },
+                    ],
+                },
+            },
+        }, {})
+
+        self.assertEqual(False, res.val)
+        self.assertEqual('left\n', self.stdout())
+
+    def test_expr_and_evaluates_right(self):
+        # func() { print("left") return true }() and func() { print("right") return false }()
+
+        res = self._interp._expr({
+            'type': 'and',
+            'value1': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'left',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': True,
+                            },
+                        },
+                    ],
+                },
+            },
+            'value2': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'right',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': False,
+                            },
+                        },
+                    ],
+                },
+            },
+        }, {})
+
+        self.assertEqual(False, res.val)
+        self.assertEqual('left\nright\n', self.stdout())
+
     def test_expr_bool(self):
         # true
 
@@ -302,6 +417,72 @@ class TestInterpreter(unittest.TestCase):
 
         self.assertEqual('A\nC\n', self.stdout())
 
+    def test_expr_return_from_loop(self):
+        # func() { for test1 of 0..10 { switch { case test1 == 3 { return test1 } } } return 0 }()
+
+        res = self._interp._expr({
+            'type': 'call',
+            'target': {
+                'type': 'func',
+                'args': [],
+                'code': [
+                    {
+                        'type': 'loop',
+                        'var': 'test1',
+                        'list': {
+                            'type': 'range',
+                            'start': {
+                                'type': 'int',
+                                'value': 0,
+                            },
+                            'end': {
+                                'type': 'int',
+                                'value': 10,
+                            },
+                        },
+                        'code': [
+                            {
+                                'type': 'switch',
+                                'cases': [
+                                    {
+                                        'cond': {
+                                            'type': 'equal',
+                                            'value1': {
+                                                'type': 'getvar',
+                                                'name': 'test1',
+                                            },
+                                            'value2': {
+                                                'type': 'int',
+                                                'value': 3,
+                                            },
+                                        },
+                                        'code': [
+                                            {
+                                                'type': 'return',
+                                                'value': {
+                                                    'type': 'getvar',
+                                                    'name': 'test1',
+                                                },
+                                            },
+                                        ],
+                                    },
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        'type': 'return',
+                        'value': {
+                            'type': 'int',
+                            'value': 0,
+                        },
+                    },
+                ],
+            },
+        }, {})
+
+        self.assertEqual(3, res.val)
+
     def test_expr_func_kwargs(self):
         # func(test1, test2) { return test1 - test2 }(test2=3, 5)
 
@@ -815,6 +996,118 @@ class TestInterpreter(unittest.TestCase):
 
         self.assertEqual(True, res.val)
 
+    def test_expr_or_short_circuit(self):
+        # func() { print("left") return true }() or func() { print("right") return false }()
+
+        res = self._interp._expr({
+            'type': 'or',
+            'value1': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'left',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': True,
+                            },
+                        },
+                    ],
+                },
+            },
+            'value2': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'right',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': False,
+                            },
+                        },
+                    ],
+                },
+            },
+        }, {})
+
+        self.assertEqual(True, res.val)
+        self.assertEqual('left\n', self.stdout())
+
+    def test_expr_or_evaluates_right(self):
+        # func() { print("left") return false }() or func() { print("right") return true }()
+
+        res = self._interp._expr({
+            'type': 'or',
+            'value1': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'left',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': False,
+                            },
+                        },
+                    ],
+                },
+            },
+            'value2': {
+                'type': 'call',
+                'target': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'string',
+                                'value': 'right',
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'bool',
+                                'value': True,
+                            },
+                        },
+                    ],
+                },
+            },
+        }, {})
+
+        self.assertEqual(True, res.val)
+        self.assertEqual('left\nright\n', self.stdout())
+
     def test_expr_pow_int(self):
         # pow(2,4)
 
@@ -985,6 +1278,87 @@ class TestInterpreter(unittest.TestCase):
 
         self.assertEqual(6, vars['test2'].val)
 
+    def test_expr_subscript_range_bounds(self):
+        # [2...10][8]
+
+        with self.assertRaises(IndexError):
+            self._interp._expr({
+                'type': 'subscript',
+                'target': {
+                    'type': 'range',
+                    'start': 2,
+                    'end': 10,
+                },
+                'index': 8,
+            }, {})
+
+    def test_expr_subscript_range_slice(self):
+        # [0...1000000000, 3][10...20]
+
+        sliced = self._interp._expr({
+            'type': 'subscript',
+            'target': {
+                'type': 'range',
+                'start': 0,
+                'end': 1000000000,
+                'step': 3,
+            },
+            'index': {
+                'type': 'range',
+                'start': 10,
+                'end': 20,
+            },
+        }, {})
+
+        self.assertIsInstance(sliced, interpreter.Range)
+        self.assertEqual([30, 33, 36, 39, 42, 45, 48, 51, 54, 57], [x.val for x in sliced.iterate()])
+
+    def test_expr_len_range(self):
+        # [0...1000000000].length()
+
+        val = self._interp._expr({
+            'type': 'len',
+            'target': {
+                'type': 'range',
+                'start': 0,
+                'end': 1000000000,
+            },
+        }, {})
+
+        self.assertEqual(1000000000, val.val)
+
+    def test_expr_contains_range(self):
+        # [0...1000000000, 2].contains(x)
+
+        target = {
+            'type': 'range',
+            'start': 0,
+            'end': 1000000000,
+            'step': 2,
+        }
+
+        for value, expected in [(999999998, True), (999999999, False), (1000000000, False), (4.0, True), ('4', False)]:
+            val = self._interp._expr({
+                'type': 'contains',
+                'target': target,
+                'value': value,
+            }, {})
+            self.assertIs(expected, val.val)
+
+    def test_expr_reverse_range(self):
+        # [1...5].reverse()
+
+        val = self._interp._expr({
+            'type': 'reverse',
+            'target': {
+                'type': 'range',
+                'start': 1,
+                'end': 5,
+            },
+        }, {})
+
+        self.assertEqual([4, 3, 2, 1], [x.val for x in val.iterate()])
+
     def test_expr_subscript_string(self):
         vars = {}
 
@@ -1096,25 +1470,65 @@ class TestInterpreter(unittest.TestCase):
 
         self.assertEqual(3, vars['test1'].val)
 
-    def test_instr_append(self):
+    def test_instr_addset_rebinds(self):
         vars = {}
 
-        # test1 = []
-        # test1.append(1)
-        # test1.append(2)
+        # test1 = 1000
+        # test2 = test1
+        # test1 += 2
 
         self._interp._instrs([
             {
                 'type': 'setvar',
                 'name': 'test1',
                 'value': {
-                    'type': 'list',
+                    'type': 'int',
+                    'value': 1000,
                 },
             },
             {
-                'type': 'append',
-                'target': {
-                    'type': 'getvar',
+                'type': 'setvar',
+                'name': 'test2',
+                'value': {
+                    'type': 'getvar',
+                    'name': 'test1',
+                },
+            },
+            {
+                'type': 'addset',
+                'target': {
+                    'type': 'getvar',
+                    'name': 'test1',
+                },
+                'value': {
+                    'type': 'int',
+                    'value': 2,
+                },
+            },
+        ], vars)
+
+        self.assertEqual(1002, vars['test1'].val)
+        self.assertEqual(1000, vars['test2'].val)
+
+    def test_instr_append(self):
+        vars = {}
+
+        # test1 = []
+        # test1.append(1)
+        # test1.append(2)
+
+        self._interp._instrs([
+            {
+                'type': 'setvar',
+                'name': 'test1',
+                'value': {
+                    'type': 'list',
+                },
+            },
+            {
+                'type': 'append',
+                'target': {
+                    'type': 'getvar',
                     'name': 'test1',
                 },
                 'value': {
@@ -1135,7 +1549,7 @@ class TestInterpreter(unittest.TestCase):
             },
         ], vars)
 
-        self.assertEqual([1, 2], [x.val for x in vars['test1'].val])
+        self.assertEqual([1, 2], [x.val for x in vars['test1'].iterate()])
 
     def test_instr_divset(self):
         vars = {}
@@ -1971,6 +2385,788 @@ class TestInterpreter(unittest.TestCase):
 
         self.assertEqual(28, vars['test1'].val)
 
+    def test_instr_switch_table(self):
+        # switch:
+        # case test1 == 1:
+        #   print("a")
+        # case 2 == test1:
+        #   print("b")
+        # case test1 == "c":
+        #   print("c")
+        # case test1 == 1.0:
+        #   print("d")
+        # default:
+        #   print("e")
+
+        def case(cond, name):
+            return {
+                'cond': cond,
+                'code': [
+                    {
+                        'type': 'print',
+                        'value': {
+                            'type': 'string',
+                            'value': name,
+                        },
+                    },
+                ],
+            }
+
+        test1 = {
+            'type': 'getvar',
+            'name': 'test1',
+        }
+
+        switch = {
+            'type': 'switch',
+            'cases': [
+                case({'type': 'equal', 'value1': test1, 'value2': {'type': 'int', 'value': 1}}, 'a'),
+                case({'type': 'equal', 'value1': {'type': 'int', 'value': 2}, 'value2': test1}, 'b'),
+                case({'type': 'equal', 'value1': test1, 'value2': {'type': 'string', 'value': 'c'}}, 'c'),
+                case({'type': 'equal', 'value1': test1, 'value2': {'type': 'float', 'value': 1.0}}, 'd'),
+            ],
+            'default': [
+                {
+                    'type': 'print',
+                    'value': {
+                        'type': 'string',
+                        'value': 'e',
+                    },
+                },
+            ],
+        }
+
+        self.assertIsNotNone(interpreter.SwitchTable.build(switch))
+
+        for value in [interpreter.Int(1), interpreter.Float(1.0), interpreter.TRUE, interpreter.Float(2.0), interpreter.String('c'), interpreter.Int(3), interpreter.List()]:
+            self._interp._instr(switch, {'test1': value})
+
+        self.assertEqual('a\na\na\nb\nc\ne\ne\n', self.stdout())
+
+    def test_instr_switch_mixed(self):
+        # switch:
+        # case test1 == 1:
+        #   print("a")
+        # case test2 == 1:
+        #   print("b")
+        # case test1 == 2:
+        #   print("c")
+
+        def case(name, value, out):
+            return {
+                'cond': {
+                    'type': 'equal',
+                    'value1': {
+                        'type': 'getvar',
+                        'name': name,
+                    },
+                    'value2': value,
+                },
+                'code': [
+                    {
+                        'type': 'print',
+                        'value': out,
+                    },
+                ],
+            }
+
+        switch = {
+            'type': 'switch',
+            'cases': [
+                case('test1', 1, 'a'),
+                case('test2', 1, 'b'),
+                case('test1', 2, 'c'),
+            ],
+        }
+
+        self.assertIsNone(interpreter.SwitchTable.build(switch))
+
+        self._interp._instr(switch, {'test1': interpreter.Int(2), 'test2': interpreter.Int(1)})
+
+        self.assertEqual('b\n', self.stdout())
+
+class TestValues(unittest.TestCase):
+
+    def test_shared_singletons(self):
+        self.assertIs(interpreter.TRUE, interpreter.Bool(1))
+        self.assertIs(interpreter.FALSE, interpreter.Int(3).equal(interpreter.Int(4)))
+        self.assertIs(interpreter.VOID, interpreter.Void())
+        self.assertIs(interpreter.Int(7), interpreter.Int(3).add(interpreter.Int(4)))
+        self.assertIs(interpreter.Int(1).typeof(), interpreter.Int(100000).typeof())
+
+    def test_large_ints_not_shared(self):
+        self.assertEqual(100000, interpreter.Int(100000).val)
+        self.assertIsNot(interpreter.Int(100000), interpreter.Int(100000))
+
+    def test_slots(self):
+        for value in [interpreter.Bool(True), interpreter.Int(100000), interpreter.Float(1.5), interpreter.String('a'), interpreter.List()]:
+            self.assertFalse(hasattr(value, '__dict__'))
+
+class TTY(io.StringIO):
+    def isatty(self):
+        return True
+
+class TestOutput(unittest.TestCase):
+    def test_buffers_until_size(self):
+        stream = io.StringIO()
+        output = interpreter.Output(stream, size=8)
+
+        output.write('abc')
+        self.assertEqual('', stream.getvalue())
+        output.write('defg')
+        self.assertEqual('abc\ndefg\n', stream.getvalue())
+
+    def test_writes_encoded_bytes(self):
+        raw = io.BytesIO()
+        stream = io.TextIOWrapper(raw, encoding='utf-8')
+        output = interpreter.Output(stream)
+
+        stream.write('first\n')
+        output.write('🔥🦬')
+        output.flush()
+        self.assertEqual('first\n🔥🦬\n'.encode('utf-8'), raw.getvalue())
+
+    def test_tty_line_buffering(self):
+        stream = TTY()
+        interpreter.Output(stream).write('a')
+        self.assertEqual('a\n', stream.getvalue())
+
+        stream = TTY()
+        interpreter.Output(stream, tty_line_buffering=False).write('a')
+        self.assertEqual('', stream.getvalue())
+
+    def test_flushes_on_input(self):
+        stream = io.StringIO()
+        realstdin = sys.stdin
+        sys.stdin = io.StringIO('x\n')
+
+        # print("a")
+        # print(input())
+
+        interp = interpreter.Interpreter([], output=interpreter.Output(stream))
+        try:
+            interp._instr({'type': 'print', 'value': {'type': 'string', 'value': 'a'}}, {})
+            self.assertEqual('', stream.getvalue())
+            interp._expr({'type': 'input'}, {})
+            self.assertEqual('a\n', stream.getvalue())
+        finally:
+            sys.stdin = realstdin
+
+    def test_flushes_on_error(self):
+        for engine in interpreter.Interpreter.engines:
+            stream = io.StringIO()
+
+            # print("a")
+            # print(b)
+
+            interp = interpreter.Interpreter([
+                {'type': 'print', 'value': {'type': 'string', 'value': 'a'}},
+                {'type': 'print', 'value': {'type': 'getvar', 'name': 'b'}},
+            ], engine=engine, output=interpreter.Output(stream))
+
+            with self.assertRaises(KeyError):
+                interp.run()
+            self.assertEqual('a\n', stream.getvalue())
+
+class TestList(unittest.TestCase):
+    def make(self, values):
+        l = interpreter.List()
+        for value in values:
+            l.append(value)
+        return l
+
+    def test_homogeneous_ints_are_unboxed(self):
+        l = self.make([interpreter.Int(i) for i in range(1000)])
+
+        self.assertEqual('q', l.val.typecode)
+        self.assertEqual(1000, l.len().val)
+        self.assertIs(interpreter.Int, type(l.subscript(interpreter.Int(999))))
+        self.assertEqual(999, l.subscript(interpreter.Int(-1)).val)
+        self.assertEqual(list(range(1000)), [x.val for x in l.iterate()])
+
+        l.remove(0)
+        self.assertEqual(1, l.subscript(interpreter.Int(0)).val)
+
+    def test_homogeneous_floats_are_unboxed(self):
+        l = interpreter.List.of([interpreter.Float(0.5), interpreter.Float(1.5)])
+
+        self.assertEqual('d', l.val.typecode)
+        self.assertEqual('[0.5,1.5]', l.string())
+        self.assertIs(interpreter.Float, type(l.reverse().subscript(interpreter.Int(0))))
+
+    def test_falls_back_on_mixed_append(self):
+        l = self.make([interpreter.Int(1), interpreter.Int(2), interpreter.String('a')])
+
+        self.assertIs(list, type(l.val))
+        self.assertEqual('[1,2,a]', l.string())
+
+    def test_falls_back_on_mixed_insert(self):
+        l = self.make([interpreter.Int(1), interpreter.Int(2)])
+        l.insert(interpreter.Int(1), interpreter.Float(1.5))
+
+        self.assertIs(list, type(l.val))
+        self.assertEqual(['int', 'float', 'int'], [x.typeof().val for x in l.iterate()])
+
+    def test_falls_back_on_big_int(self):
+        l = self.make([interpreter.Int(1), interpreter.Int(2 ** 70)])
+
+        self.assertIs(list, type(l.val))
+        self.assertEqual(2 ** 70, l.subscript(interpreter.Int(1)).val)
+
+    def test_big_int_first_stays_boxed(self):
+        appended = self.make([interpreter.Int(2 ** 70), interpreter.Int(1)])
+        inserted = interpreter.List()
+        inserted.insert(interpreter.Int(0), interpreter.Int(-2 ** 70))
+
+        self.assertIs(list, type(appended.val))
+        self.assertEqual('[1180591620717411303424,1]', appended.string())
+        self.assertIs(list, type(inserted.val))
+        self.assertEqual(-2 ** 70, inserted.subscript(interpreter.Int(0)).val)
+
+    def test_storage_is_not_observable(self):
+        ints = interpreter.List.of([interpreter.Int(1000), interpreter.Int(2)])
+        boxed = interpreter.List()
+        boxed.val = [interpreter.Int(1000), interpreter.Int(2)]
+
+        self.assertIs(interpreter.TRUE, ints.equal(boxed))
+        self.assertIs(interpreter.TRUE, ints.contains(interpreter.Float(2.0)))
+        self.assertIs(interpreter.FALSE, ints.contains(interpreter.String('2')))
+        self.assertEqual(boxed.string(), ints.string())
+
+class ClosureShim:
+    def __init__(self):
+        self._compiler = interpreter.ClosureCompiler()
+        self._output = self._compiler._output
+
+    def _expr(self, expr, vars):
+        return self._compiler.evaluate(expr, vars)
+
+    def _instr(self, instr, vars):
+        self._compiler.run([instr], vars)
+
+    def _instrs(self, instrs, vars):
+        self._compiler.run(instrs, vars)
+
+class TestClosureCompiler(TestInterpreter):
+    def setUp(self):
+        super().setUp()
+        self._interp = ClosureShim()
+
+    def test_compiles_once(self):
+        # for i of [0...3]
+        #   print(i)
+
+        code, scope = self._interp._compiler.compile([
+            {
+                'type': 'loop',
+                'var': 'i',
+                'list': {
+                    'type': 'range',
+                    'start': {
+                        'type': 'int',
+                        'value': 0,
+                    },
+                    'end': {
+                        'type': 'int',
+                        'value': 3,
+                    },
+                },
+                'code': [
+                    {
+                        'type': 'print',
+                        'value': {
+                            'type': 'getvar',
+                            'name': 'i',
+                        },
+                    },
+                ],
+            },
+        ])
+
+        code(scope.frame())
+        code(scope.frame())
+
+        self.assertEqual('0\n1\n2\n0\n1\n2\n', self.stdout())
+
+    def test_func_frame_is_static(self):
+        vars = {
+            'test1': interpreter.Int(1),
+            'test2': interpreter.Int(2),
+            'test3': interpreter.Int(3),
+        }
+
+        # test4 = func(test5) { return test5 + test1 }
+        # test6 = test4(10)
+
+        self._interp._instrs([
+            {
+                'type': 'setvar',
+                'name': 'test4',
+                'value': {
+                    'type': 'func',
+                    'args': ['test5'],
+                    'code': [
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'add',
+                                'value1': {
+                                    'type': 'getvar',
+                                    'name': 'test5',
+                                },
+                                'value2': {
+                                    'type': 'getvar',
+                                    'name': 'test1',
+                                },
+                            },
+                        },
+                    ],
+                },
+            },
+            {
+                'type': 'setvar',
+                'name': 'test6',
+                'value': {
+                    'type': 'call',
+                    'target': {
+                        'type': 'getvar',
+                        'name': 'test4',
+                    },
+                    'args': [
+                        {
+                            'type': 'int',
+                            'value': 10,
+                        },
+                    ],
+                },
+            },
+        ], vars)
+
+        self.assertEqual(11, vars['test6'].val)
+        # Parent link plus one slot for the argument, however many globals exist
+        self.assertEqual(2, vars['test4'].size)
+
+    def test_func_local_shadows_outer(self):
+        vars = {
+            'test1': interpreter.Int(5),
+        }
+
+        # test2 = func() { test3 = test1; test1 = 7; return test3 }
+        # test4 = test2()
+
+        self._interp._instrs([
+            {
+                'type': 'setvar',
+                'name': 'test2',
+                'value': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'setvar',
+                            'name': 'test3',
+                            'value': {
+                                'type': 'getvar',
+                                'name': 'test1',
+                            },
+                        },
+                        {
+                            'type': 'setvar',
+                            'name': 'test1',
+                            'value': {
+                                'type': 'int',
+                                'value': 7,
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'getvar',
+                                'name': 'test3',
+                            },
+                        },
+                    ],
+                },
+            },
+            {
+                'type': 'setvar',
+                'name': 'test4',
+                'value': {
+                    'type': 'call',
+                    'target': {
+                        'type': 'getvar',
+                        'name': 'test2',
+                    },
+                },
+            },
+        ], vars)
+
+        self.assertEqual(5, vars['test4'].val)
+        self.assertEqual(5, vars['test1'].val)
+
+
+def ticker(name, ms, times):
+    # fun name(label)
+    #     for i of [0...times]
+    #         sleep(ms)
+    #         print(label + " " + string(now()))
+    return {
+        'type': 'setvar',
+        'name': name,
+        'value': {
+            'type': 'func',
+            'args': ['label'],
+            'code': [
+                {
+                    'type': 'loop',
+                    'var': 'i',
+                    'list': {
+                        'type': 'range',
+                        'start': 0,
+                        'end': times,
+                    },
+                    'code': [
+                        sleep(ms),
+                        {
+                            'type': 'print',
+                            'value': {
+                                'type': 'add',
+                                'value1': {
+                                    'type': 'add',
+                                    'value1': {
+                                        'type': 'getvar',
+                                        'name': 'label',
+                                    },
+                                    'value2': ' ',
+                                },
+                                'value2': {
+                                    'type': 'string',
+                                    'value': {
+                                        'type': 'now',
+                                    },
+                                },
+                            },
+                        },
+                    ],
+                },
+            ],
+        },
+    }
+
+class TestTimers(unittest.TestCase):
+    def run_program(self, ast, engine='bytecode', clock=None):
+        stream = io.StringIO()
+        clock = interpreter.VirtualClock() if clock is None else clock
+        interpreter.Interpreter(ast, engine=engine, output=interpreter.Output(stream), clock=clock).run()
+        return stream.getvalue()
+
+    def test_sleep_moves_virtual_clock(self):
+        # sleep(250)
+        # sleep()
+        # print(now())
+
+        ast = [sleep(250), {'type': 'sleep'}, {'type': 'print', 'value': {'type': 'now'}}]
+
+        for engine in interpreter.Interpreter.engines:
+            self.assertEqual('250\n', self.run_program(ast, engine), engine)
+
+    def test_timer_order(self):
+        # spawn a("a")  # sleeps 30ms, 3 times
+        # spawn b("b")  # sleeps 50ms, 2 times
+        # spawn c("c")  # sleeps 60ms, once
+        # print("main " + string(timer(70).receive()))
+
+        ast = [
+            ticker('a', 30, 3),
+            ticker('b', 50, 2),
+            ticker('c', 60, 1),
+            spawn('a', 'a'),
+            spawn('b', 'b'),
+            spawn('c', 'c'),
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'add',
+                    'value1': 'main ',
+                    'value2': {
+                        'type': 'string',
+                        'value': {
+                            'type': 'receive',
+                            'target': {'type': 'timer', 'ms': 70},
+                        },
+                    },
+                },
+            },
+        ]
+
+        # c set its timer for 60 before a did, so it goes first; the run lasts until the last timer
+        self.assertEqual('a 30\nb 50\nc 60\na 60\nmain 70\na 90\nb 100\n', self.run_program(ast))
+
+    def test_many_pending_timers(self):
+        # fun wait(ms)
+        #     sleep(ms)
+        #     print(now())
+        # for i of [0...n]
+        #     spawn wait(i * 7919 % n)
+
+        n = 10000
+        ast = [
+            {
+                'type': 'setvar',
+                'name': 'wait',
+                'value': {
+                    'type': 'func',
+                    'args': ['ms'],
+                    'code': [
+                        sleep({'type': 'getvar', 'name': 'ms'}),
+                        {'type': 'print', 'value': {'type': 'now'}},
+                    ],
+                },
+            },
+            {
+                'type': 'loop',
+                'var': 'i',
+                'list': {
+                    'type': 'range',
+                    'start': 0,
+                    'end': n,
+                },
+                'code': [
+                    {
+                        'type': 'spawn',
+                        'call': call('wait', {
+                            'type': 'mod',
+                            'value1': {'type': 'mul', 'value1': {'type': 'getvar', 'name': 'i'}, 'value2': 7919},
+                            'value2': n,
+                        }),
+                    },
+                ],
+            },
+        ]
+
+        # The timers are set in scrambled order, and every ms from 0 to n - 1 has one
+        times = self.run_program(ast).split()
+        self.assertEqual(n, len(times))
+        self.assertTrue(times == [str(ms) for ms in range(n)])
+
+    def test_timers_heap(self):
+        clock = interpreter.VirtualClock()
+        timers = interpreter.Timers(clock)
+        channels = [(ms, timers.add(ms)) for ms in [(i * 7919) % 100000 for i in range(100000)]]
+
+        self.assertEqual(100000, len(timers))
+        self.assertEqual(0, timers.next())
+
+        clock.advance(50000)
+        timers.fire()
+        self.assertEqual(49999, len(timers))
+        self.assertEqual(50001, timers.next())
+        for ms, channel in channels:
+            self.assertEqual(ms <= 50000, channel.try_receive() is not None)
+
+    def test_pending_timer_is_not_deadlock(self):
+        # fun later(c)
+        #     sleep(1000)
+        #     c.send(5)
+        # c = chan()
+        # spawn later(c)
+        # print(c.receive())
+        # print(now())
+
+        ast = [
+            {
+                'type': 'setvar',
+                'name': 'later',
+                'value': {
+                    'type': 'func',
+                    'args': ['c'],
+                    'code': [
+                        sleep(1000),
+                        {'type': 'send', 'target': {'type': 'getvar', 'name': 'c'}, 'value': 5},
+                    ],
+                },
+            },
+            {'type': 'setvar', 'name': 'c', 'value': {'type': 'chan'}},
+            spawn('later', {'type': 'getvar', 'name': 'c'}),
+            {'type': 'print', 'value': {'type': 'receive', 'target': {'type': 'getvar', 'name': 'c'}}},
+            {'type': 'print', 'value': {'type': 'now'}},
+        ]
+
+        self.assertEqual('5\n1000\n', self.run_program(ast))
+
+    def test_deadlock_after_timers(self):
+        # t = timer(10)
+        # c = chan()
+        # c.receive()
+
+        ast = [
+            {'type': 'setvar', 'name': 't', 'value': {'type': 'timer', 'ms': 10}},
+            {'type': 'setvar', 'name': 'c', 'value': {'type': 'chan'}},
+            {'type': 'receive', 'target': {'type': 'getvar', 'name': 'c'}},
+        ]
+
+        with self.assertRaises(interpreter.Deadlock):
+            self.run_program(ast)
+
+    def test_real_sleep_yields(self):
+        # spawn a("a")  # sleeps 20ms, twice
+        # print("main")
+
+        ast = [
+            ticker('a', 20, 2),
+            spawn('a', 'a'),
+            {'type': 'print', 'value': 'main'},
+        ]
+
+        lines = self.run_program(ast, clock=interpreter.Clock()).split('\n')
+        self.assertEqual('main', lines[0])
+        self.assertEqual(['a', 'a'], [line.split()[0] for line in lines[1:3]])
+        self.assertGreaterEqual(int(lines[2].split()[1]), 40)
+
+
+
+class TestScope(unittest.TestCase):
+    def test_funcs_see_where_they_are_defined(self):
+        # fun g()
+        #     return y
+        # fun f()
+        #     y = 5
+        #     return g()
+        # print(f())
+
+        ast = [
+            {
+                'type': 'setvar',
+                'name': 'g',
+                'value': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [{'type': 'return', 'value': {'type': 'getvar', 'name': 'y'}}],
+                },
+            },
+            {
+                'type': 'setvar',
+                'name': 'f',
+                'value': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {'type': 'setvar', 'name': 'y', 'value': 5},
+                        {'type': 'return', 'value': {'type': 'call', 'target': {'type': 'getvar', 'name': 'g'}, 'args': []}},
+                    ],
+                },
+            },
+            {'type': 'print', 'value': {'type': 'call', 'target': {'type': 'getvar', 'name': 'f'}, 'args': []}},
+        ]
+
+        for engine in interpreter.Interpreter.engines:
+            with self.subTest(engine=engine):
+                # f's y is its own, so g, defined at the top level, cannot see it
+                with self.assertRaises(KeyError):
+                    interpreter.Interpreter(ast, engine=engine, output=interpreter.Output(io.StringIO())).run()
+
+                # y = 1, before the call
+                stream = io.StringIO()
+                interpreter.Interpreter(ast[:2] + [{'type': 'setvar', 'name': 'y', 'value': 1}] + ast[2:], engine=engine, output=interpreter.Output(stream)).run()
+                self.assertEqual('1\n', stream.getvalue())
+
+class TestLocations(unittest.TestCase):
+    def run_failing(self, ast, engine, filename=None):
+        interp = interpreter.Interpreter(ast, engine=engine, output=interpreter.Output(io.StringIO()), filename=filename)
+        with self.assertRaises(Exception) as cm:
+            interp.run()
+        return cm.exception
+
+    def test_innermost_statement_and_expression(self):
+        # 1 fun f(n)
+        # 2     return 10 / n
+        # 3 x = f(1)
+        # 4 print(f(0))
+
+        ast = [
+            {
+                'type': 'setvar',
+                'name': 'f',
+                'value': {
+                    'type': 'func',
+                    'args': ['n'],
+                    'code': [
+                        {
+                            'type': 'return',
+                            'value': {'type': 'div', 'value1': 10, 'value2': {'type': 'getvar', 'name': 'n', 'column': 17}, 'column': 15},
+                            'line': 2,
+                            'column': 5,
+                        },
+                    ],
+                },
+                'line': 1,
+                'column': 1,
+            },
+            {'type': 'setvar', 'name': 'x', 'value': dict(call('f', 1), column=5), 'line': 3, 'column': 1},
+            {'type': 'print', 'value': dict(call('f', 0), column=7), 'line': 4, 'column': 1},
+        ]
+
+        for engine in interpreter.Interpreter.engines:
+            with self.subTest(engine=engine):
+                e = self.run_failing(ast, engine, 't.🔥🦬')
+                self.assertIsInstance(e, ZeroDivisionError)
+                self.assertEqual(('t.🔥🦬', 2, 15), e.location)
+                self.assertEqual(['at t.🔥🦬:2:15'], e.__notes__)
+
+    def test_statement_without_columns(self):
+        # 1 x = 1
+        # 2 print(y)
+
+        ast = [
+            {'type': 'setvar', 'name': 'x', 'value': 1, 'line': 1},
+            {'type': 'print', 'value': {'type': 'getvar', 'name': 'y'}, 'line': 2},
+        ]
+
+        for engine in interpreter.Interpreter.engines:
+            with self.subTest(engine=engine):
+                e = self.run_failing(ast, engine)
+                self.assertIsInstance(e, KeyError)
+                self.assertEqual((None, 2, None), e.location)
+                self.assertEqual(['at line 2'], e.__notes__)
+
+    def test_operands_of_the_same_type(self):
+        # 1 x = 1
+        # 2 print(x + nope)
+
+        ast = [
+            {'type': 'setvar', 'name': 'x', 'value': 1, 'line': 1, 'column': 1},
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'add',
+                    'value1': {'type': 'getvar', 'name': 'x', 'column': 7},
+                    'value2': {'type': 'getvar', 'name': 'nope', 'column': 11},
+                    'column': 9,
+                },
+                'line': 2,
+                'column': 1,
+            },
+        ]
+
+        for engine in interpreter.Interpreter.engines:
+            with self.subTest(engine=engine):
+                e = self.run_failing(ast, engine)
+                self.assertIsInstance(e, KeyError)
+                self.assertEqual((None, 2, 11), e.location)
+
+    def test_parsed_columns(self):
+        source = 'fun f(n)\n    return 10 / n\n\n# comment\nfor i of [0...3]\n    print(f(2 - i))\n'
+        ast = Parser.from_string(source).parse()
+
+        loop = ast[1]
+        self.assertEqual((5, 1), (loop['line'], loop['column']))
+        self.assertEqual(10, loop['list']['column'])
+        self.assertEqual((6, 5, 11), (loop['code'][0]['line'], loop['code'][0]['column'], loop['code'][0]['value']['column']))
+
+        for engine in interpreter.Interpreter.engines:
+            with self.subTest(engine=engine):
+                self.assertEqual((None, 2, 15), self.run_failing(ast, engine).location)
+
 
 if __name__ == '__main__':
     unittest.main()
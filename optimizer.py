@@ -0,0 +1,180 @@
+"""Simplifies a parse tree before it is run.
+
+Constant subtrees are evaluated once with the tree interpreter, so folding can never change
+what a program computes, and the result is left in the tree as a plain Python literal, which
+every engine already accepts in place of a node. Switch cases that can never run and
+instructions after an unconditional return are dropped.
+"""
+
+from interpreter import Bool, Float, Int, Interpreter, String
+
+# Expression types that only compute a value from their operands, so they can run at compile time
+PURE = {
+    'add', 'and', 'bool', 'contains', 'div', 'equal', 'float', 'int', 'len', 'mod', 'mul', 'not',
+    'notequal', 'or', 'pow', 'reverse', 'string', 'sub', 'subscript', 'typeof', 'xor',
+}
+
+# Keys of a node that hold subexpressions
+OPERANDS = ['value', 'value1', 'value2', 'target', 'index', 'start', 'end', 'step', 'prompt', 'cond', 'list', 'call']
+
+LITERALS = {
+    Bool: bool,
+    Float: float,
+    Int: int,
+    String: str,
+}
+
+
+def is_constant(expr):
+    return type(expr) in (int, float, bool, str)
+
+
+class Optimizer:
+    def __init__(self):
+        self._interp = Interpreter([])
+
+    def optimize(self, instrs):
+        return self.block(instrs)
+
+    def block(self, instrs):
+        ret = []
+
+        for instr in instrs:
+            ret.extend(self.instr(instr))
+
+            if ret and type(ret[-1]) is dict and ret[-1]['type'] == 'return':
+                break
+
+        return ret
+
+    def instr(self, instr):
+        # Returns the list of instructions that replace instr
+        kind = instr['type']
+
+        if kind == 'switch':
+            return self._switch(instr)
+        if kind == 'if':
+            return self._if(instr)
+
+        if kind in PURE:
+            node = self.expr(instr)
+            if is_constant(node):
+                # A constant expression statement does nothing
+                return []
+            return [node]
+
+        node = self._operands(instr)
+        if 'code' in node:
+            node['code'] = self.block(node['code'])
+        return [node]
+
+    def expr(self, expr):
+        if type(expr) is not dict:
+            return expr
+
+        kind = expr['type']
+
+        if kind == 'func':
+            node = dict(expr)
+            node['code'] = self.block(expr['code'])
+            return node
+
+        node = self._operands(expr)
+
+        if kind == 'and' or kind == 'or':
+            return self._logic(node)
+        if kind in PURE:
+            return self._fold(node)
+        return node
+
+    def _operands(self, node):
+        node = dict(node)
+
+        for key in OPERANDS:
+            if key in node:
+                node[key] = self.expr(node[key])
+        if node['type'] == 'call' and 'args' in node:
+            node['args'] = [self.expr(arg) for arg in node['args']]
+        if node['type'] == 'call' and 'kwargs' in node:
+            node['kwargs'] = {k: self.expr(v) for k, v in node['kwargs'].items()}
+        if node['type'] == 'list' and 'values' in node:
+            node['values'] = [self.expr(value) for value in node['values']]
+
+        return node
+
+    def _fold(self, node):
+        if not all(is_constant(node[key]) for key in OPERANDS if key in node):
+            return node
+
+        try:
+            value = self._interp._expr(node, {})
+        except Exception:
+            # Leave it for run time, so the error is raised when and where it would have been
+            return node
+
+        if type(value) not in LITERALS:
+            return node
+        return LITERALS[type(value)](value.val)
+
+    def _logic(self, node):
+        v1 = node['value1']
+
+        if is_constant(v1):
+            if is_constant(node['value2']):
+                return self._fold(node)
+
+            # A false left side decides and, a true one decides or, without looking at the right
+            if bool(v1) != (node['type'] == 'and'):
+                return node['type'] == 'or'
+            # Otherwise Bool.and_/or_ just turn the right side into a bool
+            if type(v1) is bool:
+                return {'type': 'bool', 'value': node['value2']}
+
+        return node
+
+    def _if(self, instr):
+        cond = self.expr(instr['cond'])
+
+        if is_constant(cond):
+            return self.block(instr['code'] if cond else instr.get('else', []))
+
+        node = dict(instr)
+        node['cond'] = cond
+        node['code'] = self.block(instr['code'])
+        if 'else' in instr:
+            node['else'] = self.block(instr['else'])
+        return [node]
+
+    def _switch(self, instr):
+        cases = []
+        default = instr.get('default')
+
+        for case in instr['cases']:
+            cond = self.expr(case['cond'])
+
+            if is_constant(cond):
+                if not cond:
+                    continue
+                # Nothing after a case that always matches can run
+                default = case['code']
+                break
+
+            cases.append({'cond': cond, 'code': self.block(case['code'])})
+
+        if default is not None:
+            default = self.block(default)
+
+        if not cases:
+            return default or []
+
+        node = dict(instr)
+        node['cases'] = cases
+        if default is not None:
+            node['default'] = default
+        else:
+            node.pop('default', None)
+        return [node]
+
+
+def optimize(instrs):
+    return Optimizer().optimize(instrs)
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+import optimizer
+import unittest
+from testnodes import getvar, prints
+
+class TestOptimizer(unittest.TestCase):
+    def test_fold_arithmetic(self):
+        # print(x * 2 ^ 10)
+
+        ast = optimizer.optimize([
+            prints({
+                'type': 'mul',
+                'value1': getvar('x'),
+                'value2': {
+                    'type': 'pow',
+                    'value1': {
+                        'type': 'int',
+                        'value': 2,
+                    },
+                    'value2': {
+                        'type': 'int',
+                        'value': 10,
+                    },
+                },
+            }),
+        ])
+
+        self.assertEqual([prints({'type': 'mul', 'value1': getvar('x'), 'value2': 1024})], ast)
+
+    def test_fold_uses_value_semantics(self):
+        # print(7 / 2)
+        # print(7.0 / 2)
+        # print("a" + "b" + 1.5)
+
+        ast = optimizer.optimize([
+            prints({'type': 'div', 'value1': 7, 'value2': 2}),
+            prints({'type': 'div', 'value1': 7.0, 'value2': 2}),
+            prints({'type': 'add', 'value1': {'type': 'add', 'value1': 'a', 'value2': 'b'}, 'value2': 1.5}),
+        ])
+
+        self.assertEqual([prints(3), prints(3.5), prints('ab1.5')], ast)
+
+    def test_errors_are_left_for_run_time(self):
+        # print(1 / 0)
+
+        ast = [prints({'type': 'div', 'value1': 1, 'value2': 0})]
+
+        self.assertEqual(ast, optimizer.optimize(ast))
+
+    def test_side_effects_are_kept(self):
+        # print(input() + "a")
+
+        ast = [prints({'type': 'add', 'value1': {'type': 'input'}, 'value2': 'a'})]
+
+        self.assertEqual(ast, optimizer.optimize(ast))
+
+    def test_logic_with_constant_left(self):
+        # print(false and f())
+        # print(true or f())
+        # print(true and f())
+
+        call = {
+            'type': 'call',
+            'target': getvar('f'),
+        }
+
+        ast = optimizer.optimize([
+            prints({'type': 'and', 'value1': False, 'value2': call}),
+            prints({'type': 'or', 'value1': True, 'value2': call}),
+            prints({'type': 'and', 'value1': True, 'value2': call}),
+        ])
+
+        self.assertEqual([prints(False), prints(True), prints({'type': 'bool', 'value': call})], ast)
+
+    def test_prune_switch(self):
+        # if 1 == 2
+        #     print("a")
+        # elif x
+        #     print("b")
+        # elif 1 == 1
+        #     print("c")
+        # elif y
+        #     print("d")
+        # else
+        #     print("e")
+
+        ast = optimizer.optimize([
+            {
+                'type': 'switch',
+                'cases': [
+                    {'cond': {'type': 'equal', 'value1': 1, 'value2': 2}, 'code': [prints('a')]},
+                    {'cond': getvar('x'), 'code': [prints('b')]},
+                    {'cond': {'type': 'equal', 'value1': 1, 'value2': 1}, 'code': [prints('c')]},
+                    {'cond': getvar('y'), 'code': [prints('d')]},
+                ],
+                'default': [prints('e')],
+            },
+        ])
+
+        self.assertEqual([
+            {
+                'type': 'switch',
+                'cases': [
+                    {'cond': getvar('x'), 'code': [prints('b')]},
+                ],
+                'default': [prints('c')],
+            },
+        ], ast)
+
+    def test_switch_with_no_live_cases(self):
+        # if false
+        #     print("a")
+        # else
+        #     print("b")
+        # print("c")
+
+        ast = optimizer.optimize([
+            {
+                'type': 'switch',
+                'cases': [
+                    {'cond': False, 'code': [prints('a')]},
+                ],
+                'default': [prints('b')],
+            },
+            prints('c'),
+        ])
+
+        self.assertEqual([prints('b'), prints('c')], ast)
+
+    def test_code_after_return(self):
+        # f = func() { return 1  print("dead") }
+
+        ast = optimizer.optimize([
+            {
+                'type': 'setvar',
+                'name': 'f',
+                'value': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'return',
+                            'value': 1,
+                        },
+                        prints('dead'),
+                    ],
+                },
+            },
+        ])
+
+        self.assertEqual([{'type': 'return', 'value': 1}], ast[0]['value']['code'])
+
+if __name__ == '__main__':
+    unittest.main()
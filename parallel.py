@@ -0,0 +1,221 @@
+"""Runs loops whose iterations are independent on a pool of worker processes.
+
+A loop qualifies when its body can only affect the rest of the program through print and
+through append to lists from outside the loop: it may branch, compute, and assign variables
+that every iteration sets before it reads them, but not call funcs, read input, return, or
+read the lists it appends to. The elements are split into chunks that run on the engine the
+program uses, each worker collecting its printed lines and appended values, and the parent
+replays them chunk by chunk in order, so the output is the same as running the loop here.
+"""
+
+import concurrent.futures
+from interpreter import Bool, Float, Int, Interpreter, List, LoopPlan, Range, String, Void, assigned
+from optimizer import OPERANDS, PURE
+
+# Below this many elements, starting the chunks costs more than running them here
+MIN_ITEMS = 1000
+CHUNKS_PER_WORKER = 4
+
+# Where a worker finds its chunk; not a valid variable name, so it cannot clash with one
+ITEMS = ' items'
+
+OPSETS = {'addset', 'divset', 'modset', 'mulset', 'powset', 'subset'}
+SENDABLE = {Bool, Float, Int, Range, String, Void}
+
+
+class Pool:
+    """The worker processes of one run, started the first time a loop needs them."""
+
+    def __init__(self, workers, engine='tree', output=None, min_items=MIN_ITEMS, filename=None):
+        self.workers = workers
+        self.engine = engine
+        self.output = output
+        self.min_items = min_items
+        # Of the program, so that errors in a worker say where they happened the same way
+        self.filename = filename
+        self._executor = None
+
+    def map(self, fn, tasks):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        return self._executor.map(fn, tasks)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+class Lines:
+    """Stands in for Output in a worker, keeping the lines for the parent to print."""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def flush(self):
+        pass
+
+
+def sendable(value):
+    # Funcs hold Python closures, so they cannot be pickled over to a worker
+    if type(value) is List:
+        return type(value.val) is not list or all(sendable(x) for x in value.val)
+    return type(value) in SENDABLE
+
+
+def run_chunk(task):
+    code, var, chunk, vars, appends, writes, engine, filename = task
+
+    for name in appends:
+        vars[name] = List()
+    vars[ITEMS] = chunk
+
+    output = Lines()
+    loop = {
+        'type': 'loop',
+        'var': var,
+        'list': {
+            'type': 'getvar',
+            'name': ITEMS,
+        },
+        'code': code,
+    }
+
+    error = None
+    try:
+        Interpreter([loop], engine=engine, output=output, filename=filename).run(vars)
+    except Exception as e:
+        # Everything before the error still has to come out, in order, before it is raised
+        error = e
+
+    values = {name: vars[name] for name in writes if name in vars}
+    return output.lines, {name: vars[name] for name in appends}, values, error
+
+
+class Plan(LoopPlan):
+    def __init__(self, loop, pool, reads, appends, temps):
+        self.loop = loop
+        self.pool = pool
+        # Outer variables the body reads, outer lists it appends to, and variables it sets each iteration
+        self.reads = reads
+        self.appends = appends
+        self.names = sorted(set(reads) | set(appends))
+        self.writes = [loop['var']] + [name for name in temps if name != loop['var']]
+        self._interp = Interpreter([])
+
+    def run(self, vars):
+        iterable = self._interp._expr(self.loop['list'], vars)
+        if type(iterable) not in (List, Range):
+            return False
+
+        n = iterable.len().val
+        if n < self.pool.min_items:
+            return False
+        if any(type(vars.get(name)) is not List for name in self.appends):
+            return False
+
+        env = {name: vars[name] for name in self.reads if name in vars}
+        if not all(sendable(value) for value in env.values()):
+            return False
+
+        count = min(n, self.pool.workers * CHUNKS_PER_WORKER)
+        bounds = [n * i // count for i in range(count + 1)]
+        tasks = []
+        for start, end in zip(bounds, bounds[1:]):
+            chunk = iterable.subscript(Range.wrap(range(start, end)))
+            tasks.append((self.loop['code'], self.loop['var'], chunk, dict(env), self.appends, self.writes, self.pool.engine, self.pool.filename))
+
+        write = self.pool.output.write
+        for lines, appended, values, error in self.pool.map(run_chunk, tasks):
+            for line in lines:
+                write(line)
+            for name, values_list in appended.items():
+                target = vars[name]
+                for value in values_list.iterate():
+                    target.append(value)
+            vars.update(values)
+            if error is not None:
+                raise error
+
+        return True
+
+
+class Checker:
+    """Walks a loop body in order to decide whether its iterations are independent."""
+
+    def __init__(self, assigned, defined):
+        self.assigned = assigned
+        # Variables set by this point of every iteration, so reading them cannot see an earlier one
+        self.defined = defined
+        self.reads = set()
+        self.appends = set()
+
+    def block(self, instrs, top):
+        return all(self.instr(instr, top) for instr in instrs)
+
+    def instr(self, instr, top):
+        kind = instr['type']
+
+        if kind == 'setvar':
+            if not self.expr(instr['value']):
+                return False
+            if top:
+                self.defined.add(instr['name'])
+            return instr['name'] in self.defined
+        if kind in OPSETS:
+            return instr['target']['type'] == 'getvar' and instr['target']['name'] in self.defined and self.expr(instr['value'])
+        if kind == 'print':
+            return self.expr(instr['value'])
+        if kind == 'append':
+            target = instr['target']
+            if target['type'] != 'getvar' or target['name'] in self.assigned:
+                return False
+            self.appends.add(target['name'])
+            return self.expr(instr['value'])
+        if kind == 'if':
+            return self.expr(instr['cond']) and self.block(instr['code'], False) and self.block(instr.get('else', []), False)
+        if kind == 'switch':
+            for case in instr['cases']:
+                if not self.expr(case['cond']) or not self.block(case['code'], False):
+                    return False
+            return self.block(instr.get('default', []), False)
+        if kind in PURE:
+            return self.expr(instr)
+        return False
+
+    def expr(self, expr):
+        if type(expr) is not dict:
+            return True
+
+        kind = expr['type']
+        if kind == 'getvar':
+            name = expr['name']
+            if name in self.assigned:
+                return name in self.defined
+            self.reads.add(name)
+            return True
+        if kind == 'list':
+            return all(self.expr(value) for value in expr['values'])
+        if kind not in PURE and kind != 'range':
+            return False
+        return all(self.expr(expr[key]) for key in OPERANDS if key in expr)
+
+
+def plan(loop, pool):
+    """A Plan for running loop on pool, or None if its iterations might depend on each other."""
+    checker = Checker(set(assigned(loop['code'])) | {loop['var']}, {loop['var']})
+    if not checker.block(loop['code'], True):
+        return None
+    # The list is evaluated once whichever way the loop runs, but only a pure one can be evaluated again
+    outer = Checker(set(), set())
+    if not outer.expr(loop['list']):
+        return None
+    # Each worker appends to empty lists of its own, so it would read something else
+    if checker.appends & checker.reads:
+        return None
+
+    reads = sorted(checker.reads | outer.reads)
+    return Plan(loop, pool, reads, sorted(checker.appends), sorted(checker.defined))
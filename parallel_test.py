@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+import interpreter
+import io
+import parallel
+import pickle
+import unittest
+from testnodes import acc, getvar, loop, op, prints, span
+
+# Enough elements that a loop over them is split into chunks
+END = parallel.MIN_ITEMS + 200
+
+class TestParallel(unittest.TestCase):
+    def run_all(self, ast):
+        # Returns what ast prints, after checking every engine prints the same on one and on two processes
+        outputs = set()
+
+        for engine in interpreter.Interpreter.engines:
+            for workers in (1, 2):
+                stream = io.StringIO()
+                output = interpreter.Output(stream)
+                interpreter.Interpreter(ast, engine=engine, output=output, workers=workers).run()
+                outputs.add(stream.getvalue())
+
+        self.assertEqual(1, len(outputs))
+        return outputs.pop()
+
+    def test_plan(self):
+        # for i of [0...n]
+        #     sq = i * i
+        #     if sq % 2 == 0
+        #         out.append(sq + k)
+
+        plan = parallel.plan(loop('i', span(0, END), [
+            {'type': 'setvar', 'name': 'sq', 'value': op('mul', getvar('i'), getvar('i'))},
+            {
+                'type': 'if',
+                'cond': op('equal', op('mod', getvar('sq'), 2), 0),
+                'code': [acc('append', 'out', op('add', getvar('sq'), getvar('k')))],
+            },
+        ]), parallel.Pool(2))
+
+        self.assertEqual(['k'], plan.reads)
+        self.assertEqual(['out'], plan.appends)
+        self.assertEqual(['i', 'sq'], plan.writes)
+
+    def test_plan_rejects(self):
+        rejected = [
+            # Calls, input and return can do anything
+            [prints({'type': 'call', 'target': getvar('f'), 'args': []})],
+            [prints({'type': 'input'})],
+            [{'type': 'return', 'value': 1}],
+            # Carrying a value from one iteration to the next
+            [{'type': 'addset', 'target': getvar('total'), 'value': getvar('i')}],
+            [prints(getvar('x')), {'type': 'setvar', 'name': 'x', 'value': getvar('i')}],
+            [{'type': 'if', 'cond': getvar('i'), 'code': [{'type': 'setvar', 'name': 'x', 'value': 1}]}],
+            # Reading a list the loop appends to
+            [acc('append', 'out', 1), prints(getvar('out'))],
+            # Nested loops
+            [loop('i', span(0, END), [prints(getvar('i'))])],
+        ]
+
+        for code in rejected:
+            self.assertIsNone(parallel.plan(loop('i', span(0, END), code), parallel.Pool(2)), code)
+
+    def test_prints_in_order(self):
+        # for i of [0...1200]
+        #     if i % 15 == 0
+        #         print(-15)
+        #     elif i % 3 == 0
+        #         print(-3)
+        #     else
+        #         print(i)
+        # print(i)
+
+        ast = [
+            loop('i', span(0, END), [
+                {
+                    'type': 'switch',
+                    'cases': [
+                        {'cond': op('equal', op('mod', getvar('i'), 15), 0), 'code': [prints(-15)]},
+                        {'cond': op('equal', op('mod', getvar('i'), 3), 0), 'code': [prints(-3)]},
+                    ],
+                    'default': [prints(getvar('i'))],
+                },
+            ]),
+            prints(getvar('i')),
+        ]
+
+        expected = ['-15' if i % 15 == 0 else '-3' if i % 3 == 0 else str(i) for i in range(1200)] + ['1199']
+        self.assertEqual('\n'.join(expected) + '\n', self.run_all(ast))
+
+    def test_appends_in_order(self):
+        # out = ["start"]
+        # for i of [0...1200]
+        #     sq = i * i + k
+        #     out.append(sq)
+        # print(out.length(), out[1], out[1200], sq)
+
+        ast = [
+            {'type': 'setvar', 'name': 'k', 'value': 3},
+            {'type': 'setvar', 'name': 'out', 'value': {'type': 'list', 'values': ['start']}},
+            loop('i', span(0, END), [
+                {'type': 'setvar', 'name': 'sq', 'value': op('add', op('mul', getvar('i'), getvar('i')), getvar('k'))},
+                acc('append', 'out', getvar('sq')),
+            ]),
+            prints({'type': 'len', 'target': getvar('out')}),
+            prints({'type': 'subscript', 'target': getvar('out'), 'index': 1}),
+            prints({'type': 'subscript', 'target': getvar('out'), 'index': 1200}),
+            prints(getvar('sq')),
+        ]
+
+        self.assertEqual('1201\n3\n1437604\n1437604\n', self.run_all(ast))
+
+    def test_error_after_output(self):
+        # for i of [0...1200]
+        #     print(i)
+        #     print(1 / (600 - i))
+
+        ast = [
+            loop('i', span(0, END), [
+                prints(getvar('i')),
+                dict(prints(dict(op('div', 1, op('sub', 600, getvar('i'))), column=13)), line=3, column=5),
+            ]),
+        ]
+
+        for engine in interpreter.Interpreter.engines:
+            stream = io.StringIO()
+            with self.assertRaises(ZeroDivisionError) as cm:
+                interpreter.Interpreter(ast, engine=engine, output=interpreter.Output(stream), workers=2, filename='p.🔥🦬').run()
+            self.assertEqual(1201, len(stream.getvalue().splitlines()), engine)
+            self.assertEqual('600', stream.getvalue().splitlines()[-1])
+            self.assertEqual(['at p.🔥🦬:3:13'], cm.exception.__notes__)
+
+    def test_values_pickle(self):
+        for value in [interpreter.Int(10 ** 30), interpreter.Float(0.5), interpreter.String('a')]:
+            self.assertEqual(value.val, pickle.loads(pickle.dumps(value)).val)
+
+        # The shared values come back as themselves
+        for value in [interpreter.Int(1), interpreter.TRUE, interpreter.FALSE, interpreter.VOID]:
+            self.assertIs(value, pickle.loads(pickle.dumps(value)))
+
+if __name__ == '__main__':
+    unittest.main()
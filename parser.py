@@ -1,97 +1,146 @@
 #!/usr/bin/python3
 
+import concurrent.futures
+import os
 import shutil
 from re import *
 
 from math import ceil
 import codecs
 
-def get_indexes(l, function):
-    return [i for i, e in enumerate(l) if function(e)]
-
-
-def error(text):
-    spaces = ' ' * (shutil.get_terminal_size().columns - len(text) - len(file) - len(str(line_num)) - 10)
-    raise Exception(f'\033[38;5;52m\033[48;5;9m▲ Error: {text}{spaces}{file}\033[38;5;255m:\033[38;5;52m{line_num}\033[0m')
-
-
-def add_extra_perrs(splitted):
-    if type(splitted).__name__ == 'dict':
-        return splitted
-    if len(splitted) == 3:
-        return [add_extra_perrs(splitted[0]), splitted[1], add_extra_perrs(splitted[2])]
-    if len(splitted) == 2:
-        return [splitted[0], add_extra_perrs(splitted[1])]
-    if len(splitted) == 1:
-        return add_extra_perrs(splitted[0])
-    minus = 0
-    for i, x in enumerate(splitted):
-        if x['type'] in ['method', 'subscript']:
-            splitted[x - 1: x + 1] = [[splitted[x - 1: x + 1]]]
-            minus += 1
-    for opers in pemdas:
-        minus = 0
-        for i in get_indexes(splitted, lambda e: 'operation' in e and e['operation'] in opers):
-            if splitted[i - minus]['operation'] in SingleOperation.operators:
-                splitted[i + 1 - minus] = add_extra_perrs(splitted[i + 1 - minus])
-                splitted[i - minus:i + 2 - minus] = [[splitted[i - minus:i + 2 - minus]]]
-                minus += 1
-            else:
-                splitted[i - 1 - minus] = add_extra_perrs(splitted[i - 1 - minus])
-                splitted[i + 1 - minus] = add_extra_perrs(splitted[i + 1 - minus])
-                splitted[i - 1 - minus:i + 2 - minus] = [splitted[i - 1 - minus:i + 2 - minus]]
-                minus += 2
-    return splitted
-
-def classify(splitted):
-    if type(splitted).__name__ == 'dict':
-        return splitted['datatype'](splitted['data'])
-    if len(splitted) == 1:
-        return classify(splitted[0])
-    if len(splitted) == 2:
-        if splitted[1]['type'] == 'method':
-            return BuiltInMethod(splitted[0], splitted[1]['text'])
-        elif splitted[1]['type'] == 'subscript':
-            return SubScript(classify(splitted[0]), splitted[1]['text'])
-        else:
-            return SingleOperation(splitted[0]['operation'], classify(splitted[1]))
-    if len(splitted) != 3:
-        error('len(splitted) != 3')
-    return Operation(splitted[1]['operation'], classify(splitted[0]), classify(splitted[2]))
+terminal_columns = None
+
+
+class ParseError(Exception):
+    """Invalid source. Parser.parse fills in the file and line as the error leaves it."""
+
+    def __init__(self, text, column=None, file=None, line=None):
+        super().__init__(text)
+        self.text = text
+        self.column = column
+        self.file = file
+        self.line = line
+
+    def __reduce__(self):
+        # So errors keep where they happened when parse_many sends them back from a worker
+        return ParseError, (self.text, self.column, self.file, self.line)
+
+    def __str__(self):
+        global terminal_columns
+        if self.line is None:
+            return self.text
+        if terminal_columns is None:
+            # Asked for once, rather than on every error
+            terminal_columns = shutil.get_terminal_size().columns
+        where = f'{self.line}' if self.column is None else f'{self.line}:{self.column}'
+        spaces = ' ' * (terminal_columns - len(self.text) - len(self.file) - len(where) - 10)
+        return f'\033[38;5;52m\033[48;5;9m▲ Error: {self.text}{spaces}{self.file}\033[38;5;255m:\033[38;5;52m{where}\033[0m'
+
+
+def error(text, column=None):
+    raise ParseError(text, column)
+
+
+class Token:
+    # column counts from 0 at the start of the source line
+    def __init__(self, type, text, column):
+        self.type = type
+        self.text = text
+        self.column = column
+
+    def __repr__(self):
+        return f'Token({self.type!r}, {self.text!r}, {self.column})'
+
+
+token_pattern = compile(r'''
+    (?P<space>\s+)
+  | (?P<float>\d+\.\d+(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+)
+  | (?P<int>\d+)
+  | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<name>[A-Za-z][A-Za-z0-9]*)
+  | (?P<op>\.\.\.|[=!*/+\-^%]=|[=+\-*/^%()\[\],.])
+''', VERBOSE)
+
+keywords = {
+    'True': 'bool',
+    'False': 'bool',
+    'not': 'op',
+    'and': 'op',
+    'or': 'op',
+    'xor': 'op',
+}
+
+
+def tokenize(text, column=0):
+    # column is where text starts in its line
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = token_pattern.match(text, pos)
+        if match is None:
+            error(f'Unexpected character {text[pos]!r}', column + pos + 1)
+        if match.lastgroup != 'space':
+            tokens.append(Token(keywords.get(match.group(), match.lastgroup), match.group(), column + pos))
+        pos = match.end()
+    return tokens
+
+
+def closing(tokens, start):
+    perrs = 0
+    for i in range(start, len(tokens)):
+        if tokens[i].type != 'op':
+            continue
+        if tokens[i].text in ['(', '[']:
+            perrs += 1
+        elif tokens[i].text in [')', ']']:
+            perrs -= 1
+            if perrs == 0:
+                return i
+    error(f'Unmatched {tokens[start].text!r}')
+
+
+def split_tokens(tokens, separator):
+    if len(tokens) == 0:
+        return []
+    parts = [[]]
+    perrs = 0
+    for token in tokens:
+        if token.type == 'op':
+            if token.text in ['(', '[']:
+                perrs += 1
+            elif token.text in [')', ']']:
+                perrs -= 1
+            elif perrs == 0 and token.text == separator:
+                parts.append([])
+                continue
+        parts[-1].append(token)
+    return parts
+
+
+def is_op(tokens, i, text):
+    return i < len(tokens) and tokens[i].type == 'op' and tokens[i].text == text
+
+
+def to_node(value):
+    # value.to_dict(), tagged with the 1-based column Expression found value at
+    ans = value.to_dict()
+    if type(ans) is dict and hasattr(value, 'column'):
+        ans['column'] = value.column
+    return ans
+
+
 class FunctionCall:
-    def __init__(self, text):
-        if not FunctionCall.valid(text):
+    def __init__(self, tokens):
+        if not FunctionCall.valid(tokens):
             error('Not a Function')
-        self.text = text.strip()
-        self.func_name = findall(r'^[A-Za-z][A-Za-z0-9]*\(', text)[0][:-1]
+        self.func_name = tokens[0].text
         self.args = []
         self.kwargs = {}
-        current = ''
-        perrs = 0
-        for char in text[len(self.func_name) + 1:-1]:
-            if char in ['(', '[']:
-                perrs += 1
-                current += char
-            elif char in [')', ']']:
-                perrs -= 1
-                current += char
-            elif char == ',' and perrs == 0:
-                if '=' in current:
-                    arg_name, value = findall('^ *([a-zA-Z][a-zA-Z0-9]*) *= *(.*) *$', current)[0]
-                    self.kwargs[arg_name] = value
-                else:
-                    self.args.append(current.strip())
-                current = ''
-            else:
-                current += char
-        if current.strip() != '':
-            if '=' in current:
-                arg_name, value = findall('^ *([a-zA-Z][a-zA-Z0-9]*) *= *(.*) *$', current)[0]
-                self.kwargs[arg_name] = value
+        for arg in split_tokens(tokens[2:-1], ','):
+            if len(arg) > 2 and arg[0].type == 'name' and is_op(arg, 1, '='):
+                self.kwargs[arg[0].text] = Expression(arg[2:]).to_dict()
             else:
-                self.args.append(current.strip())
-        self.args = [Expression(x).to_dict() for x in self.args]
-        self.kwargs = {arg_name: Expression(value).to_dict() for arg_name, value in self.kwargs.items()}
+                self.args.append(Expression(arg).to_dict())
 
     def to_dict(self):
         return {
@@ -105,20 +154,8 @@ class FunctionCall:
         }
 
     @staticmethod
-    def valid(text):
-        if search('^[A-Za-z][A-Za-z0-9]*\(.*\)$', text.strip()):
-            func_name = findall('^[A-Za-z][A-Za-z0-9]*\(', text.strip())[0][:-1]
-            perrs = 0
-            for char in text.strip()[len(func_name) + 1:-1]:
-                if char == '(':
-                    perrs += 1
-                elif char == ')':
-                    perrs -= 1
-                if perrs < 0:
-                    return False
-            if perrs == 0:
-                return True
-        return False
+    def valid(tokens):
+        return len(tokens) > 2 and tokens[0].type == 'name' and is_op(tokens, 1, '(') and closing(tokens, 1) == len(tokens) - 1
 
 
 class BuiltInFunction:
@@ -128,26 +165,22 @@ class BuiltInFunction:
         'int': ['value'],
         'float': ['value'],
         'string': ['value'],
-        'typeof': ['value']
+        'typeof': ['value'],
+        'chan': ['size'],
+        'sleep': ['ms'],
+        'timer': ['ms'],
+        'now': []
     }
 
-    def __init__(self, text):
-        if not BuiltInFunction.valid(text):
+    def __init__(self, tokens):
+        if not BuiltInFunction.valid(tokens):
             error('Not a Built in Function')
-        self.text = text.strip()
-        self.func_name = findall(r'^[A-Za-z][A-Za-z0-9]*\(', text)[0][:-1]
-        self.args = ['']
-        perrs = 0
-        for char in text[len(self.func_name) + 1:-1]:
-            if char in ['(', '[']:
-                perrs += 1
-            elif char in [')', ']']:
-                perrs -= 1
-            elif perrs == 0 and char == ',':
-                self.args.append('')
-            if char != ',' or perrs != 0:
-                self.args[-1] += char
-        self.args = {BuiltInFunction.functions[self.func_name][i]: Expression(val).to_dict() for i, val in enumerate(self.args)}
+        self.func_name = tokens[0].text
+        args = split_tokens(tokens[2:-1], ',')
+        names = BuiltInFunction.functions[self.func_name]
+        if len(args) > len(names):
+            error(f'{self.func_name} takes at most {len(names)} arguments')
+        self.args = {names[i]: Expression(val).to_dict() for i, val in enumerate(args)}
 
     def to_dict(self):
         ans = {
@@ -157,27 +190,14 @@ class BuiltInFunction:
         return ans
 
     @staticmethod
-    def valid(text):
-        if search('^[A-Za-z][A-Za-z0-9]*\(.*\)$', text.strip()):
-            func_name = findall('^[A-Za-z][A-Za-z0-9]*\(', text.strip())[0][:-1]
-            if func_name in BuiltInFunction.functions:
-                perrs = 0
-                for char in text.strip()[len(func_name) + 1:-1]:
-                    if char == '(':
-                        perrs += 1
-                    elif char == ')':
-                        perrs -= 1
-                    if perrs < 0:
-                        return False
-                if perrs == 0:
-                    return True
-        return False
+    def valid(tokens):
+        return FunctionCall.valid(tokens) and tokens[0].text in BuiltInFunction.functions
 
 class Bool:
-    def __init__(self, text):
-        if not Bool.valid(text):
+    def __init__(self, tokens):
+        if not Bool.valid(tokens):
             error('Invaild Bool')
-        self.value = text.strip() == 'True'
+        self.value = tokens[0].text == 'True'
 
     def to_dict(self):
         return {
@@ -186,14 +206,14 @@ class Bool:
         }
 
     @staticmethod
-    def valid(text):
-        return text.strip() == 'True' or text.strip() == 'False'
+    def valid(tokens):
+        return len(tokens) == 1 and tokens[0].type == 'bool'
 
 class Var:
-    def __init__(self, name):
-        if not Var.valid(name):
-            error(f'{name} is not a valid variable name')
-        self.value = name
+    def __init__(self, tokens):
+        if not Var.valid(tokens):
+            error(f'{"".join(x.text for x in tokens)} is not a valid variable name')
+        self.value = tokens[0].text
 
     def to_dict(self):
         return {
@@ -202,15 +222,23 @@ class Var:
         }
 
     @staticmethod
-    def valid(value):
-        return bool(search('^[a-zA-Z][a-zA-Z0-9]*$', value))
+    def valid(tokens):
+        return len(tokens) == 1 and tokens[0].type == 'name'
+
+
+def number_text(tokens, type):
+    if len(tokens) == 1 and tokens[0].type == type:
+        return tokens[0].text
+    if len(tokens) == 2 and is_op(tokens, 0, '-') and tokens[1].type == type:
+        return '-' + tokens[1].text
+    return None
 
 
 class Int:
-    def __init__(self, value):
-        if not Int.valid(value):
-            error(f'{value} is not a valid int')
-        self.value = int(value)
+    def __init__(self, tokens):
+        if not Int.valid(tokens):
+            error(f'{"".join(x.text for x in tokens)} is not a valid int')
+        self.value = int(number_text(tokens, 'int'))
 
     def to_dict(self):
         return {
@@ -219,20 +247,14 @@ class Int:
         }
 
     @staticmethod
-    def valid(value):
-        try:
-            int(value)
-            return True
-        except ValueError:
-            return False
-        except TypeError:
-            return False
+    def valid(tokens):
+        return number_text(tokens, 'int') is not None
 
 class String:
-    def __init__(self, value):
-        if not String.valid(value):
+    def __init__(self, tokens):
+        if not String.valid(tokens):
             error('invalid string')
-        self.value = codecs.decode(value[1:-1], 'unicode_escape')
+        self.value = codecs.decode(tokens[0].text[1:-1], 'unicode_escape')
 
     def to_dict(self):
         return {
@@ -241,13 +263,13 @@ class String:
             }
 
     @staticmethod
-    def valid(value):
-        return search(r'''^("|')(\\.|(?:(?!(\1|\\)).))*\1$''', value)
+    def valid(tokens):
+        return len(tokens) == 1 and tokens[0].type == 'string'
 class Float:
-    def __init__(self, value):
-        if not Float.valid(value):
-            error(f'{value} is not a valid float')
-        self.value = float(value)
+    def __init__(self, tokens):
+        if not Float.valid(tokens):
+            error(f'{"".join(x.text for x in tokens)} is not a valid float')
+        self.value = float(number_text(tokens, 'float'))
 
     def to_dict(self):
         return {
@@ -256,79 +278,40 @@ class Float:
         }
 
     @staticmethod
-    def valid(value):
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
-        except TypeError:
-            return False
+    def valid(tokens):
+        return number_text(tokens, 'float') is not None
 
 class Range:
-    def __init__(self, value):
-        if not Range.valid(value):
-            error(f'{value} is not a valid Range')
-        brackets = 0
-        for i, char in enumerate(value[1:-1]):
-            if char == '[':
-                brackets += 1
-            elif char == ']':
-                brackets -= 1
-            elif brackets == 0 and value[i:i + 3] == '...':
-                self.start = value[1:i]
-                self.end = value[i + 3:-1]
+    def __init__(self, tokens):
+        if not Range.valid(tokens):
+            error('Not a valid Range')
+        self.start, rest = split_tokens(tokens[1:-1], '...')
+        # An optional step follows the end: [start...end, step]
+        self.end, *self.step = split_tokens(rest, ',')
 
     def to_dict(self):
-        return {
+        ans = {
             'type': 'range',
             'start': Expression(self.start).to_dict(),
             'end': Expression(self.end).to_dict()
         }
+        if self.step:
+            ans['step'] = Expression(self.step[0]).to_dict()
+        return ans
 
     @staticmethod
-    def valid(value):
-        if len(value.strip()) < 7:
-            return False
-        if value[0] != '[':
-            return False
-        if value[-1] != ']':
+    def valid(tokens):
+        if not List.valid(tokens):
             return False
-        if '...' not in value[1:-1]:
-            return False
-        brackets = 0
-        found_dots = False
-        for i, char in enumerate(value[1:-1]):
-            if char == '[':
-                brackets += 1
-            elif char == ']':
-                brackets -= 1
-            if brackets < 0:
-                return False
-            elif brackets == 0 and value[i:i + 3] == '...':
-                found_dots = True
-        return found_dots
+        parts = split_tokens(tokens[1:-1], '...')
+        return len(parts) == 2 and len(split_tokens(parts[1], ',')) in (1, 2)
 
 
 class List:
-    def __init__(self, value):
-        if not List.valid(value):
+    def __init__(self, tokens):
+        if not List.valid(tokens):
             error('Invalid List')
-        if value[1:-1].strip() != "":
-            self.values = ['']
-            perrs = 0
-            for char in value.strip()[1:-1]:
-                if char in ['[', '(']:
-                    perrs += 1
-                elif char in [']', ')']:
-                    perrs -= 1
-                elif perrs == 0 and char == ',':
-                    self.values.append('')
-                if char != ',' or perrs != 0:
-                    self.values[-1] += char
-            self.values = [Expression(exp).to_dict() for exp in self.values]
-        else:
-            self.values = []
+        self.values = [Expression(value).to_dict() for value in split_tokens(tokens[1:-1], ',')]
 
     def to_dict(self):
         return {
@@ -337,51 +320,32 @@ class List:
         }
 
     @staticmethod
-    def valid(value):
-        if not (value.strip()[0] == '[' and value.strip()[-1] == ']'):
-            return False
-        bracs = 0
-        for char in value.strip()[1:-1]:
-            if char == '[':
-                bracs += 1
-            elif char == ']':
-                bracs -= 1
-            if bracs < 0:
-                return False
-        return True
+    def valid(tokens):
+        return len(tokens) > 1 and is_op(tokens, 0, '[') and closing(tokens, 0) == len(tokens) - 1
 
 class SubScript:
-    def __init__(self, target, text):
-        if not SubScript.valid(text):
+    def __init__(self, target, tokens):
+        if not SubScript.valid(tokens):
             error('Not valid subscript')
-        self.text = text.strip()
+        self.tokens = tokens
         self.target = target
 
     def to_dict(self):
         return {
             'type': 'subscript',
-            'target': self.target.to_dict(),
-            'index': Expression(self.text[1:-1]).to_dict()
+            'target': to_node(self.target),
+            'index': self.index()
         }
 
+    def index(self):
+        # x[start...end] slices x with a range
+        if Range.valid(self.tokens):
+            return Range(self.tokens).to_dict()
+        return Expression(self.tokens[1:-1]).to_dict()
+
     @staticmethod
-    def valid(text):
-        text = text.strip()
-        if not len(text) > 2:
-            return False
-        if not (text[0] == '[' and text[-1] == ']'):
-            return False
-        bracs = 0
-        for char in text[1:-1]:
-            if char == '[':
-                bracs += 1
-            if char == ']':
-                bracs
-            if bracs < 0:
-                return False
-        if bracs == 0:
-            return True
-        return False
+    def valid(tokens):
+        return len(tokens) > 2 and List.valid(tokens)
 
 
 class BuiltInMethod:
@@ -392,6 +356,16 @@ class BuiltInMethod:
                 'value'
             ]
         },
+        'close': {
+            'type': 'close',
+            'inputs': []
+        },
+        'contains': {
+            'type': 'contains',
+            'inputs': [
+                'value'
+            ]
+        },
         'insert': {
             'type': 'insert',
             'inputs': [
@@ -408,53 +382,48 @@ class BuiltInMethod:
             'inputs': [
                 'index'
             ]
+        },
+        'receive': {
+            'type': 'receive',
+            'inputs': []
+        },
+        'reverse': {
+            'type': 'reverse',
+            'inputs': []
+        },
+        'send': {
+            'type': 'send',
+            'inputs': [
+                'value'
+            ]
         }
     }
 
-    def __init__(self, target, text):
-        if not BuiltInMethod.valid(text):
+    def __init__(self, target, tokens):
+        if not BuiltInMethod.valid(tokens):
             error('Invalid Method')
         self.target = target
-        self.method = findall('^.[a-zA-Z][a-zA-Z0-9]*\(', text)[0][1:-1]
+        self.method = tokens[1].text
         self.type = BuiltInMethod.methods[self.method]['type']
-        if len(BuiltInMethod.methods[self.method]['inputs']) != 0:
-            self.args = ['']
-        else:
-            self.args = []
-        perrs = 0
-        for char in text[len(self.method) + 2:-1]:
-            if char in ['(', '[']:
-                perrs += 1
-            elif char in [')', ']']:
-                perrs -= 1
-            elif perrs == 0 and char == ',':
-                self.args.append('')
-            if char != ',' or perrs != 0:
-                self.args[-1] += char
-        self.args = {BuiltInMethod.methods[self.method]['inputs'][i]: Expression(val).to_dict() for i, val in enumerate(self.args)}
+        inputs = BuiltInMethod.methods[self.method]['inputs']
+        args = split_tokens(tokens[3:-1], ',')
+        if len(args) != len(inputs):
+            error(f'{self.method} takes {len(inputs)} arguments')
+        self.args = {inputs[i]: Expression(val).to_dict() for i, val in enumerate(args)}
 
     def to_dict(self):
         ans = {
             'type': self.type,
-            'target': classify(self.target).to_dict()
+            'target': to_node(self.target)
         }
         ans.update(self.args)
         return ans
 
     @staticmethod
-    def valid(text):
-        if search('^.[a-zA-Z][a-zA-Z0-9]*\(.*\)$', text):
-            method = findall('^.[a-zA-Z][a-zA-Z0-9]*\(', text)[0][1:-1]
-            if method in BuiltInMethod.methods:
-                perrs = 0
-                for char in text[len(method) + 1:]:
-                    if char == '(':
-                        perrs += 1
-                    elif char == ')':
-                        perrs -= 1
-                if perrs == 0:
-                    return True
-        return False
+    def valid(tokens):
+        return (len(tokens) > 3 and is_op(tokens, 0, '.') and tokens[1].type == 'name'
+                and tokens[1].text in BuiltInMethod.methods and is_op(tokens, 2, '(')
+                and closing(tokens, 2) == len(tokens) - 1)
 
 
 class Expression:
@@ -470,95 +439,85 @@ class Expression:
         Var
     ]
 
-    def __init__(self, text):
-        self.expression = text.strip()
-
-    def to_list(self):
-        splitted = []
-        start = 0
-        while True:
-            if start == len(self.expression.strip()):
-                break
-            for end in range(len(self.expression), 0, -1):
-                if self.expression[start:end].strip() in SingleOperation.operators:
-                    splitted.append({
-                        'type': 'single operation',
-                        'operation': self.expression[start:end].strip()
-                    })
-                    start = end
-            if self.expression[start] == '(':
-                perr = 0
-                for i in range(start, len(self.expression)):
-                    if self.expression[i] == '(':
-                        perr += 1
-                    elif self.expression[i] == ')':
-                        perr -= 1
-                    if perr == 0:
-                        splitted.append(Expression(self.expression[start + 1:i]).to_list())
-                        start = i + 1
-                        break
-            else:
-                if start == len(self.expression.strip()):
-                    break
-                for end in range(len(self.expression), 0, -1):
-                    if self.expression[start:end].strip() in SingleOperation.operators:
-                        splitted.append({
-                            'type': 'single operation',
-                            'operation': self.expression[start:end].strip()
-                        })
-                        start = end
-                for end in range(len(self.expression), 0, -1):
-                    for data_type in Expression.data_types:
-                        if data_type.valid(self.expression[start:end].strip()):
-                            splitted.append({
-                                'type': 'datatype',
-                                'data': self.expression[start:end].strip(),
-                                'datatype': data_type
-                            })
-                            start = end
-                            break
-                    else:
-                        continue
-                    break
-                else:
-                    error('Could not find valid data type')
-                while True:
-                    for end in range(len(self.expression), 0, -1):
-                        if BuiltInMethod.valid(self.expression[start:end].strip()):
-                            splitted.append({
-                                'type': 'method',
-                                'text': self.expression[start:end].strip()
-                            })
-                            start = end
-                            break
-                        elif SubScript.valid(self.expression[start:end]):
-                            splitted.append({
-                                'type': 'subscript',
-                                'text': self.expression[start:end].strip()
-                            })
-                            start = end
-                            break
-                    else:
-                        break
-            if start == len(self.expression.strip()):
-                break
-            for end in range(len(self.expression), 0, -1):
-                if self.expression[start:end].strip() in Operation.operators.keys():
-                    splitted.append({
-                        'type': 'operation',
-                        'operation': self.expression[start:end].strip()
-                    })
-                    start = end
+    def __init__(self, tokens, column=0):
+        if isinstance(tokens, str):
+            tokens = tokenize(tokens, column)
+        self.tokens = tokens
+        self.pos = 0
+
+    def operand_end(self, start):
+        tokens = self.tokens
+        if is_op(tokens, start, '-') and start + 1 < len(tokens) and tokens[start + 1].type in ['int', 'float']:
+            return start + 2
+        if is_op(tokens, start, '['):
+            return closing(tokens, start) + 1
+        if tokens[start].type == 'name' and is_op(tokens, start + 1, '('):
+            return closing(tokens, start + 1) + 1
+        if tokens[start].type != 'op':
+            return start + 1
+        error('Could not find valid data type')
+
+    def parse_operand(self):
+        tokens = self.tokens
+        if self.pos == len(tokens):
+            error('Expected a value')
+        token = tokens[self.pos]
+        if token.type == 'op' and token.text in SingleOperation.operators:
+            self.pos += 1
+            return located(SingleOperation(token.text, self.parse(binding_powers[token.text])), token)
+        if is_op(tokens, self.pos, '('):
+            self.pos += 1
+            value = self.parse(0)
+            if not is_op(tokens, self.pos, ')'):
+                error("Expected ')'")
+            self.pos += 1
+        else:
+            end = self.operand_end(self.pos)
+            for data_type in Expression.data_types:
+                if data_type.valid(tokens[self.pos:end]):
+                    value = located(data_type(tokens[self.pos:end]), token)
                     break
             else:
-                print(splitted, self.expression)
+                error('Could not find valid data type')
+            self.pos = end
+        while True:
+            if is_op(tokens, self.pos, '.') and is_op(tokens, self.pos + 2, '('):
+                end = closing(tokens, self.pos + 2) + 1
+                value = located(BuiltInMethod(value, tokens[self.pos:end]), tokens[self.pos])
+            elif is_op(tokens, self.pos, '['):
+                end = closing(tokens, self.pos) + 1
+                value = located(SubScript(value, tokens[self.pos:end]), tokens[self.pos])
+            else:
+                return value
+            self.pos = end
+
+    def parse(self, min_power):
+        tokens = self.tokens
+        value = self.parse_operand()
+        while self.pos < len(tokens) and not is_op(tokens, self.pos, ')'):
+            operation = tokens[self.pos].text
+            if tokens[self.pos].type != 'op' or operation not in Operation.operators:
                 error('Could not find valid operation')
-        return splitted
+            power = binding_powers[operation]
+            if power < min_power:
+                break
+            token = tokens[self.pos]
+            self.pos += 1
+            value = located(Operation(operation, value, self.parse(power + 1)), token)
+        return value
 
     def to_dict(self):
-        splitted = self.to_list()
-        splitted = add_extra_perrs(splitted)
-        return classify(splitted).to_dict()
+        self.pos = 0
+        value = self.parse(0)
+        if self.pos != len(self.tokens):
+            error(f'Unexpected {self.tokens[self.pos].text!r}', self.tokens[self.pos].column + 1)
+        return to_node(value)
+
+
+def located(value, token):
+    # Operations are found at their operator, everything else where it starts
+    value.column = token.column + 1
+    return value
 
 pemdas = [
     ['^'],
@@ -567,10 +526,12 @@ pemdas = [
     ['%'],
     ['==', '!='],
     ['not'],
-    ['and', 'or'],
-    ['=']
+    ['and', 'or', 'xor'],
+    ['=', '*=', '/=', '+=', '-=', '^=', '%=']
 ]
 
+binding_powers = {operation: len(pemdas) - i for i, opers in enumerate(pemdas) for operation in opers}
+
 class SingleOperation:
     operators = {
         'not': {
@@ -591,7 +552,7 @@ class SingleOperation:
     def to_dict(self):
         return {
             'type': SingleOperation.operators[self.operation]['name'],
-            'value': self.value.to_dict()
+            'value': to_node(self.value)
         }
 
     @staticmethod
@@ -616,7 +577,7 @@ class Operation:
             },
         '+': {
                 'name': 'add',
-                'types': [Int, Float, BuiltInFunction, Var]
+                'types': [Int, Float, String, BuiltInFunction, Var]
             },
         '-': {
                 'name': 'sub',
@@ -655,7 +616,7 @@ class Operation:
         '+=': {
             'name': 'addset',
             'type1': Var,
-            'types2': [Int, Float, BuiltInFunction, Var],
+            'types2': [Int, Float, String, BuiltInFunction, Var],
             'name1': 'target',
             'name2': 'value'
         },
@@ -704,8 +665,7 @@ class Operation:
 
     def __init__(self, operation, value1, value2):
         if not Operation.valid(operation, value1, value2):
-            print(Operation.valid(operation, value1, value2), operation, value1, value2, line_num)
-            raise Exception('test')
+            error(f'Invalid operands for {operation!r}')
         self.operation = operation
         self.value1 = value1
         self.value2 = value2
@@ -721,8 +681,8 @@ class Operation:
             name2 = Operation.operators[self.operation]['name2']
         ans = {
             'type': Operation.operators[self.operation]['name'],
-            name1: self.value1.to_dict(),
-            name2: self.value2.to_dict()
+            name1: to_node(self.value1),
+            name2: to_node(self.value2)
         }
         if 'prop1' in Operation.operators[self.operation]:
             prop1 = Operation.operators[self.operation]['prop1']
@@ -756,13 +716,24 @@ class Operation:
         if 'types2' in data:
             for data_type in data['types2']:
                 valids2.append(data_type)
+        # A method result or an element is a value like any variable, but only a variable can be assigned to
+        if Var in valids1 and 'name1' not in data:
+            valids1.extend([BuiltInMethod, SubScript])
+        if Var in valids2:
+            valids2.extend([BuiltInMethod, SubScript])
         return isinstance(value1, tuple(valids1)) and isinstance(value2, tuple(valids2))
 
+def suffix(parser, text, part):
+    # An Expression for part, which is the end of the line text after its keyword
+    return Expression(part, parser.column + len(text.rstrip()) - len(part))
+
+
 class ForLoop:
     def __init__(self, text, parser):
         if not self.valid(text):
             error('For Loop Not Valid')
         self.parser = parser
+        self.text = text
         self.var_name = findall('(?<=for) +[A-Za-z][A-Za-z0-9]* ', text)[0].strip()
         self.list = text[len(findall('^for +[A-Za-z][A-Za-z0-9]* +of +[^ ]', text)[0]) - 1:].strip()
 
@@ -771,7 +742,7 @@ class ForLoop:
         self.parser.spot[-1].append({
             'type': 'loop',
             'var': self.var_name,
-            'list': Expression(self.list).to_dict(),
+            'list': suffix(self.parser, self.text, self.list).to_dict(),
             'code': code
         })
         self.parser.spot.append(code)
@@ -800,7 +771,7 @@ class IfStatement:
             'type': 'switch',
             'cases': [
                 {
-                    'cond': Expression(self.expression).to_dict(),
+                    'cond': suffix(self.parser, self.text, self.expression).to_dict(),
                     'code': code
                 }
             ]
@@ -819,12 +790,13 @@ class ElseIfStatement:
         if not ElseIfStatement.valid(text):
             error('invalid elif statement')
         self.parser = parser
+        self.text = text
         self.expression = text[4:].strip()
 
     def do(self):
         code = []
         self.parser.spot[-1][-1]['cases'].append({
-            'cond': Expression(self.expression).to_dict(),
+            'cond': suffix(self.parser, self.text, self.expression).to_dict(),
             'code': code
         })
         self.parser.spot.append(code)
@@ -956,7 +928,7 @@ class Case:
     def do(self):
         code = []
         self.parser.spot[-2][-1]['cases'].append({
-            'cond': Expression(self.expression).to_dict(),
+            'cond': suffix(self.parser, self.text, self.expression).to_dict(),
             'code': code
         })
         self.parser.spot_commands.append([])
@@ -970,6 +942,7 @@ class Return:
     def __init__(self, text, parser):
         if not Return.valid(text):
             error('not a valid return')
+        self.text = text
         self.value = text[7:].strip()
         self.parser = parser
 
@@ -981,7 +954,7 @@ class Return:
         else:
             self.parser.spot[-1].append({
                 'type': 'return',
-                'value': Expression(self.value).to_dict()
+                'value': suffix(self.parser, self.text, self.value).to_dict()
             })
 
     @staticmethod
@@ -989,60 +962,274 @@ class Return:
         return text.strip().startswith('return ') or text.strip() == 'return'
 
 
+class Spawn:
+    def __init__(self, text, parser):
+        if not Spawn.valid(text):
+            error('invalid spawn')
+        self.parser = parser
+        self.call = suffix(parser, text, text[5:].strip()).to_dict()
+        if self.call['type'] != 'call':
+            error('spawn needs a function call')
+
+    def do(self):
+        self.parser.spot[-1].append({
+            'type': 'spawn',
+            'call': self.call
+        })
+
+    @staticmethod
+    def valid(text):
+        return bool(search(r'^spawn +[A-Za-z][A-Za-z0-9]* *\(.*\) *$', text))
+
+
+class Block:
+    """The lines of one top-level statement, with any elif or else that continues it."""
+
+    def __init__(self, start, lines):
+        # Index of the first line in the source
+        self.start = start
+        self.lines = lines
+        # The top-level statements the lines parse to, once they have been parsed
+        self.statements = None
+        # spot_commands[0] after the last line, which says whether an elif or else can follow
+        self.commands = None
+
+
+def shift_lines(node, delta):
+    # Moves the line every node inside node was tagged with by delta
+    if type(node) is list:
+        for item in node:
+            shift_lines(item, delta)
+    elif type(node) is dict:
+        if 'type' in node and type(node.get('line')) is int:
+            node['line'] += delta
+        for value in node.values():
+            if type(value) in (list, dict):
+                shift_lines(value, delta)
+
+
 class Parser:
+    # Bump whenever the shape of the parse tree changes so cached parses are discarded
+    version = 5
+
     commands = [
         ForLoop,
         IfStatement,
         Function,
-        Switch
+        Switch,
+        Spawn
     ]
 
-    def __init__(self, file, indent='    '):
+    def __init__(self, file, indent='    ', codetext=None):
         self.area_commands = None
         self.spot_commands = None
+        # Only used to say where errors are when the source did not come from a file
         self.file = file
-        self.codetext = open(file).read()
+        self.codetext = open(file).read() if codetext is None else codetext
         self.indent = indent
+        # Lines still to come, for a parser reading a stream
+        self._stream = None
         self.parsed = None
         self.spot = None
+        # Where the text of the line being parsed starts, after its indentation
+        self.column = 0
+        # The source split into Blocks, which reparse() parses again only where they changed
+        self.blocks = None
+        # Where in parsed the statements of the block being read begin
+        self._block_begin = 0
+
+    @classmethod
+    def from_string(cls, source, name='<string>', indent='    '):
+        return cls(name, indent, source)
+
+    @classmethod
+    def from_stream(cls, fp, name=None, indent='    '):
+        """A parser for the lines fp yields, read as statements() asks for them."""
+        parser = cls(getattr(fp, 'name', '<stream>') if name is None else name, indent, '')
+        parser._stream = fp
+        return parser
 
     def parse(self):
-        global line_num
-        global file
-        file = self.file
+        for _ in self.statements():
+            pass
+        return self.parsed
+
+    def statements(self):
+        """Yields each top-level statement as soon as it is complete.
+
+        That is once its line is parsed, or for a statement with a block, the line that ends
+        the block. An if is held until a line shows that no elif or else follows it.
+        """
         self.parsed = []
         self.spot = [self.parsed]
         self.spot_commands = [[]]
         self.area_commands = [Parser.commands]
-        line_num = 1
-        for line in self.codetext.split('\n'):
-            indention = 0
-            for _ in range(ceil(len(line) / len(self.indent)-1)):
-                if line[indention * len(self.indent):(indention + 1) * len(self.indent)] != self.indent:
-                    break
-                indention += 1
-            del self.spot[indention + 1:]
-            del self.area_commands[indention + 1:]
-            del self.spot_commands[indention + 1:]
-            line = line[indention * len(self.indent):]
-            if '#' in line:
-                line = line[:line.index('#')]
-            if line == '':
-                continue
-            for command in self.spot_commands[indention]:
-                if command.valid(line):
-                    command(line, self).do()
-                    break
-            else:
-                for commands in reversed(self.area_commands):
-                    for command in commands:
-                        if command.valid(line):
-                            command(line, self).do()
-                            break
-                    else:
-                        continue
-                    break
-                else:
-                    self.spot[-1].append(Expression(line).to_dict())
-            line_num += 1
+        self.blocks = []
+        done = 0
+        for line_num, line in enumerate(self._lines(), 1):
+            if not self.blocks or self._starts_block(line):
+                self._close_block()
+                self.blocks.append(Block(line_num - 1, []))
+            self.blocks[-1].lines.append(line)
+            self._line(line, line_num)
+            complete = len(self.parsed)
+            if len(self.spot) > 1 or (self.parsed and self.parsed[-1]['type'] == 'switch' and 'default' not in self.parsed[-1]):
+                # Its block is still open, or it is an if without an else
+                complete -= 1
+            while done < complete:
+                yield self.parsed[done]
+                done += 1
+        self._close_block()
+        yield from self.parsed[done:]
+
+    def _close_block(self):
+        # The block being read has ended, and its statements are all parsed after it began
+        if self.blocks:
+            block = self.blocks[-1]
+            block.statements = self.parsed[self._block_begin:]
+            block.commands = tuple(self.spot_commands[0])
+        self._block_begin = len(self.parsed)
+
+    def reparse(self, start, end, text):
+        """Replaces codetext[start:end] with text and returns the new parse tree.
+
+        Only the top-level blocks whose lines changed are parsed again. The statements of
+        the others are reused as they are, and their line numbers moved if lines were added
+        or taken away above them. If the new source does not parse, the parser is left as
+        it was.
+        """
+        if self._stream is not None:
+            raise ValueError('a stream is gone once it is parsed')
+        if self.blocks is None:
+            self.parse()
+
+        codetext = self.codetext[:start] + text + self.codetext[end:]
+        old = self.blocks
+        new = []
+        for i, line in enumerate(codetext.split('\n')):
+            if not new or self._starts_block(line):
+                new.append(Block(i, []))
+            new[-1].lines.append(line)
+
+        # Blocks before and after the edit whose lines are all the same
+        head = 0
+        while head < min(len(old), len(new)) and old[head].lines == new[head].lines:
+            new[head] = old[head]
+            head += 1
+        tail = 0
+        while tail < min(len(old), len(new)) - head and old[-1 - tail].lines == new[-1 - tail].lines:
+            tail += 1
+
+        commands = old[head - 1].commands if head else ()
+        for i in range(head, len(new)):
+            j = len(old) - len(new) + i
+            if len(new) - i <= tail:
+                previous = old[j]
+                before = old[j - 1].commands if j else ()
+                # Reused only if whether an elif or else may follow what comes before is the same too
+                if before == commands:
+                    if previous.start != new[i].start:
+                        shift_lines(previous.statements, new[i].start - previous.start)
+                        previous.start = new[i].start
+                    new[i] = previous
+                    commands = previous.commands
+                    continue
+            new[i].statements, new[i].commands = self._parse_block(new[i], commands)
+            commands = new[i].commands
+
+        self.codetext = codetext
+        self.blocks = new
+        self.parsed = [statement for block in new for statement in block.statements]
         return self.parsed
+
+    def _parse_block(self, block, commands):
+        statements = []
+        self.spot = [statements]
+        self.spot_commands = [list(commands)]
+        self.area_commands = [Parser.commands]
+        for line_num, line in enumerate(block.lines, block.start + 1):
+            self._line(line, line_num)
+        return statements, tuple(self.spot_commands[0])
+
+    def _starts_block(self, line):
+        # Every top-level line starts a block, except an elif or else continuing an if
+        if self._indention(line) != 0:
+            return False
+        if '#' in line:
+            line = line[:line.index('#')]
+        return line != '' and not ElseIfStatement.valid(line) and not ElseStatement.valid(line)
+
+    def _lines(self):
+        if self._stream is None:
+            return self.codetext.split('\n')
+        return (line[:-1] if line.endswith('\n') else line for line in self._stream)
+
+    def _indention(self, line):
+        indention = 0
+        for _ in range(ceil(len(line) / len(self.indent)-1)):
+            if line[indention * len(self.indent):(indention + 1) * len(self.indent)] != self.indent:
+                break
+            indention += 1
+        return indention
+
+    def _line(self, line, line_num):
+        try:
+            self._parse_line(line, line_num)
+        except ParseError as e:
+            e.file = self.file
+            e.line = line_num
+            raise
+
+    def _parse_line(self, line, line_num):
+        indention = self._indention(line)
+        del self.spot[indention + 1:]
+        del self.area_commands[indention + 1:]
+        del self.spot_commands[indention + 1:]
+        self.column = indention * len(self.indent)
+        line = line[self.column:]
+        if '#' in line:
+            line = line[:line.index('#')]
+        if line == '':
+            return
+        # Whatever this line adds to its block is tagged with where it starts, for profiles and errors
+        block = self.spot[-1]
+        count = len(block)
+        for command in self.spot_commands[indention]:
+            if command.valid(line):
+                command(line, self).do()
+                break
+        else:
+            for commands in reversed(self.area_commands):
+                for command in commands:
+                    if command.valid(line):
+                        command(line, self).do()
+                        break
+                else:
+                    continue
+                break
+            else:
+                self.spot[-1].append(Expression(line, self.column).to_dict())
+        for node in block[count:]:
+            if type(node) is dict:
+                node['line'] = line_num
+                node['column'] = self.column + 1
+
+
+def _parse_path(path):
+    return Parser(path).parse()
+
+
+def parse_many(paths, workers=None, threads=False):
+    """Parses each of paths on a pool of workers and returns their parse trees in order.
+
+    The pool is of processes unless threads is set: parsing is pure Python, so threads only
+    help while they wait on reading files. The first file that fails raises its ParseError.
+    """
+    paths = list(paths)
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return [_parse_path(path) for path in paths]
+
+    pool = concurrent.futures.ThreadPoolExecutor if threads else concurrent.futures.ProcessPoolExecutor
+    with pool(workers) as executor:
+        return list(executor.map(_parse_path, paths))
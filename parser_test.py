@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+
+import os
+import parser
+import pickle
+import tempfile
+import threading
+import unittest
+
+class TestParser(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write(self, name, text):
+        filename = os.path.join(self._dir.name, name)
+        with open(filename, 'w') as fh:
+            fh.write(text)
+        return filename
+
+    def test_error_location(self):
+        filename = self.write('bad.🔥🦬', 'x = 1\n\nprint(x))\n')
+
+        with self.assertRaises(parser.ParseError) as cm:
+            parser.Parser(filename).parse()
+
+        e = cm.exception
+        self.assertEqual((filename, 3, 9), (e.file, e.line, e.column))
+        self.assertIn(f'{filename}\033[38;5;255m:\033[38;5;52m3:9', str(e))
+
+        copy = pickle.loads(pickle.dumps(e))
+        self.assertEqual((e.text, e.file, e.line, e.column), (copy.text, copy.file, copy.line, copy.column))
+
+    def test_threads_keep_their_own_locations(self):
+        # Each file fails on a different line; every thread has to report its own
+        filenames = [self.write(f'{i}.🔥🦬', 'x = 1\n' * i + 'x = )\n') for i in range(8)]
+        lines = {}
+
+        def parse(i):
+            for _ in range(50):
+                try:
+                    parser.Parser(filenames[i]).parse()
+                except parser.ParseError as e:
+                    lines.setdefault(i, set()).add((e.file, e.line))
+
+        threads = [threading.Thread(target=parse, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({i: {(filenames[i], i + 1)} for i in range(8)}, lines)
+
+    def test_parse_many(self):
+        filenames = [self.write(f'{i}.🔥🦬', f'print({i})\n') for i in range(5)]
+        expected = [parser.Parser(filename).parse() for filename in filenames]
+
+        self.assertEqual(expected, parser.parse_many(filenames, workers=1))
+        self.assertEqual(expected, parser.parse_many(filenames, workers=3, threads=True))
+        self.assertEqual(expected, parser.parse_many(filenames, workers=2))
+        self.assertEqual([], parser.parse_many([], workers=2))
+
+        bad = self.write('bad.🔥🦬', '\nprint(\n')
+        with self.assertRaises(parser.ParseError) as cm:
+            parser.parse_many(filenames + [bad], workers=2)
+        self.assertEqual((bad, 2), (cm.exception.file, cm.exception.line))
+
+    def test_from_string(self):
+        source = 'fun f(n)\n    return n * 2\nprint(f(3))\n'
+        filename = self.write('f.🔥🦬', source)
+
+        self.assertEqual(parser.Parser(filename).parse(), parser.Parser.from_string(source).parse())
+
+        with self.assertRaises(parser.ParseError) as cm:
+            parser.Parser.from_string('x = )\n', name='<socket>').parse()
+        self.assertEqual(('<socket>', 1), (cm.exception.file, cm.exception.line))
+
+    def test_from_stream_yields_closed_blocks(self):
+        source = [
+            'x = 1\n',
+            'if x == 1\n',
+            '    print(1)\n',
+            'else\n',
+            '    print(2)\n',
+            '\n',
+            'print(3)\n',
+        ]
+        read = []
+
+        def stream():
+            for line in source:
+                read.append(line)
+                yield line
+
+        seen = []
+        for statement in parser.Parser.from_stream(stream(), '<stdin>').statements():
+            seen.append((statement['type'], statement['line'], len(read)))
+
+        # The if has its else, so it is complete once the blank line ends the else's block
+        self.assertEqual([('setvar', 1, 1), ('switch', 2, 6), ('print', 7, 7)], seen)
+        self.assertEqual(parser.Parser.from_string(''.join(source)).parse(), parser.Parser.from_stream(iter(source)).parse())
+
+        with open(self.write('s.🔥🦬', ''.join(source))) as fh:
+            self.assertEqual(fh.name, parser.Parser.from_stream(fh).file)
+
+        with self.assertRaises(parser.ParseError) as cm:
+            list(parser.Parser.from_stream(iter(['print(1)\n', 'print(\n'])).statements())
+        self.assertEqual(('<stream>', 2), (cm.exception.file, cm.exception.line))
+
+    def test_from_stream_yields_before_reading_on(self):
+        source = [
+            'print(1)\n',
+            'fun f()\n',
+            '    return 2\n',
+            'print(f())\n',
+            'if f() == 2\n',
+            '    print(3)\n',
+            'x = 4\n',
+        ]
+        read = []
+
+        def stream():
+            for line in source:
+                read.append(line)
+                yield line
+
+        seen = []
+        for statement in parser.Parser.from_stream(stream()).statements():
+            seen.append((statement['type'], statement['line'], len(read)))
+
+        # A block is complete at the line after it, everything else at its own line
+        self.assertEqual([('print', 1, 1), ('setvar', 2, 4), ('print', 4, 4), ('switch', 5, 7), ('setvar', 7, 7)], seen)
+
+    def test_reparse_reuses_unchanged_blocks(self):
+        source = 'fun f(n)\n    return n * 2\n\nx = f(1)\nprint(x)\n'
+        p = parser.Parser.from_string(source)
+        f, setx, printx = p.parse()
+
+        # Inside the func: only its block is parsed again
+        at = source.index('2')
+        ast = p.reparse(at, at + 1, '3\n    # comment')
+        self.assertEqual(parser.Parser.from_string(p.codetext).parse(), ast)
+        self.assertIsNot(f, ast[0])
+        self.assertIs(setx, ast[1])
+        self.assertIs(printx, ast[2])
+        self.assertEqual(5, setx['line'])
+        self.assertEqual(6, printx['line'])
+
+        # Into the last statement, which changes neither of the others
+        at = p.codetext.index('print(x)')
+        ast = p.reparse(at + 6, at + 7, 'x * 2')
+        self.assertEqual(parser.Parser.from_string(p.codetext).parse(), ast)
+        self.assertIs(setx, ast[1])
+        self.assertEqual(6, ast[2]['line'])
+
+    def test_reparse_elif_follows_if(self):
+        source = 'if x == 1\n    print(1)\nelse\n    print(2)\nprint(3)\n'
+        p = parser.Parser.from_string(source)
+        p.parse()
+
+        # A failed edit leaves the parser as it was
+        at = source.index('print(3)')
+        with self.assertRaises(parser.ParseError) as cm:
+            p.reparse(at, at + len('print(3)'), 'x = )')
+        self.assertEqual(5, cm.exception.line)
+        self.assertEqual(source, p.codetext)
+        self.assertEqual(parser.Parser.from_string(source).parse(), p.parsed)
+
+        # The else belongs to the if's block, so it is parsed along with it
+        at = source.index('else')
+        ast = p.reparse(at, at + len('else'), 'elif x == 2')
+        self.assertEqual(parser.Parser.from_string(p.codetext).parse(), ast)
+        self.assertEqual(2, len(ast[0]['cases']))
+
+    def test_reparse_stream(self):
+        p = parser.Parser.from_stream(iter(['print(1)\n']))
+        p.parse()
+        with self.assertRaises(ValueError):
+            p.reparse(0, 0, 'x = 1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Counts how often each statement and func of a program runs and how long it takes.
+
+A Profile hooks into one tree Interpreter by replacing _instr and _instrs on that instance
+only, so every interpreter that is not being profiled runs exactly the code it always did.
+Statements are keyed by the source line the parser tagged them with, and funcs by their
+name and the line they were defined on. A statement's total time includes the statements
+and calls it ran, and its self time is what is left after taking those out; self times,
+per distinct stack of funcs and statements, are what the collapsed stacks report, in the
+"frame;frame;frame microseconds" format flamegraph.pl and speedscope read.
+"""
+
+import time
+
+MODULE = '<module>'
+
+
+class Stat:
+    __slots__ = ('where', 'visits', 'total', 'self', 'active')
+
+    def __init__(self, where):
+        self.where = where
+        self.visits = 0
+        # Nanoseconds; a recursive func's total only counts its outermost calls
+        self.total = 0
+        self.self = 0
+        self.active = 0
+
+
+class Profile:
+    def __init__(self, ast, filename=None):
+        self.filename = filename
+        # Keeps the ids in _funcs pointing at the code they were taken from
+        self._ast = ast
+        # id(list of instructions) -> Stat, for the program and the body of each func
+        self._funcs = {id(ast): Stat(MODULE)}
+        self._label(ast)
+        # (line, type) -> Stat for each statement that ran
+        self.statements = {}
+        # Tuple of frame names -> self time in nanoseconds
+        self.stacks = {}
+        # [Stat, start, time spent in children] for each statement and call being run
+        self._open = []
+        self._frames = []
+
+    def _label(self, node):
+        if type(node) is list:
+            for item in node:
+                self._label(item)
+        elif type(node) is dict:
+            value = node.get('value')
+            if node.get('type') == 'setvar' and type(value) is dict and value['type'] == 'func':
+                self._funcs[id(value['code'])] = Stat(self._where(node['name'], node))
+            elif node.get('type') == 'func' and id(node['code']) not in self._funcs:
+                self._funcs[id(node['code'])] = Stat(self._where('<func>', node))
+            for value in node.values():
+                self._label(value)
+
+    def _where(self, name, node):
+        line = node.get('line')
+        if line is None:
+            return name
+        if self.filename is None:
+            return f'{name} (line {line})'
+        return f'{name} ({self.filename}:{line})'
+
+    def instrument(self, interp):
+        """Makes interp record into this profile from now on."""
+        instr = interp._instr
+        instrs = interp._instrs
+        funcs = self._funcs
+        statements = self.statements
+        enter = self._enter
+        leave = self._leave
+
+        def profiled_instr(node, vars):
+            key = (node.get('line'), node['type'])
+            stat = statements.get(key)
+            if stat is None:
+                stat = statements[key] = Stat(self._where(node['type'], node))
+            enter(stat)
+            try:
+                return instr(node, vars)
+            finally:
+                leave()
+
+        def profiled_instrs(nodes, vars):
+            stat = funcs.get(id(nodes))
+            if stat is None:
+                return instrs(nodes, vars)
+            enter(stat)
+            try:
+                return instrs(nodes, vars)
+            finally:
+                leave()
+
+        interp._instr = profiled_instr
+        interp._instrs = profiled_instrs
+
+    def _enter(self, stat):
+        stat.active += 1
+        self._frames.append(stat.where)
+        self._open.append([stat, time.perf_counter_ns(), 0])
+
+    def _leave(self):
+        stat, start, children = self._open.pop()
+        elapsed = time.perf_counter_ns() - start
+        own = elapsed - children
+
+        stack = tuple(self._frames)
+        self._frames.pop()
+        self.stacks[stack] = self.stacks.get(stack, 0) + own
+
+        stat.visits += 1
+        stat.self += own
+        stat.active -= 1
+        if stat.active == 0:
+            stat.total += elapsed
+        if self._open:
+            self._open[-1][2] += elapsed
+
+    def write_collapsed(self, file):
+        for stack, ns in sorted(self.stacks.items()):
+            if ns >= 1000:
+                file.write(f'{";".join(stack)} {ns // 1000}\n')
+
+    def table(self, top=20):
+        """The funcs by total time, then the statements by self time, top of each."""
+        funcs = sorted((stat for stat in self._funcs.values() if stat.visits), key=lambda stat: -stat.total)
+        statements = sorted(self.statements.values(), key=lambda stat: -stat.self)
+
+        lines = []
+        for title, stats in [('funcs', funcs), ('statements', statements)]:
+            lines.append(f'{"calls" if title == "funcs" else "visits":>10} {"total ms":>12} {"self ms":>12}  {title}')
+            for stat in stats[:top]:
+                lines.append(f'{stat.visits:10} {stat.total / 1e6:12.3f} {stat.self / 1e6:12.3f}  {stat.where}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import interpreter
+import io
+import profiler
+import unittest
+from testnodes import call, getvar
+
+class TestProfile(unittest.TestCase):
+    def run_profiled(self, ast):
+        profile = profiler.Profile(ast, 'p.🔥🦬')
+        interpreter.Interpreter(ast, output=interpreter.Output(io.StringIO()), profile=profile).run()
+        return profile
+
+    def test_counts_by_line(self):
+        # 1 fun f(n)
+        # 2     return n * 2
+        # 3 total = 0
+        # 4 for i of [0...5]
+        # 5     total += f(i)
+        # 6 print(total)
+
+        ast = [
+            {
+                'type': 'setvar',
+                'name': 'f',
+                'value': {
+                    'type': 'func',
+                    'args': ['n'],
+                    'code': [{'type': 'return', 'value': {'type': 'mul', 'value1': getvar('n'), 'value2': 2}, 'line': 2}],
+                },
+                'line': 1,
+            },
+            {'type': 'setvar', 'name': 'total', 'value': 0, 'line': 3},
+            {
+                'type': 'loop',
+                'var': 'i',
+                'list': {'type': 'range', 'start': 0, 'end': 5},
+                'code': [{'type': 'addset', 'target': getvar('total'), 'value': call('f', getvar('i')), 'line': 5}],
+                'line': 4,
+            },
+            {'type': 'print', 'value': getvar('total'), 'line': 6},
+        ]
+
+        profile = self.run_profiled(ast)
+
+        visits = {key: stat.visits for key, stat in profile.statements.items()}
+        self.assertEqual({(1, 'setvar'): 1, (2, 'return'): 5, (3, 'setvar'): 1, (4, 'loop'): 1, (5, 'addset'): 5, (6, 'print'): 1}, visits)
+
+        loop = profile.statements[(4, 'loop')]
+        addset = profile.statements[(5, 'addset')]
+        self.assertGreaterEqual(loop.total, addset.total)
+        self.assertEqual(loop.total, loop.self + addset.total)
+
+        stacks = io.StringIO()
+        profile.stacks = {stack: 1000 for stack in profile.stacks}
+        profile.write_collapsed(stacks)
+        self.assertIn('<module>;loop (p.🔥🦬:4);addset (p.🔥🦬:5);f (p.🔥🦬:1);return (p.🔥🦬:2) 1\n', stacks.getvalue())
+
+        table = profile.table(2).splitlines()
+        self.assertEqual(6, len(table))
+        self.assertIn('f (p.🔥🦬:1)', table[2])
+        self.assertTrue(table[1].split()[0] == '1' and table[1].endswith('<module>'))
+
+    def test_recursion_counted_once(self):
+        # fun count(n)
+        #     if n == 0
+        #         return 0
+        #     return count(n - 1)
+        # count(20)
+
+        ast = [
+            {
+                'type': 'setvar',
+                'name': 'count',
+                'value': {
+                    'type': 'func',
+                    'args': ['n'],
+                    'code': [
+                        {
+                            'type': 'if',
+                            'cond': {'type': 'equal', 'value1': getvar('n'), 'value2': 0},
+                            'code': [{'type': 'return', 'value': 0}],
+                        },
+                        {'type': 'return', 'value': call('count', {'type': 'sub', 'value1': getvar('n'), 'value2': 1})},
+                    ],
+                },
+            },
+            call('count', 20),
+        ]
+
+        profile = self.run_profiled(ast)
+        funcs = {stat.where: stat for stat in profile._funcs.values()}
+
+        self.assertEqual(21, funcs['count'].visits)
+        # The calls inside the first one do not count again towards its total
+        self.assertLessEqual(funcs['count'].total, funcs[profiler.MODULE].total)
+
+    def test_off_by_default(self):
+        interp = interpreter.Interpreter([])
+        self.assertEqual(interpreter.Interpreter._instr, interp._instr.__func__)
+
+        with self.assertRaises(ValueError):
+            interpreter.Interpreter([], engine='bytecode', profile=profiler.Profile([]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,166 @@
 import interpreter
+import textwrap
+import types
+
+INDENT = '    '
+
+# Expression types whose result is always a Python number, string or bool, so
+# they can be printed and concatenated without going through the helpers below
+NUMBER_TYPES = {'div', 'float', 'int', 'len', 'mod', 'now', 'pow', 'sub'}
+STRING_TYPES = {'input', 'join', 'string', 'typeof'}
+BOOL_TYPES = {'and', 'bool', 'contains', 'equal', 'not', 'notequal', 'or', 'xor'}
+
+TYPE_NAMES = {
+    bool: 'bool',
+    float: 'float',
+    int: 'int',
+    list: 'list',
+    range: 'range',
+    str: 'string',
+    type(None): 'void',
+    types.FunctionType: 'func',
+}
+
+
+def _add(a, b):
+    if type(a) is str:
+        return a + _str(b)
+    return a + b
+
+
+def _div(a, b):
+    if type(a) is float or type(b) is float:
+        return a / b
+    return int(a / b)
+
+
+def _pow(a, b):
+    if type(a) is float or type(b) is float:
+        return pow(float(a), float(b))
+    return int(pow(a, b))
+
+
+def _str(value):
+    if type(value) in (list, range):
+        joined = ','.join(_str(x) for x in value)
+        return f'[{joined}]'
+    return f'{value}'
+
+
+def _typeof(value):
+    return TYPE_NAMES[type(value)]
+
+
+def _join(target, value):
+    return value.join(target)
+
+
+def _contains(target, value):
+    if type(target) is str and type(value) is not str:
+        return False
+    return value in target
+
+
+def _call_kw(func, args, kwargs):
+    # kwargs are keyed by 🔥🦬 name, the parameters by Python name, whose prefix depends on the func
+    code = func.__code__
+    params = {param.split('_', 1)[1]: param for param in code.co_varnames[:code.co_argcount]}
+    names = [param for name, param in params.items() if name not in kwargs]
+    if len(args) != len(names):
+        raise interpreter.InvalidArgs(args)
+    bound = {params[name]: value for name, value in kwargs.items()}
+    bound.update(zip(names, args))
+    return func(**bound)
+
+
+RUNTIME = {
+    '_add': _add,
+    '_call_kw': _call_kw,
+    '_contains': _contains,
+    '_div': _div,
+    '_join': _join,
+    '_pow': _pow,
+    '_str': _str,
+    '_typeof': _typeof,
+}
+
 
 class PythonTranspiler:
     def __init__(self):
         self._exprTypes = {
+            'add': self._add,
+            'and': self._and,
+            'bool': self._bool,
+            'call': self._call,
+            'chan': self._tasks,
+            'contains': self._contains,
+            'div': self._div,
+            'equal': self._equal,
             'float': self._float,
+            'func': self._func,
+            'getvar': self._getvar,
             'int': self._int,
+            'input': self._input,
+            'join': self._join,
+            'len': self._len,
+            'list': self._list,
+            'mod': self._mod,
+            'mul': self._mul,
+            'not': self._not,
+            'notequal': self._notequal,
+            'now': self._now,
+            'or': self._or,
+            'pow': self._pow,
+            'range': self._range,
+            'reverse': self._reverse,
+            'sleep': self._sleep,
             'string': self._string,
+            'sub': self._sub,
+            'subscript': self._subscript,
+            'timer': self._tasks,
+            'typeof': self._typeof,
+            'xor': self._xor,
         }
 
         self._instrTypes = {
+            'addset': self._addset,
+            'append': self._append,
+            'divset': self._divset,
+            'if': self._if,
+            'insert': self._insert,
+            'loop': self._loop,
+            'modset': self._modset,
+            'mulset': self._mulset,
+            'powset': self._powset,
             'print': self._print,
+            'remove': self._remove,
+            'return': self._return,
+            'setvar': self._setvar,
+            'spawn': self._tasks,
+            'subset': self._subset,
+            'switch': self._switch,
         }
 
+        self._funcs = 0
+        self._hoisted = []
+        # Names each enclosing func binds, outermost first, like the closure engine's Scopes
+        self._scopes = []
+
+    def program(self, instrs):
+        # Locals are much faster than module globals, so the program body runs inside a function
+        self._scopes = [set(interpreter.assigned(instrs))]
+        try:
+            return f'def _main():\n{self._block(instrs)}\n_main()\n'
+        finally:
+            self._scopes = []
+
+    def compile(self, instrs, filename='<🔥🦬>'):
+        return compile(self.program(instrs), filename, 'exec')
+
+    def run(self, instrs, filename='<🔥🦬>'):
+        # Each run gets its own clock, so now() counts from the start of that run
+        exec(self.compile(instrs, filename), dict(RUNTIME, _clock=interpreter.Clock()))
+
     def instrs(self, instrs):
         ret = []
 
@@ -20,33 +169,287 @@ class PythonTranspiler:
 
         return ''.join(ret)
 
+    def _block(self, instrs):
+        return textwrap.indent(self.instrs(instrs) or 'pass\n', INDENT)
+
     def _instr(self, instr):
-        if instr['type'] not in self._instrTypes:
+        # Anonymous funcs used inside this instruction are emitted as defs right before it
+        hoisted, self._hoisted = self._hoisted, []
+
+        if instr['type'] in self._instrTypes:
+            code = self._instrTypes[instr['type']](instr)
+        elif instr['type'] in self._exprTypes:
+            code = f'{self._expr(instr)}\n'
+        else:
             raise interpreter.UnknownInstructionType(instr['type'])
 
-        return self._instrTypes[instr['type']](instr)
+        code = ''.join(self._hoisted) + code
+        self._hoisted = hoisted
+        return code
 
     def _expr(self, expr):
         if type(expr) is int:
-            return expr
+            return repr(expr)
         elif type(expr) is float:
-            return expr
+            return repr(expr)
+        elif type(expr) is bool:
+            return repr(expr)
         elif type(expr) is str:
-            return expr
+            return repr(expr)
 
         if expr['type'] not in self._exprTypes:
             raise interpreter.UnknownExpressionType(expr['type'])
 
         return self._exprTypes[expr['type']](expr)
 
-    def _int(self, expr):
-        return str(self._expr(expr['value']))
+    def _kind(self, expr):
+        if type(expr) in (int, float):
+            return 'number'
+        elif type(expr) is str:
+            return 'string'
+        elif type(expr) is bool:
+            return 'bool'
+        elif expr['type'] in NUMBER_TYPES:
+            return 'number'
+        elif expr['type'] in STRING_TYPES:
+            return 'string'
+        elif expr['type'] in BOOL_TYPES:
+            return 'bool'
+        return None
+
+    def _name(self, name, depth=None):
+        # Prefixing keeps 🔥🦬 names clear of Python keywords, builtins and the runtime helpers.
+        # A func's own variables get a prefix of their own, so that assigning one never turns
+        # the variable of an enclosing func into an unbound Python local
+        if depth is None:
+            depth = 0
+            for i in reversed(range(len(self._scopes))):
+                if name in self._scopes[i]:
+                    depth = i
+                    break
+        return f'v_{name}' if depth == 0 else f'v{depth}_{name}'
+
+    def _def(self, name, expr):
+        depth = len(self._scopes)
+        args = expr['args']
+        own = [var for var in interpreter.assigned(expr['code']) if var not in args]
+
+        # As in the closure engine, a local that shadows an outer variable starts out with its
+        # value at the time of the call, if it has one
+        copies = ''
+        for var in own:
+            if any(var in scope for scope in self._scopes):
+                copies += f'try:\n{INDENT}{self._name(var, depth)} = {self._name(var)}\nexcept NameError:\n{INDENT}pass\n'
+
+        self._scopes.append(set(args) | set(own))
+        try:
+            params = ', '.join(self._name(arg) for arg in args)
+            body = textwrap.indent(copies, INDENT) + self._block(expr['code'])
+        finally:
+            self._scopes.pop()
+        return f'def {name}({params}):\n{body}'
+
+    def _target(self, instr):
+        target = instr['target']
+        if type(target) is dict and target['type'] == 'getvar':
+            return self._name(target['name'])
+        if type(target) is dict and target['type'] == 'subscript':
+            return f'{self._expr(target["target"])}[{self._expr(target["index"])}]'
+        raise interpreter.UnknownInstructionType(instr['type'])
+
+    def _opset(self, instr, op):
+        target = self._target(instr)
+        return f'{target} = {op(target, self._expr(instr["value"]))}\n'
+
+    def _addset(self, instr):
+        return self._opset(instr, lambda a, b: f'_add({a}, {b})')
+
+    def _append(self, instr):
+        return f'{self._expr(instr["target"])}.append({self._expr(instr["value"])})\n'
+
+    def _divset(self, instr):
+        return self._opset(instr, lambda a, b: f'_div({a}, {b})')
+
+    def _if(self, instr):
+        code = f'if {self._expr(instr["cond"])}:\n{self._block(instr["code"])}'
+        if 'else' in instr:
+            code += f'else:\n{self._block(instr["else"])}'
+        return code
+
+    def _insert(self, instr):
+        return f'{self._expr(instr["target"])}.insert({self._expr(instr["index"])}, {self._expr(instr["value"])})\n'
+
+    def _loop(self, instr):
+        return f'for {self._name(instr["var"])} in {self._expr(instr["list"])}:\n{self._block(instr["code"])}'
+
+    def _modset(self, instr):
+        return self._opset(instr, lambda a, b: f'{a} % ({b})')
+
+    def _mulset(self, instr):
+        return self._opset(instr, lambda a, b: f'{a} * ({b})')
+
+    def _powset(self, instr):
+        return self._opset(instr, lambda a, b: f'_pow({a}, {b})')
+
+    def _print(self, expr):
+        if self._kind(expr['value']) is not None:
+            return f'print({self._expr(expr["value"])})\n'
+        return f'print(_str({self._expr(expr["value"])}))\n'
+
+    def _remove(self, instr):
+        return f'{self._expr(instr["target"])}.pop({self._expr(instr["index"])})\n'
+
+    def _return(self, instr):
+        if 'value' in instr:
+            return f'return {self._expr(instr["value"])}\n'
+        return 'return\n'
+
+    def _setvar(self, instr):
+        value = instr['value']
+        if type(value) is dict and value['type'] == 'func':
+            return self._def(self._name(instr['name']), value)
+        return f'{self._name(instr["name"])} = {self._expr(value)}\n'
+
+    def _subset(self, instr):
+        return self._opset(instr, lambda a, b: f'{a} - ({b})')
+
+    def _switch(self, instr):
+        code = ''
+        keyword = 'if'
+
+        for case in instr['cases']:
+            code += f'{keyword} {self._expr(case["cond"])}:\n{self._block(case["code"])}'
+            keyword = 'elif'
+
+        if 'default' in instr:
+            if code == '':
+                return self.instrs(instr['default'])
+            code += f'else:\n{self._block(instr["default"])}'
+
+        return code
+
+    def _add(self, expr):
+        v1 = self._expr(expr['value1'])
+        v2 = self._expr(expr['value2'])
+        kind1 = self._kind(expr['value1'])
+
+        if kind1 == 'number' or (kind1 == 'string' and self._kind(expr['value2']) == 'string'):
+            return f'({v1} + {v2})'
+        return f'_add({v1}, {v2})'
+
+    def _and(self, expr):
+        return f'(bool({self._expr(expr["value1"])}) and bool({self._expr(expr["value2"])}))'
+
+    def _bool(self, expr):
+        if type(expr['value']) is bool:
+            return repr(expr['value'])
+        return f'bool({self._expr(expr["value"])})'
+
+    def _tasks(self, expr):
+        raise interpreter.TasksUnsupported(interpreter.TASKS_ENGINE)
+
+    def _call(self, expr):
+        target = self._expr(expr['target'])
+        args = [self._expr(arg) for arg in expr.get('args', [])]
+        kwargs = expr.get('kwargs', {})
+
+        if len(kwargs) == 0:
+            return f'{target}({", ".join(args)})'
+
+        kwargs = ', '.join(f'{k!r}: {self._expr(v)}' for k, v in kwargs.items())
+        return f'_call_kw({target}, [{", ".join(args)}], {{{kwargs}}})'
+
+    def _contains(self, expr):
+        return f'_contains({self._expr(expr["target"])}, {self._expr(expr["value"])})'
+
+    def _div(self, expr):
+        return f'_div({self._expr(expr["value1"])}, {self._expr(expr["value2"])})'
+
+    def _equal(self, expr):
+        return f'({self._expr(expr["value1"])} == {self._expr(expr["value2"])})'
 
     def _float(self, expr):
-        return str(self._expr(expr['value']))
+        if type(expr['value']) in (int, float):
+            return repr(float(expr['value']))
+        return f'float({self._expr(expr["value"])})'
+
+    def _func(self, expr):
+        self._funcs += 1
+        name = f'_func{self._funcs}'
+        self._hoisted.append(self._def(name, expr))
+        return name
+
+    def _getvar(self, expr):
+        return self._name(expr['name'])
+
+    def _int(self, expr):
+        if type(expr['value']) is int:
+            return repr(expr['value'])
+        return f'int({self._expr(expr["value"])})'
+
+    def _input(self, expr):
+        if 'prompt' in expr:
+            return f'input({self._expr(expr["prompt"])})'
+        return 'input()'
+
+    def _join(self, expr):
+        return f'_join({self._expr(expr["target"])}, {self._expr(expr["value"])})'
+
+    def _len(self, expr):
+        return f'len({self._expr(expr["target"])})'
+
+    def _list(self, expr):
+        return f'[{", ".join(self._expr(value) for value in expr.get("values", []))}]'
+
+    def _mod(self, expr):
+        return f'({self._expr(expr["value1"])} % {self._expr(expr["value2"])})'
+
+    def _mul(self, expr):
+        return f'({self._expr(expr["value1"])} * {self._expr(expr["value2"])})'
+
+    def _not(self, expr):
+        return f'(not {self._expr(expr["value"])})'
+
+    def _notequal(self, expr):
+        return f'({self._expr(expr["value1"])} != {self._expr(expr["value2"])})'
+
+    def _now(self, expr):
+        return 'int(_clock.now())'
+
+    def _or(self, expr):
+        return f'(bool({self._expr(expr["value1"])}) or bool({self._expr(expr["value2"])}))'
+
+    def _pow(self, expr):
+        return f'_pow({self._expr(expr["value1"])}, {self._expr(expr["value2"])})'
+
+    def _range(self, expr):
+        if 'step' in expr:
+            return f'range({self._expr(expr["start"])}, {self._expr(expr["end"])}, {self._expr(expr["step"])})'
+        return f'range({self._expr(expr["start"])}, {self._expr(expr["end"])})'
+
+    def _reverse(self, expr):
+        return f'{self._expr(expr["target"])}[::-1]'
+
+    def _sleep(self, expr):
+        return f'_clock.sleep({self._expr(expr.get("ms", 0))})'
 
     def _string(self, expr):
-        return f"'{self._expr(expr['value'])}'"
+        if type(expr['value']) is str:
+            return repr(expr['value'])
+        return f'str({self._expr(expr["value"])})'
 
-    def _print(self, expr):
-        return f'print({self._expr(expr["value"])})\n'
+    def _sub(self, expr):
+        return f'({self._expr(expr["value1"])} - {self._expr(expr["value2"])})'
+
+    def _subscript(self, expr):
+        index = expr['index']
+        if type(index) is dict and index['type'] == 'range':
+            step = f':{self._expr(index["step"])}' if 'step' in index else ''
+            return f'{self._expr(expr["target"])}[{self._expr(index["start"])}:{self._expr(index["end"])}{step}]'
+        return f'{self._expr(expr["target"])}[{self._expr(index)}]'
+
+    def _typeof(self, expr):
+        return f'_typeof({self._expr(expr["value"])})'
+
+    def _xor(self, expr):
+        return f'({self._expr(expr["value1"])} != {self._expr(expr["value2"])})'
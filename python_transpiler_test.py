@@ -1,11 +1,23 @@
 #!/usr/bin/python3
 
+import io
 import python_transpiler
+import sys
 import unittest
 
 class TestPythonTranspile(unittest.TestCase):
     def setUp(self):
         self.pt = python_transpiler.PythonTranspiler()
+        self._stdoutbuf = io.StringIO()
+        self._realstdout = sys.stdout
+        sys.stdout = self._stdoutbuf
+
+    def tearDown(self):
+        sys.stdout = self._realstdout
+
+    def run_program(self, instrs):
+        self.pt.run(instrs)
+        return self._stdoutbuf.getvalue()
 
     def test_print_float(self):
         ret = self.pt.instrs([
@@ -46,6 +58,297 @@ class TestPythonTranspile(unittest.TestCase):
 
         self.assertEqual("print('foo')\n", ret)
 
+    def test_print_var(self):
+        ret = self.pt.instrs([
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'getvar',
+                    'name': 'x',
+                },
+            },
+        ])
+
+        self.assertEqual('print(_str(v_x))\n', ret)
+
+    def test_loop(self):
+        ret = self.pt.instrs([
+            {
+                'type': 'loop',
+                'var': 'i',
+                'list': {
+                    'type': 'range',
+                    'start': {
+                        'type': 'int',
+                        'value': 1,
+                    },
+                    'end': {
+                        'type': 'int',
+                        'value': 3,
+                    },
+                },
+                'code': [
+                    {
+                        'type': 'addset',
+                        'target': {
+                            'type': 'getvar',
+                            'name': 'x',
+                        },
+                        'value': {
+                            'type': 'getvar',
+                            'name': 'i',
+                        },
+                    },
+                ],
+            },
+        ])
+
+        self.assertEqual('for v_i in range(1, 3):\n    v_x = _add(v_x, v_i)\n', ret)
+
+    def test_run_int_div(self):
+        # print(7 / 2)
+        # print(7.0 / 2)
+
+        out = self.run_program([
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'div',
+                    'value1': {
+                        'type': 'int',
+                        'value': 7,
+                    },
+                    'value2': {
+                        'type': 'int',
+                        'value': 2,
+                    },
+                },
+            },
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'div',
+                    'value1': {
+                        'type': 'float',
+                        'value': 7.0,
+                    },
+                    'value2': {
+                        'type': 'int',
+                        'value': 2,
+                    },
+                },
+            },
+        ])
+
+        self.assertEqual('3\n3.5\n', out)
+
+    def test_run_string_add(self):
+        # print("a" + 1.5)
+
+        out = self.run_program([
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'add',
+                    'value1': {
+                        'type': 'string',
+                        'value': 'a',
+                    },
+                    'value2': {
+                        'type': 'float',
+                        'value': 1.5,
+                    },
+                },
+            },
+        ])
+
+        self.assertEqual('a1.5\n', out)
+
+    def test_run_func_kwargs(self):
+        # print(func(test1, test2) { return test1 - test2 }(test1=3, 5))
+
+        out = self.run_program([
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'call',
+                    'target': {
+                        'type': 'func',
+                        'args': ['test1', 'test2'],
+                        'code': [
+                            {
+                                'type': 'return',
+                                'value': {
+                                    'type': 'sub',
+                                    'value1': {
+                                        'type': 'getvar',
+                                        'name': 'test1',
+                                    },
+                                    'value2': {
+                                        'type': 'getvar',
+                                        'name': 'test2',
+                                    },
+                                },
+                            },
+                        ],
+                    },
+                    'kwargs': {
+                        'test1': {
+                            'type': 'int',
+                            'value': 3,
+                        },
+                    },
+                    'args': [
+                        {
+                            'type': 'int',
+                            'value': 5,
+                        },
+                    ],
+                },
+            },
+        ])
+
+        self.assertEqual('-2\n', out)
+
+    def test_run_func_rebinds_outer(self):
+        # x = 1
+        # fun f()
+        #     x += 1
+        #     return x
+        # print(f())
+        # print(x)
+
+        out = self.run_program([
+            {
+                'type': 'setvar',
+                'name': 'x',
+                'value': {
+                    'type': 'int',
+                    'value': 1,
+                },
+            },
+            {
+                'type': 'setvar',
+                'name': 'f',
+                'value': {
+                    'type': 'func',
+                    'args': [],
+                    'code': [
+                        {
+                            'type': 'addset',
+                            'target': {
+                                'type': 'getvar',
+                                'name': 'x',
+                            },
+                            'value': {
+                                'type': 'int',
+                                'value': 1,
+                            },
+                        },
+                        {
+                            'type': 'return',
+                            'value': {
+                                'type': 'getvar',
+                                'name': 'x',
+                            },
+                        },
+                    ],
+                },
+            },
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'call',
+                    'target': {
+                        'type': 'getvar',
+                        'name': 'f',
+                    },
+                    'args': [],
+                },
+            },
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'getvar',
+                    'name': 'x',
+                },
+            },
+        ])
+
+        self.assertEqual('2\n1\n', out)
+
+    def test_run_print_list(self):
+        # print(["a", 1, typeof(2.5)])
+
+        out = self.run_program([
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'list',
+                    'values': [
+                        {
+                            'type': 'string',
+                            'value': 'a',
+                        },
+                        {
+                            'type': 'int',
+                            'value': 1,
+                        },
+                        {
+                            'type': 'typeof',
+                            'value': {
+                                'type': 'float',
+                                'value': 2.5,
+                            },
+                        },
+                    ],
+                },
+            },
+        ])
+
+        self.assertEqual('[a,1,float]\n', out)
+
+    def test_run_and_short_circuit(self):
+        # print(false and func() { print("right") return true }())
+
+        out = self.run_program([
+            {
+                'type': 'print',
+                'value': {
+                    'type': 'and',
+                    'value1': {
+                        'type': 'bool',
+                        'value': False,
+                    },
+                    'value2': {
+                        'type': 'call',
+                        'target': {
+                            'type': 'func',
+                            'args': [],
+                            'code': [
+                                {
+                                    'type': 'print',
+                                    'value': {
+                                        'type': 'string',
+                                        'value': 'right',
+                                    },
+                                },
+                                {
+                                    'type': 'return',
+                                    'value': {
+                                        'type': 'bool',
+                                        'value': True,
+                                    },
+                                },
+                            ],
+                        },
+                    },
+                },
+            },
+        ])
+
+        self.assertEqual('False\n', out)
+
 
 if __name__ == '__main__':
     unittest.main()
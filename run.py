@@ -1,18 +1,74 @@
 #!/usr/bin/python3
 
 import argparse
+import astfile
+import bytecode
+import cache
 import json
+import optimizer
+import profiler
+import sys
+import vectorize
 from parser import Parser
-from interpreter import Interpreter
+from interpreter import Interpreter, Output, VirtualClock
+from python_transpiler import PythonTranspiler
 
 ap = argparse.ArgumentParser()
+ap.add_argument('-O', '--optimize', action='store_true', help='Fold constants and drop dead code before running')
 ap.add_argument('-p', '--parsed', action='store_true', help='Print parse tree')
+ap.add_argument('-d', '--disassemble', action='store_true', help='Print the bytecode the bytecode engine runs')
+ap.add_argument('--no-cache', action='store_true', help=f'Always reparse instead of using {cache.CACHE_DIR}')
+ap.add_argument('--clear-cache', action='store_true', help=f'Remove {cache.CACHE_DIR} next to each file before running')
+ap.add_argument('--vectorize', action='store_true', help='Run simple arithmetic loops over ranges with NumPy')
+ap.add_argument('--workers', type=int, default=1, help='Run loops whose iterations are independent on this many processes')
+ap.add_argument('--virtual-clock', action='store_true', help='Let time jump ahead to the next timer instead of waiting for it')
+ap.add_argument('--profile', metavar='FILE', help='Write collapsed stacks of where the time went to FILE, and print the hottest funcs and statements')
+ap.add_argument('--profile-top', type=int, default=20, metavar='N', help='How many funcs and statements --profile prints')
+ap.add_argument('--engine', choices=Interpreter.engines, default='tree', help='How to execute the parse tree')
+ap.add_argument('--backend', choices=['interpreter', 'python'], default='interpreter', help='Run with the interpreter or compile to Python bytecode')
+ap.add_argument('--buffer-size', type=int, default=Output.DEFAULT_SIZE, help='Characters of output to collect before writing them out')
+ap.add_argument('--no-line-buffering', action='store_true', help='Buffer output even when stdout is a terminal')
+ap.add_argument('--compile-only', action='store_true', help=f'Write each file\'s parse tree to a binary {astfile.EXTENSION} file next to it instead of running it')
 ap.add_argument('filename', nargs='+')
 args = ap.parse_args()
+if args.vectorize and not vectorize.available():
+    ap.error('--vectorize needs numpy')
+if args.profile and (args.engine != 'tree' or args.backend != 'interpreter'):
+    ap.error('--profile runs on the tree engine')
+if args.profile:
+    # Each file's stacks are appended below, so start from an empty file on every run
+    open(args.profile, 'w').close()
 
 for filename in args.filename:
-    parsed = Parser(filename).parse()
+    if args.clear_cache:
+        cache.clear(filename)
+    if astfile.is_compiled(filename):
+        parsed = astfile.load(filename)
+    elif args.no_cache:
+        parsed = Parser(filename).parse()
+    else:
+        parsed = cache.parse(filename)
+    if args.optimize:
+        parsed = optimizer.optimize(parsed)
+    if args.compile_only:
+        astfile.dump(parsed, astfile.compiled_path(filename))
+        continue
     if args.parsed:
         print(f'{filename}: {json.dumps(parsed, indent=4)}')
-    interp = Interpreter(parsed)
-    interp.run()
+    if args.disassemble:
+        bytecode.disassemble(bytecode.Compiler(args.vectorize).compile(parsed)[0])
+    if args.backend == 'python':
+        PythonTranspiler().run(parsed, filename)
+    else:
+        output = Output(size=args.buffer_size, tty_line_buffering=not args.no_line_buffering)
+        clock = VirtualClock() if args.virtual_clock else None
+        profile = profiler.Profile(parsed, filename) if args.profile else None
+        interp = Interpreter(parsed, engine=args.engine, output=output, vectorize=args.vectorize, workers=args.workers, clock=clock, profile=profile, filename=filename)
+        try:
+            interp.run()
+        finally:
+            if profile is not None:
+                # Appended to, so profiling several files gives one flamegraph of them all
+                with open(args.profile, 'a') as fh:
+                    profile.write_collapsed(fh)
+                sys.stderr.write(profile.table(args.profile_top))
@@ -1,12 +1,21 @@
 #!/usr/bin/python3
 
+import argparse
 import difflib
 import glob
 import io
 import os.path
+import optimizer
 import sys
 from interpreter import Interpreter
 from parser import Parser
+from python_transpiler import PythonTranspiler
+
+ap = argparse.ArgumentParser()
+ap.add_argument('--engine', choices=Interpreter.engines, default='tree')
+ap.add_argument('--backend', choices=['interpreter', 'python'], default='interpreter')
+ap.add_argument('-O', '--optimize', action='store_true', help='Run the optimizer on each parse tree first')
+args = ap.parse_args()
 
 for filename in glob.glob('tests/*.🔥🦬'):
     stdinbuf = io.StringIO()
@@ -23,8 +32,13 @@ for filename in glob.glob('tests/*.🔥🦬'):
 
     try:
         parsed = Parser(filename).parse()
-        interp = Interpreter(parsed)
-        interp.run()
+        if args.optimize:
+            parsed = optimizer.optimize(parsed)
+        if args.backend == 'python':
+            PythonTranspiler().run(parsed, filename)
+        else:
+            interp = Interpreter(parsed, engine=args.engine)
+            interp.run()
     except Exception as e:
         print(f'ERROR: {e}', file=sys.stderr)
         continue
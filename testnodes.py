@@ -0,0 +1,105 @@
+"""Builders for the parse tree nodes the tests use most, so each test file need not repeat them."""
+
+def getvar(name):
+    return {
+        'type': 'getvar',
+        'name': name,
+    }
+
+def prints(value):
+    return {
+        'type': 'print',
+        'value': value,
+    }
+
+def op(kind, value1, value2):
+    return {
+        'type': kind,
+        'value1': value1,
+        'value2': value2,
+    }
+
+def acc(kind, name, value):
+    # An instruction like addset or append that changes the variable name by value
+    return {
+        'type': kind,
+        'target': getvar(name),
+        'value': value,
+    }
+
+def span(start, end, step=None):
+    iterable = {
+        'type': 'range',
+        'start': start,
+        'end': end,
+    }
+    if step is not None:
+        iterable['step'] = step
+    return iterable
+
+def loop(var, iterable, code):
+    return {
+        'type': 'loop',
+        'var': var,
+        'list': iterable,
+        'code': code,
+    }
+
+def call(name, *args):
+    return {
+        'type': 'call',
+        'target': getvar(name),
+        'args': list(args),
+    }
+
+def func(name, args, code):
+    return {
+        'type': 'setvar',
+        'name': name,
+        'value': {
+            'type': 'func',
+            'args': args,
+            'code': code,
+        },
+    }
+
+def chan(name, size=0):
+    return {
+        'type': 'setvar',
+        'name': name,
+        'value': {
+            'type': 'chan',
+            'size': size,
+        },
+    }
+
+def send(name, value):
+    return {
+        'type': 'send',
+        'target': getvar(name),
+        'value': value,
+    }
+
+def receive(name):
+    return {
+        'type': 'receive',
+        'target': getvar(name),
+    }
+
+def close(name):
+    return {
+        'type': 'close',
+        'target': getvar(name),
+    }
+
+def spawn(name, *args):
+    return {
+        'type': 'spawn',
+        'call': call(name, *args),
+    }
+
+def sleep(ms):
+    return {
+        'type': 'sleep',
+        'ms': ms,
+    }
@@ -0,0 +1,206 @@
+"""Runs simple accumulating loops over a range as NumPy array expressions.
+
+A loop qualifies when it iterates over a range and its body only does `acc += expr`,
+`acc -= expr` or `acc *= expr`, where expr is integer arithmetic on the loop variable,
+literals and variables the loop does not assign. Anything else, and any run whose values
+are not all Int, is left to the interpreter. Every intermediate is bounded before it is
+computed, so the int64 arrays never overflow and results match the interpreter bit for bit.
+"""
+
+import math
+from interpreter import Int, Interpreter, LoopPlan, Range
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ACCUMULATORS = {'addset', 'subset', 'mulset'}
+OPERATIONS = {'add', 'sub', 'mul', 'div', 'mod'}
+
+INT64_MAX = 2 ** 63 - 1
+# Ints up to this size convert to float exactly, so int(a / b) rounds the same in NumPy
+FLOAT_EXACT = 2 ** 53
+
+
+def available():
+    return numpy is not None
+
+
+def int_literal(expr):
+    if type(expr) is int:
+        return expr
+    if type(expr) is dict and expr['type'] == 'int' and type(expr['value']) is int:
+        return expr['value']
+    return None
+
+
+def names(expr, found):
+    # Adds the variables expr reads to found, or returns False if expr is not plain integer arithmetic
+    if int_literal(expr) is not None:
+        return True
+    if type(expr) is not dict:
+        return False
+    if expr['type'] == 'getvar':
+        found.add(expr['name'])
+        return True
+    if expr['type'] in OPERATIONS:
+        return names(expr['value1'], found) and names(expr['value2'], found)
+    return False
+
+
+class Plan(LoopPlan):
+    def __init__(self, loop, reads, bounds, accumulators):
+        self.loop = loop
+        self.var = loop['var']
+        # Variables the body reads but does not assign, and (name, type, expr) for each accumulator
+        self.reads = reads
+        self.accumulators = accumulators
+        # Everything run() looks up, and everything it may assign
+        self.names = sorted(set(reads) | set(bounds) | {name for name, kind, expr in accumulators})
+        self.writes = [self.var] + [name for name, kind, expr in accumulators]
+        self._interp = Interpreter([])
+
+    def run(self, vars):
+        iterable = self._interp._expr(self.loop['list'], vars)
+        if type(iterable) is not Range:
+            return False
+
+        r = iterable._range
+        if len(r) == 0:
+            return True
+        if max(abs(r[0]), abs(r[-1])) > INT64_MAX:
+            return False
+
+        env = {}
+        for name in self.reads:
+            if type(vars.get(name)) is not Int:
+                return False
+            env[name] = vars[name].val
+        for name, kind, expr in self.accumulators:
+            if type(vars.get(name)) is not Int:
+                return False
+
+        i = numpy.arange(r.start, r.stop, r.step, dtype=numpy.int64)
+        env[self.var] = (i, min(r[0], r[-1]), max(r[0], r[-1]))
+
+        results = []
+        for name, kind, expr in self.accumulators:
+            term = self._eval(expr, env)
+            if term is None:
+                return False
+            results.append((name, kind, self._reduce(kind, term, len(r))))
+
+        for name, kind, total in results:
+            acc = vars[name].val
+            if kind == 'addset':
+                vars[name] = Int(acc + total)
+            elif kind == 'subset':
+                vars[name] = Int(acc - total)
+            else:
+                vars[name] = Int(acc * total)
+        vars[self.var] = Int(r[-1])
+        return True
+
+    def _reduce(self, kind, term, n):
+        values, lo, hi = term
+
+        if kind == 'mulset':
+            # Products outgrow int64 almost at once, so they are taken over Python ints
+            if type(values) is int:
+                return values ** n
+            return math.prod(values.tolist())
+
+        if type(values) is int:
+            return values * n
+        if n * max(abs(lo), abs(hi)) <= INT64_MAX:
+            return int(values.sum())
+        return sum(values.tolist())
+
+    def _eval(self, expr, env):
+        # Returns (values, lo, hi), values being an int or an int64 array, or None if it could overflow
+        literal = int_literal(expr)
+        if literal is not None:
+            return literal, literal, literal
+
+        if expr['type'] == 'getvar':
+            value = env[expr['name']]
+            if type(value) is int:
+                return value, value, value
+            return value
+
+        a = self._eval(expr['value1'], env)
+        b = self._eval(expr['value2'], env)
+        if a is None or b is None:
+            return None
+        av, alo, ahi = a
+        bv, blo, bhi = b
+        kind = expr['type']
+
+        if kind == 'add':
+            lo, hi = alo + blo, ahi + bhi
+        elif kind == 'sub':
+            lo, hi = alo - bhi, ahi - blo
+        elif kind == 'mul':
+            products = [alo * blo, alo * bhi, ahi * blo, ahi * bhi]
+            lo, hi = min(products), max(products)
+        else:
+            if numpy.any(bv == 0):
+                # Leave the ZeroDivisionError to the interpreter
+                return None
+            bound = max(abs(alo), abs(ahi)) if kind == 'div' else max(abs(blo), abs(bhi))
+            lo, hi = -bound, bound
+            if kind == 'div' and max(bound, abs(blo), abs(bhi)) > FLOAT_EXACT:
+                return None
+
+        if max(abs(lo), abs(hi)) > INT64_MAX:
+            return None
+
+        if type(av) is int and type(bv) is int:
+            values = self._interp._expr({'type': kind, 'value1': av, 'value2': bv}, {}).val
+            return values, values, values
+
+        if kind == 'add':
+            values = av + bv
+        elif kind == 'sub':
+            values = av - bv
+        elif kind == 'mul':
+            values = av * bv
+        elif kind == 'mod':
+            # NumPy's % takes the sign of the divisor, like Python's
+            values = numpy.remainder(av, bv)
+        else:
+            values = numpy.trunc(numpy.true_divide(av, bv)).astype(numpy.int64)
+        return values, lo, hi
+
+
+def plan(loop):
+    """A Plan for running loop with NumPy, or None if it does not qualify."""
+    if numpy is None:
+        return None
+
+    iterable = loop['list']
+    if type(iterable) is not dict or iterable['type'] != 'range' or not loop['code']:
+        return None
+
+    bounds = set()
+    for key in ('start', 'end', 'step'):
+        if key in iterable and not names(iterable[key], bounds):
+            return None
+
+    reads = set()
+    accumulators = []
+    for instr in loop['code']:
+        if instr['type'] not in ACCUMULATORS or instr['target']['type'] != 'getvar':
+            return None
+        if not names(instr['value'], reads):
+            return None
+        accumulators.append((instr['target']['name'], instr['type'], instr['value']))
+
+    written = [name for name, kind, expr in accumulators]
+    # Each accumulator must be independent of the others and of itself
+    if len(set(written)) != len(written) or loop['var'] in written or reads & set(written):
+        return None
+
+    reads.discard(loop['var'])
+    return Plan(loop, sorted(reads), bounds, accumulators)
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+
+import interpreter
+import io
+import unittest
+import vectorize
+from testnodes import acc, getvar, loop, op, prints, span
+
+@unittest.skipUnless(vectorize.available(), 'numpy is not installed')
+class TestVectorize(unittest.TestCase):
+    def run_all(self, ast):
+        # Returns what ast prints, after checking every engine prints the same with and without vectorizing
+        outputs = set()
+
+        for engine in interpreter.Interpreter.engines:
+            for vectorized in (False, True):
+                stream = io.StringIO()
+                output = interpreter.Output(stream)
+                interpreter.Interpreter(ast, engine=engine, output=output, vectorize=vectorized).run()
+                outputs.add(stream.getvalue())
+
+        self.assertEqual(1, len(outputs))
+        return outputs.pop()
+
+    def test_plan(self):
+        # for i of [0...n]
+        #     total += i * k
+
+        plan = vectorize.plan(loop('i', span(0, getvar('n')), [acc('addset', 'total', op('mul', getvar('i'), getvar('k')))]))
+
+        self.assertEqual(['k'], plan.reads)
+        self.assertEqual(['k', 'n', 'total'], plan.names)
+        self.assertEqual(['i', 'total'], plan.writes)
+
+    def test_run(self):
+        # for i of [0...n]
+        #     total += i * k
+
+        plan = vectorize.plan(loop('i', span(0, getvar('n')), [acc('addset', 'total', op('mul', getvar('i'), getvar('k')))]))
+        vars = {'n': interpreter.Int(10), 'k': interpreter.Int(3), 'total': interpreter.Int(1)}
+
+        self.assertTrue(plan.run(vars))
+        self.assertEqual(136, vars['total'].val)
+        self.assertEqual(9, vars['i'].val)
+
+        vars['k'] = interpreter.Float(3.0)
+        self.assertFalse(plan.run(vars))
+
+    def test_plan_rejects(self):
+        rejected = [
+            # Side effects and control flow
+            [{'type': 'print', 'value': getvar('i')}],
+            [acc('addset', 'total', {'type': 'call', 'target': getvar('f'), 'args': []})],
+            [{'type': 'if', 'cond': getvar('i'), 'code': [acc('addset', 'total', 1)]}],
+            # Accumulators that depend on each other or on themselves
+            [acc('addset', 'a', getvar('b')), acc('addset', 'b', 1)],
+            [acc('addset', 'a', getvar('a'))],
+            [acc('addset', 'a', 1), acc('mulset', 'a', 2)],
+            # Anything but integer arithmetic
+            [acc('addset', 'total', 0.5)],
+            [acc('addset', 'total', op('pow', getvar('i'), 2))],
+            [acc('divset', 'total', 2)],
+            [{'type': 'setvar', 'name': 'x', 'value': getvar('i')}],
+        ]
+
+        for code in rejected:
+            self.assertIsNone(vectorize.plan(loop('i', span(0, 10), code)), code)
+
+        self.assertIsNone(vectorize.plan({'type': 'loop', 'var': 'i', 'list': getvar('l'), 'code': [acc('addset', 'total', 1)]}))
+
+    def test_sums(self):
+        # total = 0
+        # squares = 5
+        # for i of [-50...1000]
+        #     total += i * i % 7 - 3
+        #     squares -= i * i / 3
+        # print(total, squares, i)
+
+        ast = [
+            {'type': 'setvar', 'name': 'total', 'value': 0},
+            {'type': 'setvar', 'name': 'squares', 'value': 5},
+            loop('i', span(-50, 1000), [
+                acc('addset', 'total', op('sub', op('mod', op('mul', getvar('i'), getvar('i')), 7), 3)),
+                acc('subset', 'squares', op('div', op('mul', getvar('i'), getvar('i')), 3)),
+            ]),
+            prints(getvar('total')),
+            prints(getvar('squares')),
+            prints(getvar('i')),
+        ]
+
+        self.assertEqual('-1050\n-110958570\n999\n', self.run_all(ast))
+
+    def test_negative_step_and_invariants(self):
+        # k = -3
+        # total = 0
+        # for i of [100...0, -7]
+        #     total += i % k + i / k
+        # print(total, i)
+
+        ast = [
+            {'type': 'setvar', 'name': 'k', 'value': -3},
+            {'type': 'setvar', 'name': 'total', 'value': 0},
+            loop('i', span(100, 0, -7), [acc('addset', 'total', op('add', op('mod', getvar('i'), getvar('k')), op('div', getvar('i'), getvar('k'))))]),
+            prints(getvar('total')),
+            prints(getvar('i')),
+        ]
+
+        self.assertEqual('-265\n2\n', self.run_all(ast))
+
+    def test_exact_past_int64(self):
+        # total = 0
+        # product = 1
+        # for i of [1...100000]
+        #     total += i * i * i * i
+        #     product *= i % 10 + 1
+        # print(total)
+
+        ast = [
+            {'type': 'setvar', 'name': 'total', 'value': 0},
+            {'type': 'setvar', 'name': 'product', 'value': 1},
+            loop('i', span(1, 100000), [
+                acc('addset', 'total', op('mul', op('mul', getvar('i'), getvar('i')), op('mul', getvar('i'), getvar('i')))),
+                acc('mulset', 'product', op('add', op('mod', getvar('i'), 10), 1)),
+            ]),
+            prints(getvar('total')),
+        ]
+
+        self.assertEqual(f'{sum(i ** 4 for i in range(1, 100000))}\n', self.run_all(ast))
+
+    def test_overflow_falls_back(self):
+        # big = 2 ^ 62
+        # total = 0
+        # for i of [0...10]
+        #     total += i * big
+        # print(total)
+
+        ast = [
+            {'type': 'setvar', 'name': 'big', 'value': 2 ** 62},
+            {'type': 'setvar', 'name': 'total', 'value': 0},
+            loop('i', span(0, 10), [acc('addset', 'total', op('mul', getvar('i'), getvar('big')))]),
+            prints(getvar('total')),
+        ]
+
+        self.assertEqual(f'{45 * 2 ** 62}\n', self.run_all(ast))
+
+    def test_non_int_values_fall_back(self):
+        # total = 0.5
+        # k = 1.5
+        # for i of [0...4]
+        #     total += i * 2
+        #     k *= 2
+        # print(total, k)
+
+        ast = [
+            {'type': 'setvar', 'name': 'total', 'value': 0.5},
+            {'type': 'setvar', 'name': 'k', 'value': 1.5},
+            loop('i', span(0, 4), [acc('addset', 'total', op('mul', getvar('i'), 2)), acc('mulset', 'k', 2)]),
+            prints(getvar('total')),
+            prints(getvar('k')),
+        ]
+
+        self.assertEqual('12.5\n24.0\n', self.run_all(ast))
+
+    def test_empty_range(self):
+        # i = 7
+        # total = 1
+        # for i of [5...5]
+        #     total += i
+        # print(total, i)
+
+        ast = [
+            {'type': 'setvar', 'name': 'i', 'value': 7},
+            {'type': 'setvar', 'name': 'total', 'value': 1},
+            loop('i', span(5, 5), [acc('addset', 'total', getvar('i'))]),
+            prints(getvar('total')),
+            prints(getvar('i')),
+        ]
+
+        self.assertEqual('1\n7\n', self.run_all(ast))
+
+    def test_errors_come_from_the_interpreter(self):
+        # total = 0
+        # for i of [-2...3]
+        #     total += 10 / i
+
+        ast = [
+            {'type': 'setvar', 'name': 'total', 'value': 0},
+            loop('i', span(-2, 3), [acc('addset', 'total', op('div', 10, getvar('i')))]),
+        ]
+
+        for engine in interpreter.Interpreter.engines:
+            with self.assertRaises(ZeroDivisionError):
+                interpreter.Interpreter(ast, engine=engine, output=interpreter.Output(io.StringIO()), vectorize=True).run()
+
+    def test_inside_func(self):
+        # fun f(n)
+        #     total = 0
+        #     for i of [0...n]
+        #         total += i
+        #     return total
+        # print(f(100))
+
+        ast = [
+            {
+                'type': 'setvar',
+                'name': 'f',
+                'value': {
+                    'type': 'func',
+                    'args': ['n'],
+                    'code': [
+                        {'type': 'setvar', 'name': 'total', 'value': 0},
+                        loop('i', span(0, getvar('n')), [acc('addset', 'total', getvar('i'))]),
+                        {'type': 'return', 'value': getvar('total')},
+                    ],
+                },
+            },
+            {'type': 'print', 'value': {'type': 'call', 'target': getvar('f'), 'args': [100]}},
+        ]
+
+        self.assertEqual('4950\n', self.run_all(ast))
+
+if __name__ == '__main__':
+    unittest.main()